@@ -13,9 +13,93 @@ class Settings:
     MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "mini_rag_db")
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
     
+    # Both measured in tokens; overlap is made of whole sentences up to this many tokens
     CHUNK_SIZE = 1000
-    CHUNK_OVERLAP = 150
+    CHUNK_OVERLAP = 100
     TOP_K = 10
     RERANK_TOP_K = 5
+    # Rank offset for reciprocal rank fusion; 60 is the value from the original RRF paper
+    RRF_K = 60
+    # Whether queries that don't set 'hybrid' fuse lexical and vector results; off keeps vector-only retrieval
+    HYBRID_SEARCH_DEFAULT = os.getenv("HYBRID_SEARCH_DEFAULT", "false").lower() == "true"
+    # Prompt budget for retrieved passages; the lowest-ranked text is cut first
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "4000"))
+    CONTEXT_MIN_PASSAGE_TOKENS = 100
+    BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "100"))
+    # Concurrent LLM generations per batch request; retrieval for the batch is not limited
+    BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    # Shortened vectors from a text-embedding-3 model, e.g. 256 or 512; 0 keeps the model's full size.
+    # Once an index migration has run, the active-index record in MongoDB takes precedence over both
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+    # Provider limits are 8191 tokens per input and 2048 inputs per request
+    EMBEDDING_MAX_INPUT_TOKENS = 8191
+    EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+    EMBEDDING_BATCH_MAX_INPUTS = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "512"))
+    EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+    PINECONE_UPSERT_BATCH_SIZE = int(os.getenv("PINECONE_UPSERT_BATCH_SIZE", "100"))
+    PINECONE_UPSERT_CONCURRENCY = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", "4"))
+    INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+    INGESTION_MAX_PENDING = int(os.getenv("INGESTION_MAX_PENDING", "100"))
+    INGESTION_POLL_SECONDS = 2.0
+    # A running job whose lease isn't renewed for this long is assumed dead and requeued
+    INGESTION_LEASE_SECONDS = 300
+    INGESTION_MAX_ATTEMPTS = 3
+    # While a document's chunks are replaced it is locked in MongoDB, so workers in different processes
+    # take turns; a lock not renewed for this long (its holder died) can be taken over
+    DOCUMENT_LOCK_SECONDS = 120
+    DOCUMENT_LOCK_POLL_SECONDS = 0.5
+    # A failed startup warm-up is retried after this long, doubling up to the max
+    WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "1"))
+    WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "60"))
+    EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", "2"))
+    PDF_PAGES_PER_TASK = 25
+
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3")
+    EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000"))
+
+    # Chunk text lives here rather than in Pinecone metadata
+    CHUNK_STORE_PATH = os.getenv("CHUNK_STORE_PATH", "cache/chunks.sqlite3")
+    CHUNK_STORE_MMAP_BYTES = int(os.getenv("CHUNK_STORE_MMAP_BYTES", str(256 * 1024 * 1024)))
+
+    # "pinecone", or "local" for the in-process index under LOCAL_INDEX_PATH (no network hop, no API key)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+    LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "cache/vector_index")
+    # Exact search up to this many vectors; above it, an IVF index scanning the nearest LOCAL_INDEX_NPROBE lists
+    LOCAL_INDEX_EXACT_MAX = int(os.getenv("LOCAL_INDEX_EXACT_MAX", "20000"))
+    LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "16"))
+    # Scan float16/int8/binary codes instead of float32, then rescore the best top_k * LOCAL_INDEX_RESCORE exactly
+    LOCAL_INDEX_QUANTIZATION = os.getenv("LOCAL_INDEX_QUANTIZATION", "none")
+    LOCAL_INDEX_RESCORE = int(os.getenv("LOCAL_INDEX_RESCORE", "0")) or None  # None: the codec's default
+    # How often API processes check which vector index is active (an index migration switches it)
+    INDEX_SWITCH_POLL_SECONDS = float(os.getenv("INDEX_SWITCH_POLL_SECONDS", "30"))
+
+    # How often API processes check whether another one changed the documents, making their cached answers stale
+    CORPUS_GENERATION_POLL_SECONDS = float(os.getenv("CORPUS_GENERATION_POLL_SECONDS", "5"))
+    ANSWER_CACHE_MAX_ITEMS = int(os.getenv("ANSWER_CACHE_MAX_ITEMS", "1000"))
+    ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.97"))
+
+    QUERY_LOG_BATCH_SIZE = int(os.getenv("QUERY_LOG_BATCH_SIZE", "100"))
+    QUERY_LOG_FLUSH_SECONDS = float(os.getenv("QUERY_LOG_FLUSH_SECONDS", "2.0"))
+    QUERY_LOG_MAX_PENDING = int(os.getenv("QUERY_LOG_MAX_PENDING", "10000"))
+    # Where logs go when the queue is full or MongoDB is unavailable; empty to drop them instead
+    QUERY_LOG_SPILL_PATH = os.getenv("QUERY_LOG_SPILL_PATH", "cache/query_log_spill.jsonl")
+
+    # Per-stage timings in responses and the stage histograms on /api/metrics
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+
+    RERANK_CACHE_MAX_ITEMS = int(os.getenv("RERANK_CACHE_MAX_ITEMS", "50000"))
+    RERANK_CACHE_TTL_SECONDS = float(os.getenv("RERANK_CACHE_TTL_SECONDS", "86400"))
+    RERANK_ADAPTIVE = os.getenv("RERANK_ADAPTIVE", "true").lower() == "true"
+    # Skip reranking when the top first-stage score leads the runner-up by this fraction of itself
+    RERANK_SKIP_MARGIN = float(os.getenv("RERANK_SKIP_MARGIN", "0.25"))
+    # Only send candidates scoring at least this fraction of the top score (never fewer than RERANK_TOP_K)
+    RERANK_SHRINK_RATIO = float(os.getenv("RERANK_SHRINK_RATIO", "0.6"))
+
+    # gzip for /api/query and /api/query/batch responses of at least this many bytes, when the client accepts it
+    GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))
+    GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
 
 settings = Settings()
\ No newline at end of file
@@ -1,7 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import upload, query, health
+from app.routers import upload, query, health, metrics
 from app.config import settings
+from app.services.container import container
+from app.utils.responses import GZipPathsMiddleware
+import asyncio
 import logging
 
 
@@ -10,7 +13,9 @@ logger = logging.getLogger(__name__)
 
 
 def check_env():
-    required = ['OPENAI_API_KEY', 'PINECONE_API_KEY', 'COHERE_API_KEY', 'MONGODB_URI']
+    required = ['OPENAI_API_KEY', 'COHERE_API_KEY', 'MONGODB_URI']
+    if settings.VECTOR_BACKEND == 'pinecone':
+        required.append('PINECONE_API_KEY')
     missing = [var for var in required if not getattr(settings, var)]
     if missing:
         logger.error(f"Missing env vars: {missing}")
@@ -37,22 +42,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Not /api/query/stream: tokens must reach the client as they are generated
+app.add_middleware(
+    GZipPathsMiddleware,
+    paths=["/api/query", "/api/query/batch"],
+    minimum_size=settings.GZIP_MINIMUM_SIZE,
+    compresslevel=settings.GZIP_LEVEL
+)
+
 
 app.include_router(upload.router, prefix="/api", tags=["upload"])
 app.include_router(query.router, prefix="/api", tags=["query"])
 app.include_router(health.router, prefix="/api", tags=["health"])
+app.include_router(metrics.router, prefix="/api", tags=["metrics"])
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting Mini RAG API...")
-    try:
+    # Warm up in the background so the server accepts connections (and reports
+    # not-ready on /api/health/ready) while clients and indexes are set up
+    app.state.warmup_task = asyncio.create_task(warm_up())
+
+async def warm_up():
+    # A MongoDB or Pinecone blip at boot must not leave the process not-ready (and the queue without workers) for good
+    delay = settings.WARMUP_RETRY_SECONDS
+    while True:
+        await asyncio.to_thread(container.warm_up)
+        if container.ready:
+            break
+        logger.info(f"Retrying warm-up in {delay:.1f}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.WARMUP_RETRY_MAX_SECONDS)
+    container.ingestion_queue.start()
+    app.state.index_watch_task = asyncio.create_task(watch_active_index())
+    app.state.corpus_watch_task = asyncio.create_task(watch_corpus_generation())
+
+async def watch_active_index():
+    # An index migration switches the active vector index in MongoDB; follow it without a restart
+    while True:
+        await asyncio.sleep(settings.INDEX_SWITCH_POLL_SECONDS)
+        try:
+            await asyncio.to_thread(container.switch_vector_store)
+        except Exception as e:
+            logger.error(f"Could not check the active vector index: {e}")
 
-        from openai import OpenAI
-        client = OpenAI(api_key=settings.OPENAI_API_KEY, timeout=10.0)
+async def watch_corpus_generation():
+    # Documents ingested by another process change answers this one has cached
+    while True:
+        await asyncio.sleep(settings.CORPUS_GENERATION_POLL_SECONDS)
+        try:
+            if await asyncio.to_thread(container.sync_corpus_generation):
+                logger.info("Documents changed in another process, dropped cached answers")
+        except Exception as e:
+            logger.error(f"Could not check the corpus generation: {e}")
 
-        logger.info("OpenAI API connection validated")
-    except Exception as e:
-        logger.warning(f"OpenAI API validation failed: {e}")
+@app.on_event("shutdown")
+async def shutdown_event():
+    for name in ('warmup_task', 'index_watch_task', 'corpus_watch_task'):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    container.close()
 
 @app.get("/")
 async def root():
@@ -1,30 +1,149 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, List, Dict, Literal, Optional
 from datetime import datetime
+from app.config import settings
+from app.utils.security import is_valid_collection, epoch_seconds
+import json
 
 class UploadRequest(BaseModel):
     text: Optional[str] = None
     filename: Optional[str] = None
 
-class QueryRequest(BaseModel):
+class SearchOptions(BaseModel):
+    hybrid: bool = settings.HYBRID_SEARCH_DEFAULT
+    vector_weight: float = Field(1.0, ge=0)
+    lexical_weight: float = Field(1.0, ge=0)
+    candidates: Optional[int] = Field(None, ge=1, le=100)
+    # Search only this collection (None: documents uploaded without one)
+    collection: Optional[str] = None
+    filenames: Optional[List[str]] = Field(None, min_length=1)
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    # Pages a chunk must overlap; chunks without page numbers never match
+    page_from: Optional[int] = Field(None, ge=1)
+    page_to: Optional[int] = Field(None, ge=1)
+
+    @model_validator(mode='after')
+    def check_weights(self):
+        if self.hybrid and self.vector_weight == 0 and self.lexical_weight == 0:
+            raise ValueError("vector_weight and lexical_weight cannot both be 0")
+        return self
+
+    @model_validator(mode='after')
+    def check_filters(self):
+        if self.collection is not None and not is_valid_collection(self.collection):
+            raise ValueError("collection must be 1-64 letters, digits, '_', '.' or '-'")
+        if self.uploaded_after and self.uploaded_before and epoch_seconds(self.uploaded_after) > epoch_seconds(self.uploaded_before):
+            raise ValueError("uploaded_after is later than uploaded_before")
+        if self.page_from and self.page_to and self.page_from > self.page_to:
+            raise ValueError("page_from is greater than page_to")
+        return self
+
+    def metadata_filter(self, include_collection: bool = False) -> Optional[Dict[str, Any]]:
+        """The filters as a Pinecone metadata filter, or None if there are none.
+
+        In the vector index the collection is the namespace, so it is only
+        part of the filter where requested (the lexical index has no namespaces).
+        """
+        clauses = []
+        if include_collection:
+            clauses.append({'collection': self.collection} if self.collection else {'collection': {'$exists': False}})
+        if self.filenames:
+            clauses.append({'filename': {'$in': self.filenames}})
+        if self.uploaded_after:
+            clauses.append({'uploaded_at': {'$gte': epoch_seconds(self.uploaded_after)}})
+        if self.uploaded_before:
+            clauses.append({'uploaded_at': {'$lte': epoch_seconds(self.uploaded_before)}})
+        if self.page_from:
+            clauses.append({'page_end': {'$gte': self.page_from}})
+        if self.page_to:
+            clauses.append({'page_start': {'$lte': self.page_to}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+    def cache_key(self) -> str:
+        return json.dumps(self.model_dump(include=set(SearchOptions.model_fields)), sort_keys=True, default=str)
+
+class CitationOptions(BaseModel):
+    # 'ids' drops the chunk text, 'preview' cuts it to preview_chars; answers are cached in full either way
+    citation_mode: Literal['ids', 'preview', 'full'] = 'full'
+    preview_chars: int = Field(300, ge=1, le=10000)
+    # Metadata keys to return; None for all of them, [] for none
+    metadata_fields: Optional[List[str]] = Field(None, max_length=50)
+
+class QueryRequest(SearchOptions, CitationOptions):
     query: str
 
+class BatchQueryRequest(SearchOptions, CitationOptions):
+    queries: List[str] = Field(..., min_length=1)
+
 class Citation(BaseModel):
     id: str
-    text: str
-    metadata: dict
+    # Absent in 'ids' mode
+    text: Optional[str] = None
+    # Set when 'preview' mode cut the text
+    truncated: Optional[bool] = None
+    # Absent when metadata_fields is []
+    metadata: Optional[dict] = None
 
 class QueryResponse(BaseModel):
     answer: str
     citations: List[Citation]
     token_usage: dict
     latency: float
+    cached: bool = False
+    # Answered by an identical request that was already in flight
+    coalesced: bool = False
+    rerank: Optional[dict] = None
+    timings: Dict[str, float] = {}
+
+class BatchQueryResult(BaseModel):
+    query: str
+    answer: Optional[str] = None
+    citations: List[Citation] = []
+    token_usage: dict = {}
+    latency: float = 0.0
+    cached: bool = False
+    rerank: Optional[dict] = None
+    timings: Dict[str, float] = {}
+    error: Optional[str] = None
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult]
+    latency: float
 
 class HealthResponse(BaseModel):
     status: str
     timestamp: datetime
+    ready: bool = False
+    services: Optional[dict] = None
 
 class UploadResponse(BaseModel):
     message: str
-    document_id: str
-    filename: str
\ No newline at end of file
+    document_id: Optional[str] = None
+    filename: str
+    document_key: Optional[str] = None
+    collection: Optional[str] = None
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+
+class JobProgress(BaseModel):
+    chunks_embedded: int = 0
+    chunks_total: Optional[int] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    filename: str
+    document_key: Optional[str] = None
+    collection: Optional[str] = None
+    progress: JobProgress
+    document_id: Optional[str] = None
+    # Chunks added, updated (moved only), unchanged and removed compared with the previous revision
+    changes: Optional[Dict[str, int]] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    timings: Dict[str, float] = {}
+    created_at: datetime
+    updated_at: datetime
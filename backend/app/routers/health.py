@@ -1,5 +1,9 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from app.models.schemas import HealthResponse
+from app.services.answer_cache import answer_cache
+from app.services.rerank_cache import rerank_cache
+from app.services.container import container
 from app.utils.security import utc_now
 
 router = APIRouter()
@@ -8,5 +12,21 @@ router = APIRouter()
 async def health_check():
     return HealthResponse(
         status="healthy",
-        timestamp=utc_now()
-    )
\ No newline at end of file
+        timestamp=utc_now(),
+        ready=container.ready,
+        services=container.status()
+    )
+
+@router.get("/health/ready")
+async def readiness():
+    # For load balancer / autoscaler readiness probes: 503 until warm-up has finished
+    status = container.status()
+    return JSONResponse(status, status_code=200 if container.ready else 503)
+
+@router.get("/health/cache")
+async def cache_stats():
+    return {
+        'embeddings': container.embedding_cache.stats(),
+        'answers': answer_cache.stats(),
+        'rerank': rerank_cache.stats()
+    }
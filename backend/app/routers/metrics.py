@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services.answer_cache import answer_cache
+from app.services.container import container
+from app.services.rerank_cache import rerank_cache
+from app.utils.metrics import render_metrics, render_counter
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    lines = render_metrics()
+    
+    # The caches keep their own counters; expose them alongside the rest
+    answers = answer_cache.stats()
+    embeddings = container.embedding_cache.stats()
+    rerank = rerank_cache.stats()
+    lines.extend(render_counter(
+        'minirag_cache_lookups_total',
+        'Cache lookups by cache and outcome',
+        ('cache', 'result'),
+        [
+            (('answer', 'exact_hit'), answers['exact_hits']),
+            (('answer', 'semantic_hit'), answers['semantic_hits']),
+            (('answer', 'miss'), answers['misses']),
+            (('embedding', 'memory_hit'), embeddings['memory_hits']),
+            (('embedding', 'disk_hit'), embeddings['disk_hits']),
+            (('embedding', 'miss'), embeddings['misses']),
+            (('rerank', 'hit'), rerank['hits']),
+            (('rerank', 'miss'), rerank['misses'])
+        ]
+    ))
+    
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
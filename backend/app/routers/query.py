@@ -1,41 +1,141 @@
-from fastapi import APIRouter, HTTPException
-from app.models.schemas import QueryRequest, QueryResponse, Citation
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from app.models.schemas import QueryRequest, QueryResponse, CitationOptions, BatchQueryRequest, BatchQueryResponse, BatchQueryResult
 from app.services.rag_pipeline import RAGPipeline
+from app.services.container import get_pipeline
+from app.utils.responses import FastJSONResponse, dumps
 from app.utils.security import clean_for_log
+from app.config import settings
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-rag_pipeline = RAGPipeline()
+
+def validate_query(request: QueryRequest) -> str:
+    return clean_query(request.query)
+
+def clean_query(query: str) -> str:
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    
+    query = query.strip()
+    if len(query) > 1000:
+        raise HTTPException(status_code=400, detail="Query too long")
+    return query
+
+def to_citations(citations: list, options: CitationOptions) -> list:
+    shaped = []
+    for cite in citations:
+        citation = {'id': cite['id']}
+        if options.citation_mode == 'full':
+            citation['text'] = cite['text']
+        elif options.citation_mode == 'preview':
+            citation['text'], truncated = preview(cite['text'], options.preview_chars)
+            if truncated:
+                citation['truncated'] = True
+        if options.metadata_fields is None:
+            citation['metadata'] = cite['metadata']
+        elif options.metadata_fields:
+            citation['metadata'] = {key: cite['metadata'][key] for key in options.metadata_fields if key in cite['metadata']}
+        shaped.append(citation)
+    return shaped
+
+def preview(text: str, max_chars: int):
+    if len(text) <= max_chars:
+        return text, False
+    # End on a word boundary unless that loses more than half the preview
+    cut = text.rfind(' ', 0, max_chars + 1)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip(), True
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
 
 @router.post("/query", response_model=QueryResponse)
-async def query_documents(request: QueryRequest):
+async def query_documents(request: QueryRequest, rag_pipeline: RAGPipeline = Depends(get_pipeline)):
     try:
-        if not request.query.strip():
-            raise HTTPException(status_code=400, detail="Query cannot be empty")
+        query = validate_query(request)
         
-        query = request.query.strip()
-        if len(query) > 1000:
-            raise HTTPException(status_code=400, detail="Query too long")
+        result = await rag_pipeline.aquery(query, request)
         
-        answer, citations_data, token_usage, latency = rag_pipeline.query(query)
+        # Built as a dict and encoded with orjson; QueryResponse documents the shape
+        return FastJSONResponse({
+            'answer': result['answer'],
+            'citations': to_citations(result['citations'], request),
+            'token_usage': result['token_usage'],
+            'latency': result['latency'],
+            'cached': result['cached'],
+            'coalesced': result['coalesced'],
+            'rerank': result['rerank'],
+            'timings': result['timings']
+        })
         
-        citations = [
-            Citation(
-                id=cite['id'],
-                text=cite['text'],
-                metadata=cite['metadata']
-            )
-            for cite in citations_data
-        ]
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Query error: {clean_for_log(str(e))}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def batch_query_documents(request: BatchQueryRequest, rag_pipeline: RAGPipeline = Depends(get_pipeline)):
+    if len(request.queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_MAX_QUERIES} queries per batch")
+    
+    try:
+        start_time = time.perf_counter()
+        
+        # Invalid queries are reported in their own slot rather than failing the batch
+        results = [None] * len(request.queries)
+        valid = []
+        for i, raw_query in enumerate(request.queries):
+            try:
+                valid.append((i, clean_query(raw_query)))
+            except HTTPException as e:
+                results[i] = BatchQueryResult(query=raw_query, error=e.detail).model_dump()
         
-        return QueryResponse(
-            answer=answer,
-            citations=citations,
-            token_usage=token_usage,
-            latency=latency
-        )
+        answers = await rag_pipeline.abatch_query([query for _, query in valid], request) if valid else []
+        for (i, query), result in zip(valid, answers):
+            if 'error' in result:
+                results[i] = BatchQueryResult(query=query, error=result['error']).model_dump()
+            else:
+                results[i] = {
+                    'query': query,
+                    'answer': result['answer'],
+                    'citations': to_citations(result['citations'], request),
+                    'token_usage': result['token_usage'],
+                    'latency': result['latency'],
+                    'cached': result['cached'],
+                    'rerank': result['rerank'],
+                    'timings': result['timings'],
+                    'error': None
+                }
+        
+        return FastJSONResponse({'results': results, 'latency': time.perf_counter() - start_time})
         
     except Exception as e:
-        logger.error(f"Query error: {clean_for_log(str(e))}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        logger.error(f"Batch query error: {clean_for_log(str(e))}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/query/stream")
+async def stream_query(request: QueryRequest, rag_pipeline: RAGPipeline = Depends(get_pipeline)):
+    query = validate_query(request)
+    
+    async def event_stream():
+        try:
+            async for event, data in rag_pipeline.astream_query(query, request):
+                if event == 'citations':
+                    data = {'citations': to_citations(data['citations'], request)}
+                yield format_sse(event, data)
+        except Exception as e:
+            logger.error(f"Stream query error: {clean_for_log(str(e))}")
+            yield format_sse("error", {'detail': str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            'Cache-Control': 'no-cache',
+            # Stop nginx-style proxies from buffering the stream
+            'X-Accel-Buffering': 'no'
+        }
+    )
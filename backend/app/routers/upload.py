@@ -1,44 +1,73 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from app.models.schemas import UploadRequest, UploadResponse
-from app.services.rag_pipeline import RAGPipeline
-from app.utils.text_processing import extract_text_from_file
-from app.utils.security import is_valid_file, clean_for_log
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from app.models.schemas import UploadRequest, UploadResponse, JobResponse
+from app.services.ingestion import IngestionQueue, QueueFullError
+from app.services.container import container, get_ingestion_queue
+from app.utils.security import is_valid_file, is_valid_collection, clean_for_log
+import asyncio
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-rag_pipeline = RAGPipeline()
 
-@router.post("/upload", response_model=UploadResponse)
+async def get_ready_ingestion_queue() -> IngestionQueue:
+    # Until warm-up succeeds no worker is running, so an accepted job would sit in the queue
+    if not container.ready:
+        raise HTTPException(status_code=503, detail="Service is starting up, try again shortly", headers={'Retry-After': '10'})
+    return container.ingestion_queue
+
+@router.post("/upload", response_model=UploadResponse, status_code=202)
 async def upload_document(
     file: UploadFile = File(None),
-    text: str = Form(None)
+    text: str = Form(None),
+    document_key: str = Form(None),
+    collection: str = Form(None),
+    ingestion_queue: IngestionQueue = Depends(get_ready_ingestion_queue)
 ):
     try:
         if not file and not text:
             raise HTTPException(status_code=400, detail="Either file or text must be provided")
+        if collection is not None and not is_valid_collection(collection):
+            raise HTTPException(status_code=400, detail="Collection must be 1-64 letters, digits, '_', '.' or '-'")
         
         if file:
             if not is_valid_file(file.filename):
                 raise HTTPException(status_code=400, detail="File type not allowed. Only TXT, MD, PDF, DOCX files are supported.")
             content = await file.read()
-            document_text = extract_text_from_file(content, file.filename)
+            if not content:
+                raise HTTPException(status_code=400, detail="Document text is empty")
             filename = file.filename
+            # Uploading the same file (or key) again replaces that document, re-embedding only what changed.
+            # Submitting writes the upload to GridFS, so it runs off the event loop
+            job = await asyncio.to_thread(ingestion_queue.submit, filename, content=content, document_key=document_key, collection=collection)
         else:
-            document_text = text
+            if not text.strip():
+                raise HTTPException(status_code=400, detail="Document text is empty")
             filename = "text_input.txt"
-        
-        if not document_text.strip():
-            raise HTTPException(status_code=400, detail="Document text is empty")
-        
-        doc_id = rag_pipeline.process_document(document_text, filename)
+            # Pasted texts share a filename; without a key, each distinct text is its own document
+            document_key = document_key or f"text_input-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+            job = await asyncio.to_thread(ingestion_queue.submit, filename, text=text, document_key=document_key, collection=collection)
         
         return UploadResponse(
-            message="Document uploaded and processed successfully",
-            document_id=doc_id,
-            filename=filename
+            message="Document accepted for processing",
+            filename=filename,
+            document_key=job['document_key'],
+            collection=job['collection'],
+            job_id=job['_id'],
+            status=job['status']
         )
         
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '30'})
     except Exception as e:
         logger.error(f"Upload error: {clean_for_log(str(e))}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, ingestion_queue: IngestionQueue = Depends(get_ingestion_queue)):
+    job = await asyncio.to_thread(ingestion_queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(job_id=job['_id'], **job)
@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any
+from app.config import settings
+import numpy as np
+import re
+import threading
+import time
+
+class AnswerCache:
+    """Bounded TTL cache of query results.
+
+    Lookups match on the normalized query text first, then fall back to the
+    closest stored query embedding if its cosine similarity clears the
+    threshold. Entries are partitioned by a variant string (the retrieval
+    options) so answers produced under different settings never mix.
+    """
+
+    def __init__(self, max_items: int = 1000, ttl_seconds: float = 3600, similarity_threshold: float = 0.97):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Stacked unit embeddings of live entries, rebuilt lazily after writes
+        self._matrix = None
+        self._matrix_keys = []
+        self._matrix_variants = None
+        # The corpus generation the entries were answered from (see set_generation)
+        self.generation = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        query = re.sub(r'\s+', ' ', query.lower()).strip()
+        return query.rstrip('?!. ')
+
+    def get(self, query: str, variant: str = '') -> Optional[Dict[str, Any]]:
+        key = (variant, self.normalize(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['expires_at'] > time.time():
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry['result']
+            if entry:
+                self._drop(key)
+            return None
+
+    def get_similar(self, embedding: List[float], variant: str = '') -> Optional[Dict[str, Any]]:
+        vector = self._unit(embedding)
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self._evict_expired()
+            if self._matrix is None:
+                self._rebuild_matrix()
+            if not self._matrix_keys or self._matrix.shape[1] != len(vector):
+                self.misses += 1
+                return None
+            similarities = np.where(self._matrix_variants == variant, self._matrix @ vector, -np.inf)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            key = self._matrix_keys[best]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return self._entries[key]['result']
+
+    def put(self, query: str, embedding: Optional[List[float]], result: Dict[str, Any], variant: str = ''):
+        key = (variant, self.normalize(query))
+        with self._lock:
+            self._entries[key] = {
+                'embedding': self._unit(embedding) if embedding is not None else None,
+                'result': result,
+                'expires_at': time.time() + self.ttl_seconds
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def set_generation(self, generation: int) -> bool:
+        """Move to a new corpus generation, dropping every entry; returns False if it is the current one.
+
+        The generation is a counter in MongoDB bumped by every ingest that
+        changes the corpus, so each API process can tell its answers are stale.
+        """
+        with self._lock:
+            if generation == self.generation:
+                return False
+            self.generation = generation
+            self._entries.clear()
+            self._matrix = None
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'items': len(self._entries)
+            }
+
+    def _drop(self, key: str):
+        del self._entries[key]
+        self._matrix = None
+
+    def _evict_expired(self):
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if entry['expires_at'] <= now]
+        for key in expired:
+            self._drop(key)
+
+    def _rebuild_matrix(self):
+        # Requests in flight during an index switch may add embeddings of the old size; keep the newest size only
+        sizes = [len(entry['embedding']) for entry in self._entries.values() if entry['embedding'] is not None]
+        keys = [key for key, entry in self._entries.items() if entry['embedding'] is not None and len(entry['embedding']) == sizes[-1]]
+        self._matrix_keys = keys
+        self._matrix_variants = np.array([variant for variant, _ in keys], dtype=object)
+        self._matrix = np.stack([self._entries[key]['embedding'] for key in keys]) if keys else np.empty((0, 0))
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        # Zero vectors are the quota fallback and match nothing
+        if norm == 0:
+            return None
+        return vector / norm
+
+
+answer_cache = AnswerCache(
+    settings.ANSWER_CACHE_MAX_ITEMS,
+    settings.ANSWER_CACHE_TTL_SECONDS,
+    settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+)
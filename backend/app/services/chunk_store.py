@@ -0,0 +1,85 @@
+from typing import List, Dict, Any, Callable, Optional
+from app.utils.metrics import FALLBACKS
+from app.utils.sqlite import fetch_in, execute_in
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+class ChunkStore:
+    """Chunk text by chunk id, in a local SQLite file read through a memory map.
+
+    Vectors only carry small metadata, so search results come back without
+    text; fill_texts() looks it up in one batch for just the documents that
+    are used. Ids missing locally (e.g. ingested by another API instance)
+    are read from loader, if set, and kept for next time.
+    """
+
+    def __init__(self, path: str, loader: Optional[Callable[[List[str]], Dict[str, str]]] = None, mmap_bytes: int = 0):
+        self.loader = loader
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loaded = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if mmap_bytes:
+            self._conn.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, text TEXT NOT NULL)")
+        self._conn.commit()
+
+    def put_many(self, chunk_ids: List[str], texts: List[str]):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO chunks (id, text) VALUES (?, ?)", list(zip(chunk_ids, texts)))
+            self._conn.commit()
+
+    def get_many(self, chunk_ids: List[str]) -> Dict[str, str]:
+        ids = list(dict.fromkeys(chunk_ids))
+        found = {}
+        with self._lock:
+            found.update(fetch_in(self._conn, "SELECT id, text FROM chunks WHERE id IN ({placeholders})", ids))
+            self.hits += len(found)
+
+        missing = [chunk_id for chunk_id in ids if chunk_id not in found]
+        if missing and self.loader:
+            try:
+                loaded = self.loader(missing)
+            except Exception as e:
+                logger.warning(f"Could not load {len(missing)} chunk texts: {e}")
+                loaded = {}
+            if loaded:
+                FALLBACKS.inc(len(loaded), kind='chunk_text_loaded')
+                self.put_many(list(loaded), list(loaded.values()))
+                found.update(loaded)
+            with self._lock:
+                self.loaded += len(loaded)
+        with self._lock:
+            self.misses += len(ids) - len(found)
+        return found
+
+    def delete_many(self, chunk_ids: List[str]):
+        with self._lock:
+            execute_in(self._conn, "DELETE FROM chunks WHERE id IN ({placeholders})", chunk_ids)
+            self._conn.commit()
+
+    def fill_texts(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Set 'text' on the docs that lack it, in place; returns the docs whose text was found."""
+        missing = [doc['id'] for doc in docs if doc.get('text') is None]
+        if missing:
+            texts = self.get_many(missing)
+            for doc in docs:
+                if doc.get('text') is None and doc['id'] in texts:
+                    doc['text'] = texts[doc['id']]
+            lost = [doc['id'] for doc in docs if doc.get('text') is None]
+            if lost:
+                logger.warning(f"No text stored for {len(lost)} chunks, leaving them out: {lost[:5]}")
+        return [doc for doc in docs if doc.get('text') is not None]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'hits': self.hits, 'loaded': self.loaded, 'misses': self.misses}
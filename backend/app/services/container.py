@@ -0,0 +1,196 @@
+from openai import OpenAI, AsyncOpenAI
+from typing import Dict, Any, Callable, Optional
+from app.config import settings
+from app.services.vector_store import VectorStore
+from app.services.answer_cache import answer_cache
+from app.services.chunk_store import ChunkStore
+from app.services.embedding_cache import EmbeddingCache
+from app.services.reranker import Reranker
+from app.services.llm import LLMService
+from app.services.database import DatabaseService
+from app.services.rag_pipeline import RAGPipeline
+from app.services.ingestion import IngestionQueue
+from app.services.index_migration import IndexMigration
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class ServiceContainer:
+    """Process-wide services, each built once on first use.
+
+    Every router shares the same Pinecone, OpenAI, Cohere and MongoDB clients
+    (and their connection pools). Construction is guarded by a lock so
+    concurrent first requests don't build a service twice; a service whose
+    construction fails is retried on the next access.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._services = {}
+        self.init_timings = {}
+        self.ready = False
+        self.warmup_error = None
+        self.warmup_seconds = None
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        service = self._services.get(name)
+        if service is not None:
+            return service
+        with self._lock:
+            service = self._services.get(name)
+            if service is None:
+                start = time.perf_counter()
+                service = factory()
+                self.init_timings[name] = time.perf_counter() - start
+                self._services[name] = service
+            return service
+
+    @property
+    def openai_client(self) -> OpenAI:
+        return self._get('openai_client', lambda: OpenAI(api_key=settings.OPENAI_API_KEY, timeout=60.0, max_retries=3))
+
+    @property
+    def async_openai_client(self) -> AsyncOpenAI:
+        return self._get('async_openai_client', lambda: AsyncOpenAI(api_key=settings.OPENAI_API_KEY, timeout=60.0, max_retries=3))
+
+    @property
+    def chunk_store(self) -> ChunkStore:
+        return self._get('chunk_store', lambda: ChunkStore(
+            settings.CHUNK_STORE_PATH,
+            loader=self.db.get_chunk_texts,
+            mmap_bytes=settings.CHUNK_STORE_MMAP_BYTES
+        ))
+
+    @property
+    def embedding_cache(self) -> EmbeddingCache:
+        # Shared by the vector store and, after an index migration, its replacement
+        return self._get('embedding_cache', lambda: EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MEMORY_ITEMS))
+
+    @property
+    def vector_store(self) -> VectorStore:
+        return self._get('vector_store', lambda: self._new_vector_store(self.db.get_active_index()))
+
+    def _new_vector_store(self, spec: Optional[Dict[str, Any]] = None) -> VectorStore:
+        # After an index migration the active-index record, not the settings, names the index and embedding model
+        if spec:
+            logger.info(f"Using active vector index {spec['index_name']} ({spec['model']}, {spec['dimensions'] or 'full'} dimensions)")
+        return VectorStore(self.openai_client, self.async_openai_client, chunk_store=self.chunk_store,
+                           embedding_cache=self.embedding_cache, **(spec or {}))
+
+    def switch_vector_store(self) -> bool:
+        """Swap in the index the active-index record names, if it changed; returns whether it did.
+
+        Then copies over the documents re-ingested into the old index after
+        the migration's last pass started (by this process or another one
+        that hadn't switched yet).
+        """
+        current = self._services.get('vector_store')
+        if current is None:
+            return False
+        record = self.db.get_active_index_record()
+        spec = self.db.get_active_index()
+        if spec is None or spec == current.spec():
+            return False
+        vector_store = self._new_vector_store(spec)
+        with self._lock:
+            self._services['vector_store'] = vector_store
+            pipeline = self._services.get('pipeline')
+            if pipeline:
+                # Requests already past this point finish against the old index
+                pipeline.vector_store = vector_store
+        # Cached answers came from the old index, and their embeddings are in the old space
+        answer_cache.clear()
+        logger.info(f"Switched vector index from {current.index_name} to {vector_store.index_name}")
+        if record.get('copied_since'):
+            IndexMigration(self.db, current, vector_store, record_progress=False).copy_documents(record['copied_since'])
+        return True
+
+    @property
+    def reranker(self) -> Reranker:
+        return self._get('reranker', lambda: Reranker(chunk_store=self.chunk_store))
+
+    @property
+    def llm(self) -> LLMService:
+        return self._get('llm', lambda: LLMService(self.async_openai_client))
+
+    @property
+    def db(self) -> DatabaseService:
+        return self._get('db', DatabaseService)
+
+    @property
+    def pipeline(self) -> RAGPipeline:
+        return self._get('pipeline', lambda: RAGPipeline(
+            vector_store=self.vector_store,
+            reranker=self.reranker,
+            llm=self.llm,
+            db=self.db
+        ))
+
+    @property
+    def ingestion_queue(self) -> IngestionQueue:
+        return self._get('ingestion_queue', lambda: IngestionQueue(self.pipeline))
+
+    def provide(self, **services: Any):
+        """Use these instances instead of building them, e.g. stand-in backends for benchmarks."""
+        with self._lock:
+            self._services.update(services)
+
+    def warm_up(self):
+        """Build every service and open the database connection, recording how long each step took."""
+        start = time.perf_counter()
+        try:
+            self.ingestion_queue
+            step = time.perf_counter()
+            self.db.client.admin.command('ping')
+            self.init_timings['mongodb_ping'] = time.perf_counter() - step
+            self.sync_corpus_generation()
+            self.ready = True
+            self.warmup_error = None
+            logger.info(f"Services ready in {time.perf_counter() - start:.2f}s: {self._format_timings()}")
+        except Exception as e:
+            self.warmup_error = str(e)
+            logger.error(f"Service warm-up failed: {e}")
+        self.warmup_seconds = time.perf_counter() - start
+
+    def sync_corpus_generation(self) -> bool:
+        """Drop cached answers if another process changed the documents since the last check; returns whether it did."""
+        return answer_cache.set_generation(self.db.get_corpus_generation())
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'ready': self.ready,
+            'warmup_seconds': self.warmup_seconds,
+            'init_timings': dict(self.init_timings),
+            'error': self.warmup_error
+        }
+
+    def close(self):
+        with self._lock:
+            queue = self._services.pop('ingestion_queue', None)
+            if queue:
+                queue.stop()
+            db = self._services.pop('db', None)
+            if db:
+                db.close()
+            self._services.clear()
+            self.ready = False
+
+    def _format_timings(self) -> str:
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.init_timings.items())
+
+
+container = ServiceContainer()
+
+async def get_pipeline() -> RAGPipeline:
+    # Before warm-up finishes the first access may block on network setup; keep it off the event loop
+    if container.ready:
+        return container.pipeline
+    return await asyncio.to_thread(lambda: container.pipeline)
+
+async def get_ingestion_queue() -> IngestionQueue:
+    if container.ready:
+        return container.ingestion_queue
+    return await asyncio.to_thread(lambda: container.ingestion_queue)
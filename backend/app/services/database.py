@@ -1,17 +1,38 @@
-from pymongo import MongoClient
-from typing import Dict, Any, List
+from pymongo import MongoClient, ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Dict, Any, List, Optional
 from app.config import settings
+from app.services.lexical_index import LexicalIndex
+from app.services.query_log import QueryLogWriter
 from app.utils.security import clean_for_log, utc_now
+from app.utils.metrics import span
 import logging
+from datetime import timedelta
 
 logger = logging.getLogger(__name__)
 
+# VectorStore arguments recorded for the active index
+INDEX_SPEC_FIELDS = ('backend', 'index_name', 'model', 'dimensions')
+
 class DatabaseService:
-    def __init__(self):
-        self.client = MongoClient(settings.MONGODB_URI)
+    def __init__(self, client: MongoClient = None):
+        self.client = client or MongoClient(settings.MONGODB_URI)
         self.db = self.client[settings.MONGODB_DB_NAME]
         self.documents = self.db.documents
         self.queries = self.db.queries
+        self.query_log = QueryLogWriter(self.queries)
+        self.lexical_index = LexicalIndex(self.db)
+        # The active vector index (once an index migration has switched it), migration progress and the corpus generation
+        self.index_state = self.db.index_state
+        # One record per document being replaced right now, by any process (see acquire_document_lock)
+        self.document_locks = self.db.document_locks
+        # Records written before documents had keys don't have the field, so only keyed ones must be unique
+        self.documents.create_index(
+            [('document_key', ASCENDING)],
+            unique=True,
+            partialFilterExpression={'document_key': {'$exists': True}}
+        )
+        self._legacy_indexed = False
     
     def __enter__(self):
         return self
@@ -19,73 +40,177 @@ class DatabaseService:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
-    def store_document_metadata(self, filename: str, chunk_ids: List[str], metadata: Dict[str, Any]) -> str:
+    def get_document(self, document_key: str) -> Optional[Dict[str, Any]]:
+        return self.documents.find_one({'document_key': document_key})
+
+    def find_legacy_documents(self, filename: str) -> List[Dict[str, Any]]:
+        # Written before documents had keys: one record per upload, so re-uploads left several
+        return list(self.documents.find({'filename': filename, 'document_key': {'$exists': False}}))
+
+    def acquire_document_lock(self, document_key: str, owner: str, seconds: float) -> bool:
+        """Take the lock on document_key for owner, or extend it if owner holds it; False if another owner does.
+
+        A lock that wasn't extended in time (its holder died) can be taken over.
+        """
+        now = utc_now()
         try:
-            doc = {
+            self.document_locks.update_one(
+                {'_id': document_key, '$or': [{'owner': owner}, {'expires_at': {'$lt': now}}]},
+                {'$set': {'owner': owner, 'expires_at': now + timedelta(seconds=seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # The record exists and didn't match: held by someone else
+            return False
+
+    def release_document_lock(self, document_key: str, owner: str):
+        self.document_locks.delete_one({'_id': document_key, 'owner': owner})
+
+    def store_document_metadata(self, document_key: str, filename: str, chunk_ids: List[str],
+                                chunk_metadata: List[Dict[str, Any]], metadata: Dict[str, Any],
+                                storage_type: str = 'vector') -> str:
+        """Create or replace the record for document_key in place; returns its id.
+
+        Each chunk's position metadata is kept next to its id so the next
+        revision can tell moved chunks from unchanged ones.
+        """
+        try:
+            now = utc_now()
+            fields = {
                 'filename': filename,
                 'chunk_ids': chunk_ids,
+                'chunks': [{'id': chunk_id, **meta} for chunk_id, meta in zip(chunk_ids, chunk_metadata)],
                 'metadata': metadata,
-                'created_at': utc_now()
+                'storage_type': storage_type,
+                'updated_at': now
             }
-            result = self.documents.insert_one(doc)
-            return str(result.inserted_id)
+            if storage_type == 'text_fallback':
+                fields['indexed'] = True
+            doc = self.documents.find_one_and_update(
+                {'document_key': document_key},
+                {'$set': fields, '$setOnInsert': {'created_at': now}, '$inc': {'revision': 1}},
+                projection={'_id': 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return str(doc['_id'])
         except Exception as e:
             logger.error(f"Error storing document metadata: {e}")
             raise
     
-    def store_text_chunks(self, filename: str, chunks: List[str]) -> str:
+    def store_text_chunks(self, document_key: str, filename: str, chunk_ids: List[str], chunks: List[str],
+                          chunk_metadata: List[Dict[str, Any]], metadata: Dict[str, Any]) -> str:
         try:
-            doc = {
-                'filename': filename,
-                'chunks': chunks,
-                'storage_type': 'text_fallback',
-                'created_at': utc_now()
-            }
-            result = self.documents.insert_one(doc)
+            self.index_text_chunks(chunk_ids, chunks, metadata, chunk_metadata)
+            doc_id = self.store_document_metadata(document_key, filename, chunk_ids, chunk_metadata, metadata, 'text_fallback')
             logger.info(f"Stored {len(chunks)} text chunks for {clean_for_log(filename)}")
-            return str(result.inserted_id)
+            return doc_id
         except Exception as e:
             logger.error(f"Error storing text chunks: {e}")
             raise
     
-    def search_text_chunks(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    def index_text_chunks(self, chunk_ids: List[str], chunks: List[str], metadata: Dict[str, Any],
+                          chunk_metadata: List[Dict[str, Any]] = None):
+        self.lexical_index.add_chunks(
+            chunk_ids,
+            chunks,
+            [{'chunk_index': i, **metadata, **(chunk_metadata[i] if chunk_metadata else {})} for i in range(len(chunks))]
+        )
+
+    def update_text_chunk_metadata(self, updates: Dict[str, Dict[str, Any]]):
+        self.lexical_index.update_metadata(updates)
+
+    def get_chunk_texts(self, chunk_ids: List[str]) -> Dict[str, str]:
+        # The lexical index keeps a copy of every chunk's text; the chunk store reads through to it
+        return self.lexical_index.get_texts(chunk_ids)
+
+    def remove_text_chunks(self, chunk_ids: List[str]):
+        self.lexical_index.remove_chunks(chunk_ids)
+
+    def delete_documents(self, doc_ids: List[Any]):
+        self.documents.delete_many({'_id': {'$in': doc_ids}})
+
+    def find_document_ids(self, updated_since=None) -> List[Any]:
+        query = {'updated_at': {'$gte': updated_since}} if updated_since else {}
+        return [doc['_id'] for doc in self.documents.find(query, {'_id': 1})]
+
+    def get_active_index(self) -> Optional[Dict[str, Any]]:
+        """VectorStore arguments for the index to use, or None if no migration has switched it yet."""
+        record = self.get_active_index_record()
+        return {key: record.get(key) for key in INDEX_SPEC_FIELDS} if record else None
+
+    def get_active_index_record(self) -> Optional[Dict[str, Any]]:
+        return self.index_state.find_one({'_id': 'active'})
+
+    def set_active_index(self, spec: Dict[str, Any], copied_since=None):
+        """Switch every API process to the index spec names.
+
+        copied_since is when the migration's last pass started; documents
+        re-ingested after it are copied by each process as it switches.
+        """
+        # A single document write: every process sees either the old index or the new one
+        self.index_state.replace_one(
+            {'_id': 'active'},
+            {**{key: spec.get(key) for key in INDEX_SPEC_FIELDS}, 'copied_since': copied_since, 'switched_at': utc_now()},
+            upsert=True
+        )
+
+    def get_corpus_generation(self) -> int:
+        record = self.index_state.find_one({'_id': 'corpus'})
+        return record['generation'] if record else 0
+
+    def bump_corpus_generation(self) -> int:
+        """Record a change to the searchable documents; returns the new generation."""
+        record = self.index_state.find_one_and_update(
+            {'_id': 'corpus'}, {'$inc': {'generation': 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return record['generation']
+
+    def update_migration(self, fields: Dict[str, Any]):
+        self.index_state.update_one({'_id': 'migration'}, {'$set': {**fields, 'updated_at': utc_now()}}, upsert=True)
+
+    def get_migration(self) -> Optional[Dict[str, Any]]:
+        return self.index_state.find_one({'_id': 'migration'}, {'_id': 0})
+    
+    def search_text_chunks(self, query: str, limit: int = 5, filter: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         try:
-            query_words = query.lower().split()
-            results = []
-            
-            docs = list(self.documents.find({'storage_type': 'text_fallback'}))
-            
-            for doc in docs:
-                chunks = doc.get('chunks', [])
-                for i, chunk in enumerate(chunks):
-                    chunk_lower = chunk.lower()
-                    score = sum(1 for word in query_words if word in chunk_lower)
-                    if score > 0:
-                        results.append({
-                            'id': f"{doc['_id']}_{i}",
-                            'text': chunk,
-                            'score': score / len(query_words),
-                            'metadata': {'filename': doc['filename'], 'chunk_index': i}
-                        })
-            
+            if not self._legacy_indexed:
+                self.index_legacy_text_chunks()
+            with span('lexical_search'):
+                results = self.lexical_index.search(query, limit, filter)
             logger.info(f"Found {len(results)} results for: {clean_for_log(query)}")
-            results.sort(key=lambda x: x['score'], reverse=True)
-            return results[:limit]
+            return results
         except Exception as e:
             logger.error(f"Text search error: {e}")
             return []
 
+    def index_legacy_text_chunks(self):
+        # Text-fallback documents written before the inverted index existed keep
+        # their chunks inline; index them once so search never scans them again.
+        for doc in self.documents.find({'storage_type': 'text_fallback', 'indexed': {'$ne': True}}):
+            chunks = doc.get('chunks', [])
+            self.lexical_index.add_chunks(
+                [f"{doc['_id']}_{i}" for i in range(len(chunks))],
+                chunks,
+                [{'filename': doc['filename'], 'chunk_index': i} for i in range(len(chunks))]
+            )
+            self.documents.update_one({'_id': doc['_id']}, {'$set': {'indexed': True}, '$unset': {'chunks': ''}})
+            logger.info(f"Indexed {len(chunks)} legacy text chunks for {clean_for_log(doc['filename'])}")
+        self._legacy_indexed = True
+
     def log_query(self, query: str, answer: str, citations: List[Dict], token_usage: dict, latency: float):
+        # Only enqueues; the write-behind logger batches the inserts off the request path.
+        # Chunk text already lives in the index, so the log keeps just the citation ids.
         try:
-            query_log = {
+            self.query_log.log({
                 'query': query,
                 'answer': answer,
-                'citations': citations,
+                'citation_ids': [citation['id'] for citation in citations],
                 'token_usage': token_usage,
                 'latency': latency,
                 'timestamp': utc_now()
-            }
-            self.queries.insert_one(query_log)
+            })
         except Exception as e:
             logger.error(f"Error logging query: {e}")
 
@@ -97,5 +222,7 @@ class DatabaseService:
             return None
     
     def close(self):
+        if hasattr(self, 'query_log'):
+            self.query_log.stop()
         if hasattr(self, 'client'):
             self.client.close()
\ No newline at end of file
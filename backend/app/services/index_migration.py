@@ -0,0 +1,150 @@
+from typing import Dict, Any, List
+from app.config import settings
+from app.services.chunk_store import ChunkStore
+from app.services.database import DatabaseService
+from app.services.embedding_cache import EmbeddingCache
+from app.services.vector_store import VectorStore
+from app.utils.security import clean_for_log, utc_now
+import argparse
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Catch-up passes before switching even if documents keep changing; API processes copy the rest when they switch
+MAX_CATCH_UP_PASSES = 5
+# Documents between progress updates on the migration record
+PROGRESS_EVERY = 50
+
+class IndexMigration:
+    """Re-embeds every document into a new vector index, then makes it the active one.
+
+    Runs beside the API, which keeps serving from the old index meanwhile:
+
+        python -m app.services.index_migration --model text-embedding-3-small --dimensions 512 --index mini-rag-512
+
+    Document records list each chunk's id and metadata and the chunk store
+    has the texts, so only vectors stored before the chunk store existed
+    are read back from the old index (for their text). The first pass copies
+    every document, each later one the documents re-ingested since the
+    previous pass started, until one finds none. The switch is a single
+    write to the active-index record; each API process picks it up within
+    INDEX_SWITCH_POLL_SECONDS and then copies the documents it (or any
+    process) re-ingested into the old index since the last pass started.
+    """
+
+    def __init__(self, db: DatabaseService, source: VectorStore, target: VectorStore, record_progress: bool = True):
+        self.db = db
+        self.source = source
+        self.target = target
+        # Off for the catch-up an API process runs after switching, which isn't the migration's progress
+        self.record_progress = record_progress
+        # Document id -> (namespace, chunk ids) copied so far, to drop what a later revision no longer has
+        self._copied = {}
+        self.chunks_copied = 0
+
+    def run(self, switch: bool = True) -> Dict[str, Any]:
+        if self.target.spec() == self.source.spec():
+            raise ValueError(f"{self.target.index_name} is already the active index")
+        self.db.update_migration({
+            'status': 'running', 'source': self.source.spec(), 'target': self.target.spec(),
+            'started_at': utc_now(), 'documents': 0, 'chunks': 0, 'error': None
+        })
+        try:
+            started = utc_now()
+            self.copy_documents()
+            for _ in range(MAX_CATCH_UP_PASSES):
+                since, started = started, utc_now()
+                if not self.copy_documents(since):
+                    break
+            status = 'copied'
+            if switch:
+                self.db.set_active_index(self.target.spec(), copied_since=started)
+                status = 'switched'
+                logger.info(f"Switched the active vector index to {self.target.index_name}")
+            result = {'status': status, 'documents': len(self._copied), 'chunks': self.chunks_copied}
+            self.db.update_migration(result)
+            return result
+        except Exception as e:
+            logger.error(f"Index migration to {self.target.index_name} failed: {e}")
+            self.db.update_migration({'status': 'failed', 'error': str(e)})
+            raise
+
+    def copy_documents(self, since=None) -> int:
+        """Copy the documents updated since (all of them if None) into the target; returns how many."""
+        doc_ids = self.db.find_document_ids(since)
+        for i, doc_id in enumerate(doc_ids, 1):
+            doc = self.db.get_document_by_id(doc_id)
+            if doc:
+                self._copy_document(doc)
+            if self.record_progress and i % PROGRESS_EVERY == 0:
+                self.db.update_migration({'documents': len(self._copied), 'chunks': self.chunks_copied})
+        if since is not None:
+            # Documents deleted meanwhile (e.g. legacy records replaced by keyed ones)
+            gone = set(self._copied) - set(self.db.find_document_ids())
+            for doc_id in gone:
+                namespace, chunk_ids = self._copied.pop(doc_id)
+                self.target.delete_vectors(list(chunk_ids), namespace, keep_texts=True)
+        logger.info(f"Copied {len(doc_ids)} documents" + (f" updated since {since.isoformat()}" if since else "")
+                    + f" to {self.target.index_name}")
+        return len(doc_ids)
+
+    def _copy_document(self, doc: Dict[str, Any]):
+        metadata = {key: value for key, value in (doc.get('metadata') or {'filename': doc['filename']}).items() if key != 'total_chunks'}
+        namespace = metadata.get('collection') or ''
+        # Text-fallback documents have no vectors; search finds them lexically in either index
+        chunk_ids = []
+        if doc.get('storage_type', 'vector') == 'vector':
+            chunk_ids = doc.get('chunk_ids') or [f"{doc['_id']}_{i}" for i in range(doc.get('chunk_count', 0))]
+        positions = {chunk['id']: {key: value for key, value in chunk.items() if key != 'id'}
+                     for chunk in doc.get('chunks') or [] if isinstance(chunk, dict)}
+
+        texts = self._texts(chunk_ids, namespace)
+        kept = [chunk_id for chunk_id in chunk_ids if chunk_id in texts]
+        if len(kept) < len(chunk_ids):
+            logger.warning(f"No text for {len(chunk_ids) - len(kept)} chunks of {clean_for_log(doc['filename'])}; not copied")
+        if kept:
+            self.target.store_chunks([texts[chunk_id] for chunk_id in kept], metadata, None,
+                                     [positions.get(chunk_id, {}) for chunk_id in kept], kept, namespace)
+
+        previous_namespace, previous_ids = self._copied.get(doc['_id'], (namespace, set()))
+        dropped = previous_ids - set(kept) if previous_namespace == namespace else previous_ids
+        if dropped:
+            self.target.delete_vectors(list(dropped), previous_namespace, keep_texts=True)
+        self._copied[doc['_id']] = (namespace, set(kept))
+        self.chunks_copied += len(kept)
+
+    def _texts(self, chunk_ids: List[str], namespace: str) -> Dict[str, str]:
+        texts = self.source.chunk_store.get_many(chunk_ids)
+        missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in texts]
+        # Vectors upserted before the chunk store existed carry their text in metadata
+        for start in range(0, len(missing), 1000):
+            fetched = self.source.index.fetch(ids=missing[start:start + 1000], namespace=namespace)['vectors']
+            texts.update({chunk_id: vector['metadata']['text'] for chunk_id, vector in fetched.items()
+                          if (vector.get('metadata') or {}).get('text')})
+        return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed every document into a new vector index and switch the API over to it.")
+    parser.add_argument('--model', default=settings.EMBEDDING_MODEL)
+    parser.add_argument('--dimensions', type=int, help="shortened embeddings from a text-embedding-3 model, e.g. 256 or 512")
+    parser.add_argument('--index', required=True, help="name of the new Pinecone index, or its directory with --backend local")
+    parser.add_argument('--backend', choices=('pinecone', 'local'), default=settings.VECTOR_BACKEND)
+    parser.add_argument('--no-switch', action='store_true', help="only copy, leaving the API on the current index; run again without it to switch (embeddings are cached)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    with DatabaseService() as db:
+        chunk_store = ChunkStore(settings.CHUNK_STORE_PATH, loader=db.get_chunk_texts, mmap_bytes=settings.CHUNK_STORE_MMAP_BYTES)
+        embedding_cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MEMORY_ITEMS)
+        source = VectorStore(chunk_store=chunk_store, embedding_cache=embedding_cache, **(db.get_active_index() or {}))
+        target = VectorStore(chunk_store=chunk_store, embedding_cache=embedding_cache, model=args.model, dimensions=args.dimensions,
+                             backend=args.backend, index_name=args.index)
+        logger.info(f"Migrating from {source.index_name} ({source.cache_model}) to {target.index_name} ({target.cache_model})")
+        result = IndexMigration(db, source, target).run(switch=not args.no_switch)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
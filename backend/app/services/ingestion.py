@@ -0,0 +1,216 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional
+from pymongo import ASCENDING, ReturnDocument
+from app.config import settings
+from app.utils.extraction import iter_pages
+from app.utils.security import clean_for_log, utc_now
+import gridfs
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    pass
+
+class LeaseLostError(Exception):
+    pass
+
+class LeaseHeartbeat:
+    """Renews a claimed job's lease on a timer for as long as the job runs.
+
+    Renewal doesn't depend on the job reporting progress, so slow extraction
+    or upserts can't let another worker claim a job that is still running.
+    If the lease is found taken (this worker stalled past it), lost is set.
+    """
+
+    def __init__(self, queue, job_id: str, lease_id: str):
+        self.queue = queue
+        self.job_id = job_id
+        self.lease_id = lease_id
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"lease-{job_id[:8]}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _beat(self):
+        while not self._stop.wait(settings.INGESTION_LEASE_SECONDS / 3):
+            try:
+                if not self.queue._update(self.job_id, {'lease_expires_at': self.queue._lease_deadline()}, self.lease_id):
+                    self.lost = True
+                    logger.warning(f"Ingestion job {self.job_id} lost its lease to another worker")
+                    return
+            except Exception as e:
+                # Keep trying; the lease has two more renewals' worth of slack
+                logger.warning(f"Could not renew lease of ingestion job {self.job_id}: {e}")
+
+class IngestionQueue:
+    """Background document ingestion backed by MongoDB.
+
+    Jobs and their uploaded bytes (in GridFS) live in MongoDB, so queued work
+    survives restarts and is visible to every API process. Worker threads
+    claim jobs with find_one_and_update and hold a lease, renewed by a
+    heartbeat while the job runs; a job whose lease lapses (its process
+    died) is picked up again by any worker. Each claim has its own lease id
+    and every write for the job checks it, so a worker that lost its lease
+    can't overwrite the new owner's status. PDF pages are extracted in a process pool
+    so large files don't contend with request handling for the GIL.
+    """
+
+    def __init__(self, pipeline, workers: int = None, max_pending: int = None):
+        self.pipeline = pipeline
+        self.workers = workers or settings.INGESTION_WORKERS
+        self.max_pending = max_pending or settings.INGESTION_MAX_PENDING
+        db = pipeline.db.db
+        self.jobs = db.jobs
+        self.files = gridfs.GridFS(db, collection='job_files')
+        self.jobs.create_index([('status', ASCENDING), ('created_at', ASCENDING)])
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._extract_pool = None
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping.clear()
+        self._extract_pool = ProcessPoolExecutor(max_workers=settings.EXTRACTION_PROCESSES)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ingestion-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Ingestion queue started with {self.workers} workers")
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._extract_pool:
+            self._extract_pool.shutdown(wait=False, cancel_futures=True)
+            self._extract_pool = None
+
+    def submit(self, filename: str, content: Optional[bytes] = None, text: Optional[str] = None,
+               document_key: Optional[str] = None, collection: Optional[str] = None) -> Dict[str, Any]:
+        if self.jobs.count_documents({'status': 'queued'}, limit=self.max_pending) >= self.max_pending:
+            raise QueueFullError(f"Ingestion queue is full ({self.max_pending} pending jobs)")
+
+        job_id = uuid.uuid4().hex
+        payload = content if content is not None else text.encode('utf-8')
+        file_id = self.files.put(payload, filename=filename, job_id=job_id)
+        now = utc_now()
+        job = {
+            '_id': job_id,
+            'status': 'queued',
+            'filename': filename,
+            'document_key': document_key or filename,
+            'collection': collection,
+            'file_id': file_id,
+            'extract': content is not None,
+            'progress': {'chunks_embedded': 0, 'chunks_total': None},
+            'document_id': None,
+            'changes': None,
+            'error': None,
+            'attempts': 0,
+            'created_at': now,
+            'updated_at': now
+        }
+        self.jobs.insert_one(job)
+        self._wake.set()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.jobs.find_one({'_id': job_id}, {'file_id': 0})
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        now = utc_now()
+        return self.jobs.find_one_and_update(
+            {'$or': [
+                {'status': 'queued'},
+                {'status': 'running', 'lease_expires_at': {'$lt': now}}
+            ]},
+            {
+                '$set': {'status': 'running', 'updated_at': now, 'lease_expires_at': self._lease_deadline(),
+                         'lease_id': uuid.uuid4().hex},
+                '$inc': {'attempts': 1}
+            },
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                logger.error(f"Could not claim ingestion job: {e}")
+                job = None
+            if job is None:
+                # Poll as well as wait, to pick up jobs from other processes and expired leases
+                self._wake.wait(settings.INGESTION_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]):
+        job_id, lease_id = job['_id'], job['lease_id']
+        with LeaseHeartbeat(self, job_id, lease_id) as heartbeat:
+            try:
+                if job['attempts'] > settings.INGESTION_MAX_ATTEMPTS:
+                    raise RuntimeError(f"Gave up after {job['attempts'] - 1} attempts")
+
+                payload = self.files.get(job['file_id']).read()
+                if job['extract']:
+                    pages = iter_pages(payload, job['filename'], pool=self._extract_pool)
+                else:
+                    pages = [(1, payload.decode('utf-8'))]
+
+                def on_progress(embedded: int, total: int):
+                    # Stop early rather than keep embedding a job another worker now owns
+                    if heartbeat.lost:
+                        raise LeaseLostError(f"Ingestion job {job_id} lost its lease")
+                    self._update(job_id, {'progress': {'chunks_embedded': embedded, 'chunks_total': total}}, lease_id)
+
+                timings = {}
+                result = self.pipeline.process_pages(pages, job['filename'], on_progress=on_progress, on_timings=timings.update,
+                                                     document_key=job.get('document_key'), collection=job.get('collection'))
+                finished = self._update(job_id, {
+                    'status': 'completed',
+                    'document_id': result['document_id'],
+                    'changes': result['changes'],
+                    'timings': timings
+                }, lease_id)
+                if finished:
+                    logger.info(f"Ingestion job {job_id} completed for {clean_for_log(job['filename'])}")
+            except LeaseLostError:
+                finished = False
+            except Exception as e:
+                logger.error(f"Ingestion job {job_id} failed: {clean_for_log(str(e))}")
+                finished = self._update(job_id, {'status': 'failed', 'error': str(e)}, lease_id)
+        if not finished:
+            # The worker that took over reports the outcome and needs the upload
+            logger.warning(f"Ingestion job {job_id} is owned by another worker; leaving its status and upload to it")
+            return
+        try:
+            self.files.delete(job['file_id'])
+        except Exception as e:
+            logger.warning(f"Could not delete upload for job {job_id}: {e}")
+
+    def _update(self, job_id: str, fields: Dict[str, Any], lease_id: str) -> bool:
+        """Update the job if this claim still holds its lease; returns whether it did."""
+        result = self.jobs.update_one({'_id': job_id, 'status': 'running', 'lease_id': lease_id},
+                                      {'$set': {**fields, 'updated_at': utc_now()}})
+        return result.matched_count > 0
+
+    def _lease_deadline(self):
+        return utc_now() + timedelta(seconds=settings.INGESTION_LEASE_SECONDS)
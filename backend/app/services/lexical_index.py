@@ -0,0 +1,155 @@
+from collections import Counter, defaultdict
+from typing import List, Dict, Any
+from pymongo import ASCENDING, UpdateOne
+import heapq
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into', 'is', 'it',
+    'no', 'not', 'of', 'on', 'or', 'such', 'that', 'the', 'their', 'then', 'there', 'these', 'they',
+    'this', 'to', 'was', 'will', 'with', 'what', 'which', 'who', 'how', 'do', 'does', 'i', 'you'
+}
+
+def tokenize(text: str) -> List[str]:
+    return [term for term in re.findall(r'\w+', text.lower()) if term not in STOPWORDS]
+
+class LexicalIndex:
+    """BM25 over an inverted index stored in MongoDB.
+
+    One posting document per (term, chunk) holds the term frequency and the
+    chunk length, so a query only reads the posting lists of its own terms.
+    Corpus size and total length live in a single stats document that is
+    updated with $inc as chunks are added or removed. A metadata filter
+    (Pinecone syntax, whose operators MongoDB shares) is evaluated by MongoDB
+    when the best-scoring chunks are loaded.
+    """
+
+    STATS_ID = 'bm25'
+
+    def __init__(self, db, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = db.lexical_postings
+        self.chunks = db.lexical_chunks
+        self.stats = db.lexical_stats
+        self.postings.create_index([('term', ASCENDING)])
+        self.postings.create_index([('chunk_id', ASCENDING)])
+
+    def add_chunks(self, chunk_ids: List[str], texts: List[str], metadata: List[Dict[str, Any]]):
+        # Chunk ids are content hashes, so a chunk may already be indexed; replace it rather than count it twice
+        self.remove_chunks(chunk_ids)
+        chunk_docs = []
+        postings = []
+        total_length = 0
+        for chunk_id, text, meta in zip(chunk_ids, texts, metadata):
+            terms = tokenize(text)
+            length = len(terms)
+            total_length += length
+            chunk_docs.append({'_id': chunk_id, 'text': text, 'length': length, 'metadata': meta})
+            for term, tf in Counter(terms).items():
+                postings.append({'term': term, 'chunk_id': chunk_id, 'tf': tf, 'length': length})
+
+        if not chunk_docs:
+            return
+        self.chunks.insert_many(chunk_docs, ordered=False)
+        if postings:
+            self.postings.insert_many(postings, ordered=False)
+        self.stats.update_one(
+            {'_id': self.STATS_ID},
+            {'$inc': {'chunk_count': len(chunk_docs), 'total_length': total_length}},
+            upsert=True
+        )
+
+    def remove_chunks(self, chunk_ids: List[str]):
+        docs = list(self.chunks.find({'_id': {'$in': chunk_ids}}, {'length': 1}))
+        if not docs:
+            return
+        found_ids = [doc['_id'] for doc in docs]
+        self.postings.delete_many({'chunk_id': {'$in': found_ids}})
+        self.chunks.delete_many({'_id': {'$in': found_ids}})
+        self.stats.update_one(
+            {'_id': self.STATS_ID},
+            {'$inc': {'chunk_count': -len(docs), 'total_length': -sum(doc['length'] for doc in docs)}}
+        )
+
+    def update_metadata(self, updates: Dict[str, Dict[str, Any]]):
+        if updates:
+            self.chunks.bulk_write(
+                [UpdateOne({'_id': chunk_id}, {'$set': {'metadata': meta}}) for chunk_id, meta in updates.items()],
+                ordered=False
+            )
+
+    def get_texts(self, chunk_ids: List[str]) -> Dict[str, str]:
+        return {doc['_id']: doc['text'] for doc in self.chunks.find({'_id': {'$in': chunk_ids}}, {'text': 1})}
+
+    def search(self, query: str, limit: int = 5, filter: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        stats = self.stats.find_one({'_id': self.STATS_ID})
+        if not terms or not stats or stats.get('chunk_count', 0) <= 0:
+            return []
+
+        n_chunks = stats['chunk_count']
+        avg_length = max(stats['total_length'] / n_chunks, 1.0)
+
+        by_term = defaultdict(list)
+        cursor = self.postings.find(
+            {'term': {'$in': terms}},
+            {'_id': 0, 'term': 1, 'chunk_id': 1, 'tf': 1, 'length': 1}
+        )
+        for posting in cursor:
+            by_term[posting['term']].append(posting)
+
+        scores = defaultdict(float)
+        for term, postings in by_term.items():
+            df = len(postings)
+            idf = math.log(1 + (n_chunks - df + 0.5) / (df + 0.5))
+            for posting in postings:
+                tf = posting['tf']
+                norm = self.k1 * (1 - self.b + self.b * posting['length'] / avg_length)
+                scores[posting['chunk_id']] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        if not filter:
+            return self._hydrate(heapq.nlargest(limit, scores.items(), key=lambda item: item[1]))
+
+        # Load candidates best first, keeping those the filter admits; most filters fill the first batch
+        metadata_filter = _metadata_query(filter)
+        batch = 2 * limit
+        results = self._hydrate(heapq.nlargest(batch, scores.items(), key=lambda item: item[1]), metadata_filter)
+        if len(results) < limit and len(scores) > batch:
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            start, batch = batch, 2 * batch
+            while start < len(ranked) and len(results) < limit:
+                results.extend(self._hydrate(ranked[start:start + batch], metadata_filter))
+                start, batch = start + batch, 2 * batch
+        return results[:limit]
+
+    def _hydrate(self, ranked: List[tuple], metadata_filter: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        if not ranked:
+            return []
+        docs = {doc['_id']: doc for doc in self.chunks.find({'_id': {'$in': [chunk_id for chunk_id, _ in ranked]}, **(metadata_filter or {})})}
+        results = []
+        for chunk_id, score in ranked:
+            doc = docs.get(chunk_id)
+            if doc is None:
+                continue
+            results.append({
+                'id': chunk_id,
+                'text': doc['text'],
+                'score': score,
+                'metadata': doc['metadata']
+            })
+        return results
+
+def _metadata_query(filter: Dict[str, Any]) -> Dict[str, Any]:
+    """A Pinecone metadata filter as a MongoDB query on the chunks' metadata subdocument."""
+    query = {}
+    for key, condition in filter.items():
+        if key in ('$and', '$or'):
+            query[key] = [_metadata_query(clause) for clause in condition]
+        else:
+            query[f"metadata.{key}"] = condition
+    return query
@@ -1,74 +1,130 @@
-from openai import OpenAI
-from typing import List, Dict, Any, Tuple
+from openai import AsyncOpenAI
+from typing import List, Dict, Any, Tuple, AsyncIterator
 from app.config import settings
+from app.utils.context_packing import pack_context
+from app.utils.metrics import FALLBACKS
+from app.utils.retry import is_quota_error
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
 class LLMService:
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(self, async_client: AsyncOpenAI = None):
+        self.async_client = async_client or AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
 
-    def generate_answer(self, query: str, context_docs: List[Dict[str, Any]]) -> Tuple[str, dict, float]:
-        try:
-            context = self._format_context(context_docs)
-            
-            prompt = f"""Based on the following context, answer the user's question. Include inline citations using [1], [2], etc. format for each source used.
-
-Context:
-{context}
-
-Question: {query}
-
-Answer with citations:"""
+    def pack_context(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge overlapping chunks and trim to the prompt budget; cite the returned docs, not the input."""
+        return pack_context(docs, settings.CONTEXT_MAX_TOKENS, settings.CONTEXT_MIN_PASSAGE_TOKENS)
 
+    async def agenerate_answer(self, query: str, context_docs: List[Dict[str, Any]]) -> Tuple[str, dict, float]:
+        try:
             start_time = time.time()
-            
-            response = self.client.chat.completions.create(
+
+            response = await self.async_client.chat.completions.create(
                 model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context. Always include inline citations [1], [2], etc. when referencing sources."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self._build_messages(query, context_docs),
                 temperature=0.1,
                 max_tokens=500
             )
-            
+
             latency = time.time() - start_time
-            
+
             answer = response.choices[0].message.content
-            token_usage = {
-                'prompt_tokens': response.usage.prompt_tokens,
-                'completion_tokens': response.usage.completion_tokens,
-                'total_tokens': response.usage.total_tokens
-            }
-            
-            return answer, token_usage, latency
-            
+            return answer, self._token_usage(response.usage), latency
+
         except Exception as e:
-            error_str = str(e).lower()
-            if "quota" in error_str or "insufficient_quota" in error_str:
-                logger.error(f"OpenAI quota exceeded for LLM: {e}")
-                # Return a simple concatenated answer from context
-                fallback_answer = self._generate_fallback_answer(query, context_docs)
-                return fallback_answer, {'total_tokens': 0}, 0.1
-            logger.error(f"Error generating answer: {e}")
-            raise
-    
+            return self._handle_error(e, query, context_docs)
+
+    async def astream_answer(self, query: str, context_docs: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield {'type': 'token', 'text': ...} events, then one {'type': 'usage', ...} event."""
+        start_time = time.time()
+        first_token_latency = None
+        token_usage = {}
+        try:
+            stream = await self.async_client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=self._build_messages(query, context_docs),
+                temperature=0.1,
+                max_tokens=500,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+
+            async for chunk in stream:
+                # The usage-only chunk at the end of the stream has no choices
+                if chunk.usage:
+                    token_usage = self._token_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token_latency is None:
+                        first_token_latency = time.time() - start_time
+                    yield {'type': 'token', 'text': delta}
+
+        except Exception as e:
+            if first_token_latency is not None:
+                logger.error(f"Answer stream interrupted: {e}")
+                raise
+            fallback_answer, token_usage, _ = self._handle_error(e, query, context_docs)
+            first_token_latency = time.time() - start_time
+            yield {'type': 'token', 'text': fallback_answer}
+
+        yield {
+            'type': 'usage',
+            'token_usage': token_usage,
+            'latency': time.time() - start_time,
+            'first_token_latency': first_token_latency or 0.0
+        }
+
+    def _build_messages(self, query: str, context_docs: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        context = self._format_context(context_docs)
+
+        prompt = f"""Based on the following context, answer the user's question. Include inline citations using [1], [2], etc. format for each source used.
+
+Context:
+{context}
+
+Question: {query}
+
+Answer with citations:"""
+
+        return [
+            {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context. Always include inline citations [1], [2], etc. when referencing sources."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _token_usage(self, usage) -> dict:
+        return {
+            'prompt_tokens': usage.prompt_tokens,
+            'completion_tokens': usage.completion_tokens,
+            'total_tokens': usage.total_tokens
+        }
+
+    def _handle_error(self, e: Exception, query: str, context_docs: List[Dict[str, Any]]) -> Tuple[str, dict, float]:
+        if is_quota_error(e):
+            logger.error(f"OpenAI quota exceeded for LLM: {e}")
+            FALLBACKS.inc(kind='llm_quota')
+            # Return a simple concatenated answer from context
+            fallback_answer = self._generate_fallback_answer(query, context_docs)
+            return fallback_answer, {'total_tokens': 0}, 0.1
+        logger.error(f"Error generating answer: {e}")
+        raise e
+
     def _generate_fallback_answer(self, query: str, context_docs: List[Dict[str, Any]]) -> str:
         if not context_docs:
             return "Found some information but can't generate answer right now."
-        
+
         answer_parts = []
         for i, doc in enumerate(context_docs[:3], 1):
             text = doc['text'][:300] + "..." if len(doc['text']) > 300 else doc['text']
             answer_parts.append(f"[{i}] {text}")
-        
+
         return "Based on available info:\n\n" + "\n\n".join(answer_parts)
 
     def _format_context(self, docs: List[Dict[str, Any]]) -> str:
         context_parts = []
         for i, doc in enumerate(docs, 1):
             context_parts.append(f"[{i}] {doc['text']}")
-        return "\n\n".join(context_parts)
\ No newline at end of file
+        return "\n\n".join(context_parts)
@@ -0,0 +1,529 @@
+from typing import List, Dict, Any, Optional, Tuple
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from app.services.quantization import make_codec
+from app.utils.sqlite import fetch_in, execute_in
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per matrix product, bounding the temporary memory of a scan
+SCAN_BLOCK_ROWS = 8192
+# Code blocks are widened to float32 before the product; small blocks keep that copy in cache
+CODE_BLOCK_ROWS = 1024
+KMEANS_ITERATIONS = 8
+# Training points per IVF list
+KMEANS_SAMPLE_PER_LIST = 32
+# Metadata field holding a vector's namespace; absent for the default ('') namespace
+NAMESPACE_FIELD = '__namespace__'
+
+class LocalVectorIndex:
+    """In-process vector index with the part of the Pinecone Index API that VectorStore uses.
+
+    Vectors are normalised (scores are cosine similarities) and stored in a
+    float32 file that is memory-mapped, so opening a large index reads
+    nothing into RAM up front; ids, slots and metadata live in SQLite next to
+    it. Up to exact_max live vectors every query is an exact scan. Above
+    that an IVF index is trained (k-means lists; a query scans the nprobe
+    lists nearest to it) and retrained whenever the index has doubled.
+    Metadata filters take Pinecone's operators. A field a filter uses is
+    loaded once into an in-memory column (dictionary-coded), so a filter is
+    evaluated per distinct value into a mask of allowed slots; few allowed
+    slots are scanned exactly, otherwise only the allowed part of the probed
+    lists is. Namespaces are a hidden metadata field filtered the same way;
+    unlike Pinecone, an id lives in one namespace at a time (upserting it
+    into another moves it).
+
+    With quantization set (float16, int8 or binary; see quantization.py)
+    the scan runs over a compact copy of the vectors in a second mapped
+    file, and only the best top_k * rescore candidates are rescored against
+    the float32 rows, so a query touches the codes plus a short list of full
+    vectors instead of every full vector it considers.
+    """
+
+    def __init__(self, path: str, dimension: int = 1536, exact_max: int = 20000, nprobe: int = 16,
+                 auto_train: bool = True, quantization: str = 'none', rescore: Optional[int] = None):
+        self.path = path
+        self.dimension = dimension
+        self.exact_max = exact_max
+        self.nprobe = nprobe
+        self.auto_train = auto_train
+        self.codec = make_codec(quantization, dimension)
+        self.rescore = rescore or (self.codec.rescore if self.codec else 1)
+        self._lock = threading.RLock()
+        self._train_lock = threading.Lock()
+        # Slots written while a training run is in progress, reassigned when it finishes
+        self._touched = None
+        os.makedirs(path, exist_ok=True)
+
+        self._conn = sqlite3.connect(os.path.join(path, 'index.sqlite3'), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, list INTEGER NOT NULL, metadata TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        stored_dimension = self._state('dimension')
+        if stored_dimension is not None and int(stored_dimension) != dimension:
+            raise ValueError(f"Index at {path} holds {stored_dimension}-dimensional vectors, not {dimension}")
+        self._set_state('dimension', dimension)
+
+        self._vectors_path = os.path.join(path, 'vectors.f32')
+        self._centroids_path = os.path.join(path, 'centroids.npy')
+        self._codes_path = os.path.join(path, 'codes.u8')
+        self._codes = None
+        capacity = os.path.getsize(self._vectors_path) // (4 * dimension) if os.path.exists(self._vectors_path) else 0
+        self._vectors = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._assign = np.zeros(0, dtype=np.int32)
+        # Metadata field -> (value code per slot, -1 when absent; values; code by value key)
+        self._columns = {}
+        self._map(capacity)
+
+        rows = self._conn.execute("SELECT slot, list FROM vectors").fetchall()
+        if rows:
+            slots, lists = np.array(rows, dtype=np.int64).T
+            self._alive[slots] = True
+            self._assign[slots] = lists
+        self._high = int(slots.max()) + 1 if rows else 0
+        self._free = list(np.flatnonzero(~self._alive[:self._high])[::-1])
+        self._count = len(rows)
+        self._centroids = np.load(self._centroids_path) if os.path.exists(self._centroids_path) else None
+        self._trained_count = int(self._state('trained_count') or 0)
+        # Every non-default namespace ever written; while there is none, the default namespace needs no filter
+        self._namespaces = set(json.loads(self._state('namespaces') or '[]'))
+        self._lists = None
+        quantization = self.codec.name if self.codec else 'none'
+        if self.codec and self._state('quantization') != quantization:
+            self._encode_all()
+        self._set_state('quantization', quantization)
+        logger.info(f"Opened local vector index at {path}: {self._count} vectors"
+                    + (f", {len(self._centroids)} IVF lists" if self._centroids is not None else ""))
+
+    # --- Pinecone-compatible API -------------------------------------------------
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = '', **kwargs):
+        if not vectors:
+            return {'upserted_count': 0}
+        self.upsert_arrays(
+            [vector['id'] for vector in vectors],
+            np.asarray([vector['values'] for vector in vectors], dtype=np.float32),
+            [vector.get('metadata') or {} for vector in vectors],
+            namespace
+        )
+        return {'upserted_count': len(vectors)}
+
+    def query(self, vector: List[float], top_k: int = 10, include_metadata: bool = False,
+              filter: Optional[Dict[str, Any]] = None, include_values: bool = False, namespace: str = '', **kwargs):
+        query = self._normalise(np.asarray(vector, dtype=np.float32)[None, :])[0]
+        with self._lock:
+            approximate = self._centroids is not None and self._count > self.exact_max
+            if approximate:
+                self._ensure_lists()
+            ivf = (self._centroids, *self._lists) if approximate else None
+            vectors, codes, alive, high = self._vectors, self._codes, self._alive, self._high
+            filter = self._scoped(filter, namespace)
+            allowed = self._filter_mask(filter) & alive[:high] if filter else None
+
+        if allowed is None:
+            slots = self._probe(query, *ivf) if approximate else None
+        else:
+            candidates = np.flatnonzero(allowed)
+            if approximate and len(candidates) > self.exact_max:
+                slots = self._probe(query, *ivf)
+                slots = slots[allowed[slots]]
+            else:
+                slots = candidates
+        matches = self._top(query, vectors, codes, alive, high, slots, top_k)
+        if allowed is not None and approximate and len(matches) < top_k and len(candidates) > len(slots):
+            # The probed lists held too few vectors passing the filter
+            matches = self._top(query, vectors, codes, alive, high, candidates, top_k)
+        return {'matches': [
+            {
+                'id': chunk_id,
+                'score': score,
+                'metadata': _public(metadata) if include_metadata else {},
+                **({'values': vectors[slot].tolist()} if include_values else {})
+            }
+            for slot, score, chunk_id, metadata in matches
+        ]}
+
+    def delete(self, ids: List[str] = None, delete_all: bool = False, namespace: str = '', **kwargs):
+        with self._lock:
+            if delete_all:
+                ids = [row[0] for row in self._conn.execute("SELECT id FROM vectors")]
+            # Only the ids stored in this namespace; one moved to another namespace stays there
+            freed = [slot for slot, _, metadata in self._rows_where('id', ids or []) if metadata.get(NAMESPACE_FIELD, '') == namespace]
+            if not freed:
+                return {}
+            self._alive[freed] = False
+            self._free.extend(freed)
+            self._count -= len(freed)
+            execute_in(self._conn, "DELETE FROM vectors WHERE slot IN ({placeholders})", freed)
+            self._conn.commit()
+            self._lists = None
+        return {}
+
+    def update(self, id: str, set_metadata: Optional[Dict[str, Any]] = None, values: Optional[List[float]] = None,
+               namespace: str = '', **kwargs):
+        with self._lock:
+            row = self._conn.execute("SELECT metadata FROM vectors WHERE id = ?", (id,)).fetchone()
+            stored = json.loads(row[0] or '{}') if row else None
+            if stored is None or stored.get(NAMESPACE_FIELD, '') != namespace:
+                return {}
+            metadata = {**stored, **(set_metadata or {})}
+            if values is not None:
+                self.upsert_arrays([id], np.asarray([values], dtype=np.float32), [metadata], namespace)
+            else:
+                self._conn.execute("UPDATE vectors SET metadata = ? WHERE id = ?", (json.dumps(metadata), id))
+                self._conn.commit()
+                slot = self._slots_for([id])[id]
+                self._set_columns([slot], [metadata])
+        return {}
+
+    def fetch(self, ids: List[str], namespace: str = '', **kwargs):
+        with self._lock:
+            rows = self._rows_where('id', ids)
+            vectors = self._vectors
+        return {'vectors': {
+            chunk_id: {'id': chunk_id, 'values': vectors[slot].tolist(), 'metadata': _public(metadata)}
+            for slot, chunk_id, metadata in rows if metadata.get(NAMESPACE_FIELD, '') == namespace
+        }}
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            namespaces = {'': {'vector_count': self._count}}
+            if self._namespaces:
+                codes, values, _ = self._column(NAMESPACE_FIELD)
+                counts = np.bincount(codes[:self._high][self._alive[:self._high]] + 1, minlength=len(values) + 1)
+                namespaces = {namespace: {'vector_count': int(count)} for namespace, count in zip([''] + values, counts) if count}
+        return {
+            'dimension': self.dimension,
+            'total_vector_count': self._count,
+            'namespaces': namespaces,
+            'ivf_lists': len(self._centroids) if self._centroids is not None else 0,
+            'quantization': self.codec.name if self.codec else 'none',
+            # What a scan reads per vector: the codes when quantized, else the float32 row
+            'scan_bytes_per_vector': self.codec.code_bytes() if self.codec else 4 * self.dimension
+        }
+
+    # --- Bulk loading and training ----------------------------------------------
+
+    def upsert_arrays(self, ids: List[str], matrix: np.ndarray, metadata: Optional[List[Dict[str, Any]]] = None,
+                      namespace: str = ''):
+        """Upsert a (n, dimension) matrix without building per-vector dicts; the bulk-load path."""
+        if matrix.ndim != 2 or matrix.shape[1] != self.dimension:
+            raise ValueError(f"Expected vectors of dimension {self.dimension}, got shape {matrix.shape}")
+        # A repeated id keeps its last vector, as in Pinecone
+        last = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        rows = list(last.values())
+        ids = list(last)
+        matrix = self._normalise(np.asarray(matrix, dtype=np.float32)[rows])
+        metadata = [_in_namespace(metadata[i] if metadata else {}, namespace) for i in rows]
+
+        with self._lock:
+            if namespace and namespace not in self._namespaces:
+                self._namespaces.add(namespace)
+                self._set_state('namespaces', json.dumps(sorted(self._namespaces)))
+            existing = self._slots_for(ids)
+            slots = np.array([existing[chunk_id] if chunk_id in existing else self._take_slot() for chunk_id in ids], dtype=np.int64)
+            self._map(self._high)
+            self._vectors[slots] = matrix
+            self._vectors.flush()
+            if self.codec:
+                self._codes[slots] = self.codec.encode(matrix)
+                self._codes.flush()
+            lists = self._nearest_lists(matrix) if self._centroids is not None else np.full(len(ids), -1, dtype=np.int32)
+            self._assign[slots] = lists
+            self._alive[slots] = True
+            self._set_columns(slots, metadata)
+            if self._touched is not None:
+                self._touched.update(slots.tolist())
+            self._count += len(ids) - len(existing)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (id, slot, list, metadata) VALUES (?, ?, ?, ?)",
+                [(chunk_id, int(slot), int(lst), json.dumps(meta)) for chunk_id, slot, lst, meta in zip(ids, slots, lists, metadata)]
+            )
+            self._conn.commit()
+            self._lists = None
+            needs_training = self.auto_train and self._count > self.exact_max and self._count >= 2 * self._trained_count
+        if needs_training:
+            self.train()
+
+    def train(self, seed: int = 0):
+        """(Re)build the IVF lists from the vectors currently stored.
+
+        Runs on a snapshot without holding the index lock, so queries (and
+        writes) carry on against the previous lists meanwhile.
+        """
+        if not self._train_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                live = np.flatnonzero(self._alive[:self._high])
+                vectors = self._vectors
+                self._touched = set()
+            if not len(live):
+                return
+            n_lists = int(min(4096, max(16, np.sqrt(len(live))), len(live)))
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(live, size=min(len(live), n_lists * KMEANS_SAMPLE_PER_LIST), replace=False))
+            centroids = _spherical_kmeans(np.asarray(vectors[sample]), n_lists, rng)
+            lists = np.empty(len(live), dtype=np.int32)
+            for start in range(0, len(live), SCAN_BLOCK_ROWS):
+                lists[start:start + SCAN_BLOCK_ROWS] = np.argmax(vectors[live[start:start + SCAN_BLOCK_ROWS]] @ centroids.T, axis=1)
+
+            with self._lock:
+                self._centroids = centroids
+                self._assign[live] = lists
+                touched = np.array(sorted(self._touched), dtype=np.int64)
+                self._touched = None
+                if len(touched):
+                    self._assign[touched] = self._nearest_lists(self._vectors[touched])
+                changed = np.concatenate([live, touched])
+                changed = changed[self._alive[changed]]
+                self._conn.executemany("UPDATE vectors SET list = ? WHERE slot = ?", zip(self._assign[changed].tolist(), changed.tolist()))
+                self._trained_count = len(live)
+                self._set_state('trained_count', self._trained_count)
+                np.save(self._centroids_path, centroids)
+                self._lists = None
+            logger.info(f"Trained {n_lists} IVF lists over {len(live)} vectors")
+        finally:
+            self._touched = None
+            self._train_lock.release()
+
+    # --- Internals ----------------------------------------------------------------
+
+    def _map(self, needed: int):
+        capacity = len(self._alive)
+        if self._vectors is not None and needed <= capacity:
+            return
+        new_capacity = max(needed, 2 * capacity, 1024)
+        if self._vectors is not None:
+            self._vectors.flush()
+        # Growing the file leaves existing maps (held by in-flight queries) valid
+        with open(self._vectors_path, 'ab') as f:
+            f.truncate(new_capacity * 4 * self.dimension)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(new_capacity, self.dimension))
+        if self.codec:
+            if self._codes is not None:
+                self._codes.flush()
+            with open(self._codes_path, 'ab') as f:
+                f.truncate(new_capacity * self.codec.code_bytes())
+            self._codes = np.memmap(self._codes_path, dtype=np.uint8, mode='r+', shape=(new_capacity, self.codec.code_bytes()))
+        self._alive = np.concatenate([self._alive, np.zeros(new_capacity - capacity, dtype=bool)])
+        self._assign = np.concatenate([self._assign, np.full(new_capacity - capacity, -1, dtype=np.int32)])
+        for key, (codes, values, lookup) in self._columns.items():
+            self._columns[key] = (np.concatenate([codes, np.full(new_capacity - capacity, -1, dtype=np.int32)]), values, lookup)
+
+    def _encode_all(self):
+        start = time.perf_counter()
+        live = np.flatnonzero(self._alive[:self._high])
+        for first in range(0, len(live), SCAN_BLOCK_ROWS):
+            batch = live[first:first + SCAN_BLOCK_ROWS]
+            self._codes[batch] = self.codec.encode(np.asarray(self._vectors[batch]))
+        self._codes.flush()
+        logger.info(f"Encoded {len(live)} vectors as {self.codec.name} in {time.perf_counter() - start:.1f}s")
+
+    def _take_slot(self) -> int:
+        if self._free:
+            return int(self._free.pop())
+        self._high += 1
+        return self._high - 1
+
+    def _normalise(self, matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+    def _nearest_lists(self, matrix: np.ndarray) -> np.ndarray:
+        return np.argmax(np.asarray(matrix) @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _ensure_lists(self):
+        if self._lists is not None:
+            return
+        live = np.flatnonzero(self._alive[:self._high])
+        assign = self._assign[live]
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(len(self._centroids) + 1))
+        self._lists = (live[order], bounds)
+
+    def _probe(self, query: np.ndarray, centroids: np.ndarray, members: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+        nearest = np.argsort(-(centroids @ query))[:self.nprobe]
+        return np.concatenate([members[bounds[i]:bounds[i + 1]] for i in nearest])
+
+    def _scores(self, score, rows, alive, high: int, slots: Optional[np.ndarray],
+                block: int = SCAN_BLOCK_ROWS) -> Tuple[np.ndarray, np.ndarray]:
+        """score(block of rows) for every live slot (slots=None) or the given ones, a block at a time."""
+        if slots is None:
+            slots = np.arange(high)
+            scores = np.empty(high, dtype=np.float32)
+            for start in range(0, high, block):
+                scores[start:start + block] = score(rows[start:min(start + block, high)])
+            scores[~alive[:high]] = -np.inf
+            return slots, scores
+        slots = np.sort(slots)
+        scores = np.empty(len(slots), dtype=np.float32)
+        for start in range(0, len(slots), block):
+            scores[start:start + block] = score(rows[slots[start:start + block]])
+        return slots, scores
+
+    def _top(self, query: np.ndarray, vectors, codes, alive, high: int, slots: Optional[np.ndarray], top_k: int) -> List[tuple]:
+        if self.codec:
+            # Candidates from the codes, then exact scores for the shortlist only
+            prepared = self.codec.prepare(query)
+            slots, scores = self._scores(lambda block: self.codec.scores(block, prepared), codes, alive, high, slots, CODE_BLOCK_ROWS)
+            slots = slots[_best(scores, top_k * self.rescore)]
+        slots, scores = self._scores(lambda block: block @ query, vectors, alive, high, slots)
+        best = _best(scores, top_k)
+        with self._lock:
+            rows = {slot: (chunk_id, metadata) for slot, chunk_id, metadata in self._rows_where('slot', slots[best].tolist())}
+        # A row deleted since the scan started has no metadata any more
+        return [(int(slots[i]), float(scores[i]), *rows[int(slots[i])]) for i in best if int(slots[i]) in rows]
+
+    def _scoped(self, filter: Optional[Dict[str, Any]], namespace: str) -> Optional[Dict[str, Any]]:
+        """filter restricted to one namespace; None when nothing needs filtering."""
+        if namespace:
+            clause = {NAMESPACE_FIELD: namespace}
+        elif self._namespaces:
+            clause = {NAMESPACE_FIELD: {'$exists': False}}
+        else:
+            return filter or None
+        return {'$and': [clause, filter]} if filter else clause
+
+    def _filter_mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(self._high, dtype=bool)
+        for key, condition in filter.items():
+            if key == '$and':
+                for clause in condition:
+                    mask &= self._filter_mask(clause)
+            elif key == '$or':
+                mask &= np.logical_or.reduce([self._filter_mask(clause) for clause in condition] or [np.zeros(self._high, dtype=bool)])
+            else:
+                codes, values, _ = self._column(key)
+                # One verdict per distinct value; the extra last entry (code -1) is for vectors without the field
+                verdicts = np.array([_matches_condition({key: value}, key, condition) for value in values]
+                                    + [_matches_condition({}, key, condition)], dtype=bool)
+                mask &= verdicts[codes[:self._high]]
+        return mask
+
+    def _column(self, key: str):
+        if key not in self._columns:
+            start = time.perf_counter()
+            self._columns[key] = (np.full(len(self._alive), -1, dtype=np.int32), [], {})
+            slots, metadata = [], []
+            for slot, raw in self._conn.execute("SELECT slot, metadata FROM vectors"):
+                slots.append(slot)
+                metadata.append(json.loads(raw) if raw else {})
+            self._set_columns(slots, metadata, keys=[key])
+            logger.info(f"Loaded metadata field {key!r} for filtering ({len(slots)} vectors, {time.perf_counter() - start:.2f}s)")
+        return self._columns[key]
+
+    def _set_columns(self, slots, metadata: List[Dict[str, Any]], keys=None):
+        for key in keys or list(self._columns):
+            codes, values, lookup = self._columns[key]
+            for slot, meta in zip(slots, metadata):
+                if key not in meta:
+                    codes[slot] = -1
+                    continue
+                value_key = json.dumps(meta[key], sort_keys=True)
+                if value_key not in lookup:
+                    lookup[value_key] = len(values)
+                    values.append(meta[key])
+                codes[slot] = lookup[value_key]
+
+    def _slots_for(self, ids: List[str]) -> Dict[str, int]:
+        return {chunk_id: slot for slot, chunk_id, _ in self._rows_where('id', ids, with_metadata=False)}
+
+    def _rows_where(self, column: str, values: List, with_metadata: bool = True) -> List[tuple]:
+        rows = fetch_in(
+            self._conn, f"SELECT slot, id, {'metadata' if with_metadata else 'NULL'} FROM vectors WHERE {column} IN ({{placeholders}})", values
+        )
+        return [(slot, chunk_id, json.loads(metadata) if metadata else {}) for slot, chunk_id, metadata in rows]
+
+    def _state(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, str(value)))
+        self._conn.commit()
+
+
+def _in_namespace(metadata: Dict[str, Any], namespace: str) -> Dict[str, Any]:
+    metadata = {key: value for key, value in metadata.items() if key != NAMESPACE_FIELD}
+    return {**metadata, NAMESPACE_FIELD: namespace} if namespace else metadata
+
+def _public(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in metadata.items() if key != NAMESPACE_FIELD} if NAMESPACE_FIELD in metadata else metadata
+
+
+def _best(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest finite scores, best first."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return best[np.isfinite(scores[best])]
+
+
+def _spherical_kmeans(points: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = points[rng.choice(len(points), size=k, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.empty(len(points), dtype=np.int64)
+        for start in range(0, len(points), SCAN_BLOCK_ROWS):
+            assign[start:start + SCAN_BLOCK_ROWS] = np.argmax(points[start:start + SCAN_BLOCK_ROWS] @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, points)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        # Restart empty lists from random points rather than losing them
+        sums[empty] = points[rng.choice(len(points), size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms == 0, 1.0, norms)
+    return centroids.astype(np.float32)
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """Evaluate a Pinecone metadata filter ($eq, $ne, $gt(e), $lt(e), $in, $nin, $exists, $and, $or)."""
+    for key, condition in filter.items():
+        if key == '$and':
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key == '$or':
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif not _matches_condition(metadata, key, condition):
+            return False
+    return True
+
+def _matches_condition(metadata: Dict[str, Any], key: str, condition) -> bool:
+    if not isinstance(condition, dict):
+        condition = {'$eq': condition}
+    present = key in metadata
+    value = metadata.get(key)
+    for op, operand in condition.items():
+        if op == '$exists':
+            ok = present == bool(operand)
+        elif op == '$ne':
+            ok = value != operand
+        elif op == '$nin':
+            ok = value not in operand
+        elif not present:
+            ok = False
+        elif op == '$eq':
+            # Pinecone matches a scalar against list-valued metadata by membership
+            ok = operand in value if isinstance(value, list) else value == operand
+        elif op == '$in':
+            ok = any(item in operand for item in value) if isinstance(value, list) else value in operand
+        elif op in ('$gt', '$gte', '$lt', '$lte'):
+            try:
+                ok = {'$gt': value > operand, '$gte': value >= operand, '$lt': value < operand, '$lte': value <= operand}[op]
+            except TypeError:
+                ok = False
+        else:
+            raise ValueError(f"Unsupported filter operator {op}")
+        if not ok:
+            return False
+    return True
@@ -0,0 +1,101 @@
+from abc import ABC, abstractmethod
+from typing import Dict
+import numpy as np
+
+# Set-bit count per byte, for NumPy versions without np.bitwise_count (< 2.0)
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+class Codec(ABC):
+    """Encodes unit vectors as fixed-width byte rows and scores a query against them.
+
+    Scores only need to rank candidates well enough for the shortlist;
+    LocalVectorIndex rescores the shortlist against the float32 vectors.
+    rescore is the default shortlist size as a multiple of top_k, larger
+    for coarser codes.
+    """
+    name = None
+    rescore = 4
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    @abstractmethod
+    def code_bytes(self) -> int:
+        ...
+
+    @abstractmethod
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        """(n, dimension) float32 -> (n, code_bytes) uint8."""
+
+    def prepare(self, query: np.ndarray):
+        return query
+
+    @abstractmethod
+    def scores(self, codes: np.ndarray, prepared) -> np.ndarray:
+        ...
+
+
+class Float16Codec(Codec):
+    name = 'float16'
+    rescore = 2
+
+    def code_bytes(self) -> int:
+        return 2 * self.dimension
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        return matrix.astype(np.float16).view(np.uint8)
+
+    def scores(self, codes: np.ndarray, prepared) -> np.ndarray:
+        return codes.view(np.float16).astype(np.float32) @ prepared
+
+
+class Int8Codec(Codec):
+    """One signed byte per dimension plus a float32 scale per vector (max |x| / 127)."""
+    name = 'int8'
+
+    def code_bytes(self) -> int:
+        return self.dimension + 4
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        scale = np.abs(matrix).max(axis=1, keepdims=True) / 127.0
+        scale[scale == 0] = 1.0
+        quantized = np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8)
+        return np.hstack([quantized.view(np.uint8), scale.astype(np.float32).view(np.uint8)])
+
+    def scores(self, codes: np.ndarray, prepared) -> np.ndarray:
+        scale = np.ascontiguousarray(codes[:, self.dimension:]).view(np.float32)[:, 0]
+        return (codes[:, :self.dimension].view(np.int8).astype(np.float32) @ prepared) * scale
+
+
+class BinaryCodec(Codec):
+    """One sign bit per dimension; candidates are ranked by Hamming distance to the query's bits."""
+    name = 'binary'
+    rescore = 40
+
+    def code_bytes(self) -> int:
+        return (self.dimension + 7) // 8
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        return np.packbits(matrix > 0, axis=1)
+
+    def prepare(self, query: np.ndarray):
+        return np.packbits(query > 0)
+
+    def scores(self, codes: np.ndarray, prepared) -> np.ndarray:
+        differing = np.bitwise_xor(codes, prepared)
+        if hasattr(np, 'bitwise_count'):
+            distance = np.bitwise_count(differing).sum(axis=1, dtype=np.int32)
+        else:
+            distance = _POPCOUNT[differing].sum(axis=1, dtype=np.int32)
+        return -distance.astype(np.float32)
+
+
+CODECS: Dict[str, type] = {codec.name: codec for codec in (Float16Codec, Int8Codec, BinaryCodec)}
+
+def make_codec(name: str, dimension: int):
+    """The codec for a LOCAL_INDEX_QUANTIZATION value; None for 'none' (full float32 scans)."""
+    if name in (None, '', 'none'):
+        return None
+    if name not in CODECS:
+        raise ValueError(f"Unknown quantization {name!r}; expected none, {', '.join(CODECS)}")
+    return CODECS[name](dimension)
@@ -0,0 +1,181 @@
+from typing import List, Dict, Any, Optional
+from app.config import settings
+from app.utils.metrics import FALLBACKS, STAGE_LATENCY
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Already inserted (e.g. by an earlier attempt); nothing to retry
+DUPLICATE_KEY = 11000
+
+class QueryLogWriter:
+    """Write-behind buffer for query logs.
+
+    log() only enqueues, so requests never wait on MongoDB. A writer thread
+    flushes with insert_many once batch_size entries are waiting or
+    flush_seconds have passed. When the queue is full, or an insert fails,
+    entries are appended to a local JSONL spill file (or dropped if no spill
+    path is set); spilled entries are replayed when the writer starts and
+    after each successful flush.
+    """
+
+    def __init__(self, collection, batch_size: int = None, flush_seconds: float = None,
+                 max_pending: int = None, spill_path: Optional[str] = None):
+        self.collection = collection
+        self.batch_size = batch_size or settings.QUERY_LOG_BATCH_SIZE
+        self.flush_seconds = flush_seconds or settings.QUERY_LOG_FLUSH_SECONDS
+        self.spill_path = spill_path if spill_path is not None else settings.QUERY_LOG_SPILL_PATH
+        self._queue = queue.Queue(maxsize=max_pending or settings.QUERY_LOG_MAX_PENDING)
+        self._spill_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def log(self, entry: Dict[str, Any]):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._spill([entry], "queue full")
+
+    def stop(self, timeout: float = 10.0):
+        """Flush everything still queued, then stop the writer thread."""
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread:
+                    logger.error("Query log writer thread died; restarting it")
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # Entries spilled (or left mid-replay) by an earlier process
+        try:
+            self._replay_spill()
+        except Exception as e:
+            logger.error(f"Could not replay spilled query logs: {e}")
+        while True:
+            try:
+                batch = self._next_batch()
+                if batch:
+                    self._flush(batch)
+                elif self._stopping.is_set():
+                    return
+            except Exception as e:
+                # Keep the thread alive; the entries in hand were spilled or logged by _flush
+                logger.error(f"Query log writer error: {e}")
+                time.sleep(1)
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        batch = []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Once stopping (or past the deadline), take what's queued without waiting
+                if self._stopping.is_set() or remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List[Dict[str, Any]]):
+        start = time.perf_counter()
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except Exception as e:
+            failed = self._failed_entries(batch, e)
+            logger.error(f"Could not write {len(failed)} of {len(batch)} query logs: {e}")
+            if failed:
+                self._spill(failed, "insert failed")
+            return
+        STAGE_LATENCY.observe(time.perf_counter() - start, operation='query_log', stage='insert_many')
+        self._replay_spill()
+
+    def _spill(self, entries: List[Dict[str, Any]], reason: str):
+        if not self.spill_path:
+            FALLBACKS.inc(len(entries), kind='query_log_dropped')
+            logger.warning(f"Dropped {len(entries)} query logs ({reason})")
+            return
+        try:
+            with self._spill_lock:
+                directory = os.path.dirname(self.spill_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.spill_path, 'a', encoding='utf-8') as f:
+                    for entry in entries:
+                        # insert_many may have assigned an _id before failing; let the replay get a fresh one
+                        record = {key: value for key, value in entry.items() if key != '_id'}
+                        f.write(json.dumps(record, default=str) + "\n")
+            FALLBACKS.inc(len(entries), kind='query_log_spilled')
+        except OSError as e:
+            FALLBACKS.inc(len(entries), kind='query_log_dropped')
+            logger.error(f"Dropped {len(entries)} query logs, spill failed: {e}")
+
+    def _failed_entries(self, entries: List[Dict[str, Any]], error: Exception) -> List[Dict[str, Any]]:
+        # Unordered inserts write every document they can; a BulkWriteError lists the ones that weren't
+        if isinstance(error, BulkWriteError):
+            return [entries[write_error['index']] for write_error in error.details.get('writeErrors', [])
+                    if write_error.get('code') != DUPLICATE_KEY]
+        return entries
+
+    def _replay_spill(self):
+        if not self.spill_path:
+            return
+        replay_path = self.spill_path + ".replay"
+        with self._spill_lock:
+            # Move the file aside first so new spills during the replay aren't lost. A replay file
+            # left by a crash is replayed too: the spill is appended to it rather than replacing it
+            if os.path.exists(self.spill_path):
+                if os.path.exists(replay_path):
+                    with open(self.spill_path, encoding='utf-8') as src, open(replay_path, 'a', encoding='utf-8') as dst:
+                        dst.write(src.read())
+                    os.remove(self.spill_path)
+                else:
+                    os.replace(self.spill_path, replay_path)
+            elif not os.path.exists(replay_path):
+                return
+        entries, skipped = [], 0
+        with open(replay_path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    if isinstance(entry.get('timestamp'), str):
+                        entry['timestamp'] = datetime.fromisoformat(entry['timestamp'])
+                    entries.append(entry)
+                except (ValueError, AttributeError):
+                    # A line cut short by a crash or full disk; the rest of the file is still good
+                    skipped += 1
+        if skipped:
+            FALLBACKS.inc(skipped, kind='query_log_dropped')
+            logger.warning(f"Skipped {skipped} unreadable spilled query logs")
+        start = 0
+        try:
+            for start in range(0, len(entries), self.batch_size):
+                self.collection.insert_many(entries[start:start + self.batch_size], ordered=False)
+            logger.info(f"Replayed {len(entries)} spilled query logs")
+        except Exception as e:
+            logger.error(f"Could not replay spilled query logs: {e}")
+            self._spill(self._failed_entries(entries[start:start + self.batch_size], e)
+                        + entries[start + self.batch_size:], "replay failed")
+        os.remove(replay_path)
@@ -93,94 +93,513 @@
 
 # ?++   Gemin
 
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, AsyncIterator, Callable, Iterable
 from app.services.vector_store import VectorStore
 from app.services.reranker import Reranker
 from app.services.llm import LLMService
 from app.services.database import DatabaseService
-from app.utils.text_processing import chunk_text
-from app.utils.security import clean_for_log
+from app.services.answer_cache import answer_cache
+from app.models.schemas import SearchOptions
+from app.utils.fusion import reciprocal_rank_fusion
+from app.utils.text_processing import chunk_pages
+from app.utils.security import clean_for_log, epoch_seconds
+from app.utils.metrics import start_trace, finish_trace, span, record_stage, record_token_usage, FALLBACKS, RERANK_DECISIONS
+from app.utils.single_flight import SingleFlight
 from app.config import settings
+import asyncio
+import contextlib
+import hashlib
 import logging
+import threading
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
+NO_RESULTS_ANSWER = "I couldn't find relevant information to answer your question."
+
+# Per-chunk position data copied from the chunker into vector and lexical metadata
+CHUNK_METADATA_FIELDS = {'start': 'char_start', 'end': 'char_end', 'page_start': 'page_start', 'page_end': 'page_end'}
+
+def content_chunk_ids(document_key: str, chunks: List[str]) -> List[str]:
+    """Stable chunk ids: a hash of the document key and the chunk text.
+
+    The key keeps identical text in two documents apart; a repeated chunk
+    within one document gets its occurrence number appended.
+    """
+    prefix = hashlib.sha256(document_key.encode('utf-8')).hexdigest()[:16]
+    seen = {}
+    ids = []
+    for chunk in chunks:
+        chunk_id = f"{prefix}-{hashlib.sha256(chunk.encode('utf-8')).hexdigest()[:32]}"
+        seen[chunk_id] = seen.get(chunk_id, 0) + 1
+        ids.append(chunk_id if seen[chunk_id] == 1 else f"{chunk_id}-{seen[chunk_id]}")
+    return ids
+
 class RAGPipeline:
-    def __init__(self):
-        self.vector_store = VectorStore()
-        self.reranker = Reranker()
-        self.llm = LLMService()
-        self.db = DatabaseService()
+    def __init__(self, vector_store=None, reranker=None, llm=None, db=None):
+        self.vector_store = vector_store or VectorStore()
+        self.reranker = reranker or Reranker()
+        self.llm = llm or LLMService()
+        self.db = db or DatabaseService()
+        # Shared across pipeline instances so an upload invalidates every router's answers
+        self.answer_cache = answer_cache
+        # Identical questions arriving together share one run of the pipeline (or, for streams and batches, of retrieval)
+        self._inflight_queries = SingleFlight('query')
+        self._inflight_retrievals = SingleFlight('retrieval')
 
-    def process_document(self, text: str, filename: str) -> str:
+    def process_pages(self, pages: Iterable[Tuple[int, str]], filename: str, on_progress: Callable[[int, int], None] = None,
+                      on_timings: Callable[[Dict[str, float]], None] = None, document_key: str = None,
+                      collection: str = None) -> Dict[str, Any]:
+        trace = start_trace('ingest')
+        # Chunking consumes pages as the extractor yields them, so this span includes extraction
+        with span('extract_and_chunk'):
+            chunk_records = list(chunk_pages(pages, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP))
+        return self._store_chunks(chunk_records, filename, on_progress, trace, on_timings, document_key, collection)
+
+    def _store_chunks(self, chunk_records: List[Dict[str, Any]], filename: str, on_progress: Callable[[int, int], None] = None, trace=None,
+                      on_timings: Callable[[Dict[str, float]], None] = None, document_key: str = None,
+                      collection: str = None) -> Dict[str, Any]:
+        """Store a new revision of the document, touching only the chunks that changed.
+
+        The document is identified by document_key (default: filename) and its
+        chunk ids are content hashes, so chunks already stored from the previous
+        revision are neither embedded nor upserted again; those that only moved
+        get a metadata update, and chunks no longer present are deleted.
+        Its vectors live in the namespace named after its collection (the
+        default namespace without one); moving the document to another
+        collection re-upserts them all, from cached embeddings.
+        Returns {'document_id', 'document_key', 'storage', 'changes'}.
+        """
+        document_key = document_key or filename
+        namespace = collection or ''
         try:
-            # Chunk the text
-            chunks = chunk_text(text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
+            if not chunk_records:
+                raise ValueError("Document text is empty")
+            chunks = [record['text'] for record in chunk_records]
+            chunk_ids = content_chunk_ids(document_key, chunks)
+            chunk_metadata = [
+                {'chunk_index': i, **{field: record[key] for key, field in CHUNK_METADATA_FIELDS.items() if key in record}}
+                for i, record in enumerate(chunk_records)
+            ]
+            metadata = {
+                'filename': filename,
+                'document_key': document_key,
+                **({'collection': collection} if collection else {})
+            }
             
-            try:
-                # Try to store chunks in vector database
-                metadata = {
-                    'filename': filename,
-                    'total_chunks': len(chunks)
+            with self._document_lock(document_key):
+                with span('diff'):
+                    previous, previous_ids, reusable, legacy = self._previous_revision(document_key, filename)
+                    previous_metadata = previous.get('metadata', {}) if previous else {}
+                    previous_namespace = previous_metadata.get('collection') or ''
+                    # The date of the first upload, so a re-upload doesn't rewrite every chunk's metadata
+                    metadata['uploaded_at'] = previous_metadata.get('uploaded_at') or (
+                        epoch_seconds(previous['created_at']) if previous and previous.get('created_at') else time.time()
+                    )
+                    relocated = []
+                    if namespace != previous_namespace:
+                        # Vectors can't change namespace in place
+                        relocated = [chunk_id for chunk_id in chunk_ids if chunk_id in reusable]
+                        reusable = {}
+                    # Reused chunks carry the document's metadata as well, so a rename (or the first
+                    # re-upload of a document stored before uploaded_at existed) updates all of them
+                    renamed = any(previous_metadata.get(key) != value for key, value in metadata.items())
+                    added = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id not in reusable]
+                    moved = {
+                        chunk_id: meta for chunk_id, meta in zip(chunk_ids, chunk_metadata)
+                        if chunk_id in reusable and (renamed or reusable[chunk_id] != meta)
+                    }
+                    stale = list(previous_ids - set(chunk_ids))
+                changes = {
+                    'added': len(added),
+                    'updated': len(moved),
+                    'unchanged': len(chunks) - len(added) - len(moved),
+                    'removed': len(stale)
                 }
-                chunk_ids = self.vector_store.store_chunks(chunks, metadata)
-                doc_id = self.db.store_document_metadata(filename, chunk_ids, metadata)
-                logger.info(f"Processed {clean_for_log(filename)} - {len(chunks)} chunks")
-            except Exception as embed_error:
-                logger.warning(f"Embedding storage failed, using text fallback: {embed_error}")
-                # Fallback to text-only storage
-                doc_id = self.db.store_text_chunks(filename, chunks)
-                logger.info(f"Processed {clean_for_log(filename)} - {len(chunks)} chunks (text mode)")
+                
+                try:
+                    # Try to store chunks in vector database
+                    if added:
+                        reused = len(chunks) - len(added)
+                        progress = (lambda done, total: on_progress(reused + done, len(chunks))) if on_progress else None
+                        self.vector_store.store_chunks(
+                            [chunks[i] for i in added], metadata, progress,
+                            [chunk_metadata[i] for i in added], [chunk_ids[i] for i in added], namespace
+                        )
+                    elif on_progress:
+                        on_progress(len(chunks), len(chunks))
+                    if moved:
+                        with span('metadata_update'):
+                            self.vector_store.update_metadata({chunk_id: {**metadata, **meta} for chunk_id, meta in moved.items()}, namespace)
+                    with span('document_metadata'):
+                        doc_id = self.db.store_document_metadata(
+                            document_key, filename, chunk_ids, chunk_metadata, {**metadata, 'total_chunks': len(chunks)}
+                        )
+                    try:
+                        # Index the same chunk ids lexically so hybrid search can fuse both rankings
+                        with span('lexical_index'):
+                            self.db.index_text_chunks([chunk_ids[i] for i in added], [chunks[i] for i in added], metadata,
+                                                      [chunk_metadata[i] for i in added])
+                            self.db.update_text_chunk_metadata({chunk_id: {**metadata, **meta} for chunk_id, meta in moved.items()})
+                    except Exception as index_error:
+                        logger.warning(f"Lexical indexing failed, document is vector-only: {index_error}")
+                    storage = 'vector'
+                    logger.info(f"Processed {clean_for_log(filename)} - {len(chunks)} chunks ({self._format_changes(changes)})")
+                except Exception as embed_error:
+                    logger.warning(f"Embedding storage failed, using text fallback: {embed_error}")
+                    FALLBACKS.inc(kind='text_storage')
+                    # Fallback to text-only storage
+                    with span('text_fallback'):
+                        doc_id = self.db.store_text_chunks(
+                            document_key, filename, chunk_ids, chunks, chunk_metadata, {**metadata, 'total_chunks': len(chunks)}
+                        )
+                    storage = 'text_fallback'
+                    logger.info(f"Processed {clean_for_log(filename)} - {len(chunks)} chunks (text mode)")
+                
+                if stale:
+                    with span('delete_stale'):
+                        self.vector_store.delete_vectors(stale, previous_namespace)
+                        self.db.remove_text_chunks(stale)
+                if relocated:
+                    # Their texts stay: the same chunk ids now live in the new namespace
+                    with span('delete_stale'):
+                        self.vector_store.delete_vectors(relocated, previous_namespace, keep_texts=True)
+                if legacy:
+                    self.db.delete_documents([doc['_id'] for doc in legacy])
             
-            return doc_id
+            # New content can change any cached answer; a re-upload that changed nothing can't
+            if added or moved or stale or storage != 'vector':
+                self._invalidate_answers()
+            if trace:
+                timings = finish_trace(trace)
+                logger.info(f"Ingest timings for {clean_for_log(filename)}: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+                if on_timings:
+                    on_timings(timings)
+            return {'document_id': doc_id, 'document_key': document_key, 'storage': storage, 'changes': changes}
             
         except Exception as e:
             logger.error(f"Error processing document: {e}")
             raise
 
-    def query(self, query: str) -> Tuple[str, List[Dict[str, Any]], dict, float]:
+    def _previous_revision(self, document_key: str, filename: str) -> Tuple[Optional[Dict[str, Any]], set, Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+        """The document's current record, the chunk ids stored for it so far, the ones whose vectors can
+        be reused (with their position metadata), and any records from before documents had keys."""
+        previous = self.db.get_document(document_key)
+        legacy = self.db.find_legacy_documents(filename) if document_key == filename else []
+        previous_ids = set(previous['chunk_ids']) if previous else set()
+        for doc in legacy:
+            previous_ids.update(doc.get('chunk_ids') or [f"{doc['_id']}_{i}" for i in range(doc.get('chunk_count', 0))])
+        reusable = {}
+        # A text-fallback revision has no vectors to reuse
+        if previous and previous.get('storage_type') == 'vector':
+            reusable = {chunk['id']: {key: value for key, value in chunk.items() if key != 'id'} for chunk in previous['chunks']}
+        return previous, previous_ids, reusable, legacy
+
+    @contextlib.contextmanager
+    def _document_lock(self, document_key: str):
+        """Hold document_key's lock in MongoDB, renewed on a timer, for the duration of the block.
+
+        Two revisions of one document ingested at once would each delete the
+        other's chunks, and ingestion workers run in every API process.
+        """
+        owner = uuid.uuid4().hex
+        with span('document_lock'):
+            while not self.db.acquire_document_lock(document_key, owner, settings.DOCUMENT_LOCK_SECONDS):
+                time.sleep(settings.DOCUMENT_LOCK_POLL_SECONDS)
+        stop = threading.Event()
+        
+        def renew():
+            while not stop.wait(settings.DOCUMENT_LOCK_SECONDS / 3):
+                try:
+                    if not self.db.acquire_document_lock(document_key, owner, settings.DOCUMENT_LOCK_SECONDS):
+                        logger.warning(f"Lost the lock on document {clean_for_log(document_key)} to another worker")
+                        return
+                except Exception as e:
+                    logger.warning(f"Could not renew the lock on document {clean_for_log(document_key)}: {e}")
+        
+        renewer = threading.Thread(target=renew, name="document-lock", daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            renewer.join()
+            try:
+                self.db.release_document_lock(document_key, owner)
+            except Exception as e:
+                logger.warning(f"Could not release the lock on document {clean_for_log(document_key)}, it expires on its own: {e}")
+
+    def _invalidate_answers(self):
+        # Other API processes drop their answers when they next see the bumped generation
         try:
-            # Try vector search first
-            retrieved_docs = self.vector_store.similarity_search(query, settings.TOP_K)
+            self.answer_cache.set_generation(self.db.bump_corpus_generation())
+        except Exception as e:
+            logger.warning(f"Could not record the corpus change, other processes keep their cached answers: {e}")
+            self.answer_cache.clear()
+
+    def _format_changes(self, changes: Dict[str, int]) -> str:
+        return ", ".join(f"{count} {kind}" for kind, count in changes.items())
+
+    async def aquery(self, query: str, options: Optional[SearchOptions] = None) -> Dict[str, Any]:
+        options = options or SearchOptions()
+        result, joined = await self._inflight_queries.do((query, options.cache_key()), lambda: self._aquery(query, options))
+        if joined:
+            # The request that ran the pipeline logged itself; log this one too
+            self.db.log_query(query, result['answer'], result['citations'], result['token_usage'], result['latency'])
+        return {**result, 'coalesced': joined}
+
+    async def _aquery(self, query: str, options: SearchOptions) -> Dict[str, Any]:
+        trace = start_trace('query')
+        try:
+            start_time = time.perf_counter()
+            cached_result, query_embedding = await self._alookup_answer(query, options)
+            if cached_result:
+                return self._serve_cached(query, cached_result, start_time, trace)
             
-            # If no results from vector search, try text fallback
-            if not retrieved_docs:
-                logger.info("No vector results, trying text search fallback")
-                retrieved_docs = self.db.search_text_chunks(query, settings.TOP_K)
+            return await self._aanswer(query, options, query_embedding, trace=trace)
             
-            if not retrieved_docs:
-                return "I couldn't find relevant information to answer your question.", [], {}, 0.0
+        except Exception as e:
+            logger.error(f"Error in query processing: {e}")
+            raise
+
+    async def abatch_query(self, queries: List[str], options: Optional[SearchOptions] = None) -> List[Dict[str, Any]]:
+        """Answer queries together, in input order; a failed query gets {'error': ...} in its slot."""
+        options = options or SearchOptions()
+        # Covers the shared steps; each query below gets its own trace for its own stages
+        batch_trace = start_trace('batch_query')
+        try:
+            return await self._abatch_query(queries, options)
+        finally:
+            finish_trace(batch_trace)
+
+    async def _abatch_query(self, queries: List[str], options: SearchOptions) -> List[Dict[str, Any]]:
+        variant = options.cache_key()
+        start_time = time.perf_counter()
+        results = [None] * len(queries)
+        
+        misses = []
+        with span('answer_cache'):
+            for i, query in enumerate(queries):
+                cached_result = self.answer_cache.get(query, variant)
+                if cached_result:
+                    results[i] = self._serve_cached(query, cached_result, start_time)
+                else:
+                    misses.append(i)
+        if not misses:
+            return results
+        
+        try:
+            # One embeddings request for the whole batch instead of one per query
+            embeddings = await self.vector_store.agenerate_embeddings([queries[i] for i in misses])
+        except Exception as e:
+            logger.error(f"Batch embedding failed: {e}")
+            for i in misses:
+                results[i] = {'error': str(e)}
+            return results
+        
+        # Retrieval and reranking run concurrently for every query; generation is bounded
+        llm_slots = asyncio.Semaphore(settings.BATCH_LLM_CONCURRENCY)
+        
+        async def answer_one(query: str, query_embedding: List[float]) -> Dict[str, Any]:
+            # gather runs this in its own task, so the trace doesn't leak to the other queries
+            trace = start_trace('query')
+            with span('answer_cache'):
+                cached_result = self.answer_cache.get_similar(query_embedding, variant)
+            if cached_result:
+                return self._serve_cached(query, cached_result, start_time, trace)
+            return await self._aanswer(query, options, query_embedding, llm_slots, trace)
+        
+        outcomes = await asyncio.gather(
+            *(answer_one(queries[i], embedding) for i, embedding in zip(misses, embeddings)),
+            return_exceptions=True
+        )
+        for i, outcome in zip(misses, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Batch query {i} failed: {outcome}")
+                outcome = {'error': str(outcome)}
+            results[i] = outcome
+        return results
+
+    async def astream_query(self, query: str, options: Optional[SearchOptions] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (event, data) pairs: citations, then answer tokens, then a final done event."""
+        options = options or SearchOptions()
+        trace = start_trace('stream_query')
+        try:
+            start_time = time.perf_counter()
+            cached_result, query_embedding = await self._alookup_answer(query, options)
+            if cached_result:
+                latency = time.perf_counter() - start_time
+                yield 'citations', {'citations': cached_result['citations']}
+                yield 'token', {'text': cached_result['answer']}
+                yield 'done', {'token_usage': cached_result['token_usage'], 'latency': latency, 'timings': finish_trace(trace), 'cached': True, 'rerank': None}
+                self.db.log_query(query, cached_result['answer'], cached_result['citations'], cached_result['token_usage'], latency)
+                return
             
-            # Rerank documents if applicable
-            if retrieved_docs and 'rerank_score' not in retrieved_docs[0]:
-                try:
-                    reranked_docs = self.reranker.rerank(query, retrieved_docs, settings.RERANK_TOP_K)
-                except Exception as rerank_error:
-                    logger.warning(f"Reranking failed, using original order: {rerank_error}")
-                    reranked_docs = retrieved_docs[:settings.RERANK_TOP_K]
-            else:
-                reranked_docs = retrieved_docs[:settings.RERANK_TOP_K]
+            reranked_docs, rerank_info = await self._aretrieve(query, options, query_embedding)
             
-            # Generate answer with LLM
-            answer, token_usage, latency = self.llm.generate_answer(query, reranked_docs)
-            
-            # Prepare citations
-            citations = [
-                {
-                    'id': doc['id'],
-                    # CORRECTED: Send the full, untrimmed text.
-                    # The frontend will handle creating previews.
-                    'text': doc['text'],
-                    'metadata': doc['metadata']
-                }
-                for doc in reranked_docs
-            ]
+            if not reranked_docs:
+                yield 'citations', {'citations': []}
+                yield 'token', {'text': NO_RESULTS_ANSWER}
+                yield 'done', {'token_usage': {}, 'latency': 0.0, 'timings': finish_trace(trace), 'cached': False, 'rerank': None}
+                return
             
-            # Log query
+            with span('context_packing'):
+                context_docs = self.llm.pack_context(reranked_docs)
+            citations = self._build_citations(context_docs)
+            yield 'citations', {'citations': citations}
+            
+            answer_parts = []
+            token_usage, latency = {}, 0.0
+            async for event in self.llm.astream_answer(query, context_docs):
+                if event['type'] == 'token':
+                    answer_parts.append(event['text'])
+                    yield 'token', {'text': event['text']}
+                else:
+                    token_usage = event['token_usage']
+                    latency = event['latency']
+                    # The stream is paced by the client, so take the LLM's own timings rather than a span
+                    record_stage('llm_first_token', event['first_token_latency'])
+                    record_stage('llm', latency)
+            
+            record_token_usage(token_usage)
+            answer = "".join(answer_parts)
             self.db.log_query(query, answer, citations, token_usage, latency)
+            self._remember_answer(query, options, query_embedding, {
+                'answer': answer, 'citations': citations, 'token_usage': token_usage, 'latency': latency
+            })
             
-            return answer, citations, token_usage, latency
+            yield 'done', {'token_usage': token_usage, 'latency': latency, 'timings': finish_trace(trace), 'cached': False, 'rerank': rerank_info}
             
         except Exception as e:
-            logger.error(f"Error in query processing: {e}")
-            raise
\ No newline at end of file
+            logger.error(f"Error in streaming query: {e}")
+            raise
+
+    async def _alookup_answer(self, query: str, options: SearchOptions) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+        variant = options.cache_key()
+        with span('answer_cache'):
+            cached_result = self.answer_cache.get(query, variant)
+        if cached_result:
+            return cached_result, None
+        # The embedding is reused for retrieval on a miss, so this costs no extra API call
+        query_embedding = (await self.vector_store.agenerate_embeddings([query]))[0]
+        with span('answer_cache'):
+            return self.answer_cache.get_similar(query_embedding, variant), query_embedding
+
+    def _serve_cached(self, query: str, cached_result: Dict[str, Any], start_time: float, trace=None) -> Dict[str, Any]:
+        result = {**cached_result, 'latency': time.perf_counter() - start_time}
+        self.db.log_query(query, result['answer'], result['citations'], result['token_usage'], result['latency'])
+        return {**result, 'cached': True, 'rerank': None, 'timings': finish_trace(trace)}
+
+    async def _aanswer(self, query: str, options: SearchOptions, query_embedding: Optional[List[float]],
+                       llm_slots: Optional[asyncio.Semaphore] = None, trace=None) -> Dict[str, Any]:
+        reranked_docs, rerank_info = await self._aretrieve(query, options, query_embedding)
+        
+        if not reranked_docs:
+            return {'answer': NO_RESULTS_ANSWER, 'citations': [], 'token_usage': {}, 'latency': 0.0, 'cached': False, 'rerank': None,
+                    'timings': finish_trace(trace)}
+        
+        # Citation numbers follow the packed passages the model actually sees
+        with span('context_packing'):
+            context_docs = self.llm.pack_context(reranked_docs)
+        async with llm_slots or contextlib.nullcontext():
+            with span('llm'):
+                answer, token_usage, latency = await self.llm.agenerate_answer(query, context_docs)
+        record_token_usage(token_usage)
+        
+        citations = self._build_citations(context_docs)
+        
+        self.db.log_query(query, answer, citations, token_usage, latency)
+        
+        result = {'answer': answer, 'citations': citations, 'token_usage': token_usage, 'latency': latency}
+        self._remember_answer(query, options, query_embedding, result)
+        return {**result, 'cached': False, 'rerank': rerank_info, 'timings': finish_trace(trace)}
+
+    def _remember_answer(self, query: str, options: SearchOptions, query_embedding: Optional[List[float]], result: Dict[str, Any]):
+        # Quota fallbacks report zero tokens; don't pin them in the cache
+        if not result['citations'] or not result['token_usage'].get('total_tokens'):
+            return
+        self.answer_cache.put(query, query_embedding, result, options.cache_key())
+
+    async def _aretrieve(self, query: str, options: SearchOptions, query_embedding: List[float] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Return the reranked documents and the rerank decision (None if not attempted)."""
+        start_time = time.perf_counter()
+        (reranked_docs, rerank_info), joined = await self._inflight_retrievals.do(
+            (query, options.cache_key()), lambda: self._aretrieve_once(query, options, query_embedding)
+        )
+        if joined:
+            # The retrieval stages were timed in the request that ran them
+            record_stage('coalesced_wait', time.perf_counter() - start_time)
+        # Callers annotate the documents they get; give each its own copies
+        return [dict(doc) for doc in reranked_docs], rerank_info
+
+    async def _aretrieve_once(self, query: str, options: SearchOptions, query_embedding: List[float] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        candidates = options.candidates or settings.TOP_K
+        
+        # The adaptive rerank policy only reads cosine similarities, not fused or BM25 scores
+        cosine_scores = not options.hybrid
+        with span('retrieval'):
+            if options.hybrid:
+                retrieved_docs = await self._ahybrid_search(query, options, candidates, query_embedding)
+            else:
+                retrieved_docs = await self._avector_search(query, options, candidates, query_embedding)
+                
+                if not retrieved_docs:
+                    logger.info("No vector results, trying text search fallback")
+                    FALLBACKS.inc(kind='lexical_search')
+                    retrieved_docs = await self._alexical_search(query, options, candidates)
+                    cosine_scores = False
+        
+        if not retrieved_docs:
+            return [], None
+        
+        rerank_info = None
+        with span('rerank'):
+            if 'rerank_score' not in retrieved_docs[0]:
+                try:
+                    reranked_docs, rerank_info = await self.reranker.arerank_adaptive(query, retrieved_docs, settings.RERANK_TOP_K,
+                                                                                      adaptive=cosine_scores)
+                    RERANK_DECISIONS.inc(decision=rerank_info['decision'])
+                except Exception as rerank_error:
+                    logger.warning(f"Reranking failed, using original order: {rerank_error}")
+                    FALLBACKS.inc(kind='rerank_failed')
+                    reranked_docs = retrieved_docs[:settings.RERANK_TOP_K]
+            else:
+                reranked_docs = retrieved_docs[:settings.RERANK_TOP_K]
+        
+        # Only now, with the final few known, fetch the text vector hits came back without
+        with span('chunk_text'):
+            reranked_docs = await asyncio.to_thread(self.vector_store.fill_texts, reranked_docs)
+        return reranked_docs, rerank_info
+
+    async def _ahybrid_search(self, query: str, options: SearchOptions, candidates: int, query_embedding: List[float] = None) -> List[Dict[str, Any]]:
+        searches = []
+        if options.vector_weight > 0:
+            searches.append(('vector', options.vector_weight, self._avector_search(query, options, candidates, query_embedding)))
+        if options.lexical_weight > 0:
+            searches.append(('lexical', options.lexical_weight, self._alexical_search(query, options, candidates)))
+        
+        results = await asyncio.gather(*(search for _, _, search in searches))
+        fused = reciprocal_rank_fusion(
+            [(source, docs, weight) for (source, weight, _), docs in zip(searches, results)],
+            k=settings.RRF_K
+        )
+        return fused[:candidates]
+
+    def _avector_search(self, query: str, options: SearchOptions, candidates: int, query_embedding: List[float] = None):
+        # The collection is the namespace; the other filters run inside the index rather than on its results
+        return self.vector_store.asimilarity_search(query, candidates, query_embedding,
+                                                    namespace=options.collection or '', filter=options.metadata_filter())
+
+    def _alexical_search(self, query: str, options: SearchOptions, candidates: int):
+        return asyncio.to_thread(self.db.search_text_chunks, query, candidates, options.metadata_filter(include_collection=True))
+
+    def _build_citations(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
+            {
+                'id': doc['id'],
+                'text': doc['text'],
+                'metadata': doc['metadata']
+            }
+            for doc in docs
+        ]
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from typing import List, Dict, Any
+from app.config import settings
+from app.services.answer_cache import AnswerCache
+import threading
+import time
+
+class RerankCache:
+    """Bounded TTL cache of rerank relevance scores.
+
+    A score depends only on the query and the chunk text, and chunk ids are
+    never reused for different text, so entries are keyed by the normalized
+    query and the chunk id.
+    """
+
+    def __init__(self, max_items: int = 50000, ttl_seconds: float = 86400):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, query: str, chunk_ids: List[str]) -> Dict[str, float]:
+        normalized = AnswerCache.normalize(query)
+        now = time.time()
+        scores = {}
+        with self._lock:
+            for chunk_id in chunk_ids:
+                key = (normalized, chunk_id)
+                entry = self._entries.get(key)
+                if entry and entry[1] > now:
+                    self._entries.move_to_end(key)
+                    scores[chunk_id] = entry[0]
+                elif entry:
+                    del self._entries[key]
+            self.hits += len(scores)
+            self.misses += len(chunk_ids) - len(scores)
+        return scores
+
+    def set_many(self, query: str, scores: Dict[str, float]):
+        normalized = AnswerCache.normalize(query)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            for chunk_id, score in scores.items():
+                key = (normalized, chunk_id)
+                self._entries[key] = (score, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'items': len(self._entries)
+            }
+
+
+rerank_cache = RerankCache(settings.RERANK_CACHE_MAX_ITEMS, settings.RERANK_CACHE_TTL_SECONDS)
@@ -1,35 +1,108 @@
 import cohere
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from app.config import settings
+from app.services.rerank_cache import rerank_cache
+from app.services.chunk_store import ChunkStore
+from app.utils.single_flight import SingleFlight
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+RERANK_MODEL = 'rerank-english-v3.0'
+
 class Reranker:
-    def __init__(self):
-        self.co = cohere.Client(settings.COHERE_API_KEY)
+    def __init__(self, async_client: cohere.AsyncClient = None, chunk_store: ChunkStore = None):
+        self.async_co = async_client or cohere.AsyncClient(settings.COHERE_API_KEY)
+        self.cache = rerank_cache
+        # Candidates may arrive without text; only the ones sent to Cohere are looked up
+        self.chunk_store = chunk_store
+        # Identical rerank requests in flight together share one Cohere call
+        self._inflight_scores = SingleFlight('rerank')
+
+    async def arerank(self, query: str, documents: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
+        return (await self.arerank_adaptive(query, documents, top_k))[0]
 
-    def rerank(self, query: str, documents: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
+    async def arerank_adaptive(self, query: str, documents: List[Dict[str, Any]], top_k: int = 5,
+                               adaptive: bool = True) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Rerank with cached scores and the adaptive policy; also returns what was decided."""
+        pool, cached_scores, misses, info = self._plan(query, documents, top_k, adaptive)
+        if info['decision'] == 'skipped':
+            return documents[:top_k], info
         try:
-            texts = [doc['text'] for doc in documents]
-            
-            response = self.co.rerank(
-                model='rerank-english-v3.0',
-                query=query,
-                documents=texts,
-                top_n=top_k
-            )
-            
-            reranked_docs = []
-            for result in response.results:
-                original_doc = documents[result.index]
-                reranked_docs.append({
-                    **original_doc,
-                    'rerank_score': result.relevance_score
-                })
-            
-            return reranked_docs
+            if misses:
+                scores, _ = await self._inflight_scores.do(
+                    (query, tuple(doc['id'] for doc in misses)), lambda: self._ascore(query, misses)
+                )
+                cached_scores.update(scores)
+            return self._merge_results(pool, cached_scores, top_k), info
         except Exception as e:
             logger.error(f"Error in reranking: {e}")
-            # Use original order if reranking fails
-            return documents[:top_k]
+            return documents[:top_k], {**info, 'decision': 'failed'}
+
+    async def _ascore(self, query: str, documents: List[Dict[str, Any]]) -> Dict[str, float]:
+        if self.chunk_store:
+            documents = await asyncio.to_thread(self.chunk_store.fill_texts, documents)
+        if not documents:
+            return {}
+        response = await self.async_co.rerank(
+            model=RERANK_MODEL,
+            query=query,
+            documents=[doc['text'] for doc in documents],
+            top_n=len(documents)
+        )
+        return self._store_scores(query, documents, response)
+
+    def _plan(self, query: str, documents: List[Dict[str, Any]], top_k: int, adaptive: bool = True):
+        """Decide which candidates need a Cohere score.
+
+        Returns the candidate pool, the scores already cached for it, the
+        documents still to send, and a summary of the decision for the response.
+        The skip and shrink thresholds are relative to cosine similarities;
+        callers pass adaptive=False for other scores (RRF, BM25), whose
+        spread says nothing comparable about relevance.
+        """
+        pool = documents
+        decision = 'full'
+        scores = [doc.get('score') for doc in documents]
+        # First-stage scores are sorted descending; only judge them when they are all present and positive
+        if settings.RERANK_ADAPTIVE and adaptive and len(documents) > 1 and all(score is not None for score in scores) and scores[0] > 0:
+            if (scores[0] - scores[1]) / scores[0] >= settings.RERANK_SKIP_MARGIN:
+                decision = 'skipped'
+                pool = []
+            else:
+                keep = sum(1 for score in scores if score >= scores[0] * settings.RERANK_SHRINK_RATIO)
+                if max(keep, top_k) < len(documents):
+                    pool = documents[:max(keep, top_k)]
+                    decision = 'shrunk'
+
+        cached_scores = self.cache.get_many(query, [doc['id'] for doc in pool]) if pool else {}
+        misses = [doc for doc in pool if doc['id'] not in cached_scores]
+        if pool and not misses:
+            decision = 'cached'
+
+        info = {
+            'decision': decision,
+            'candidates': len(documents),
+            'cache_hits': len(cached_scores),
+            'sent': len(misses),
+            # Documents Cohere didn't have to score, and whether the round trip was avoided entirely
+            'saved': len(documents) - len(misses),
+            'round_trip_saved': not misses
+        }
+        return pool, cached_scores, misses, info
+
+    def _store_scores(self, query: str, documents: List[Dict[str, Any]], response) -> Dict[str, float]:
+        scores = {documents[result.index]['id']: result.relevance_score for result in response.results}
+        self.cache.set_many(query, scores)
+        return scores
+
+    def _merge_results(self, documents: List[Dict[str, Any]], scores: Dict[str, float], top_k: int) -> List[Dict[str, Any]]:
+        ranked = sorted(documents, key=lambda doc: scores.get(doc['id'], 0.0), reverse=True)
+        reranked_docs = []
+        for original_doc in ranked[:top_k]:
+            reranked_docs.append({
+                **original_doc,
+                'rerank_score': scores.get(original_doc['id'], 0.0)
+            })
+        return reranked_docs
@@ -1,119 +1,330 @@
 from pinecone import Pinecone, ServerlessSpec
-from openai import OpenAI
-from typing import List, Dict, Any
+from openai import OpenAI, AsyncOpenAI
+from typing import List, Dict, Any, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
 from app.config import settings
+from app.services.embedding_cache import EmbeddingCache
+from app.services.chunk_store import ChunkStore
+from app.services.local_index import LocalVectorIndex
+from app.utils.text_processing import get_encoding
+from app.utils.metrics import span, FALLBACKS
+from app.utils.single_flight import SingleFlight
+from app.utils.retry import with_retries, awith_retries, is_quota_error
+import asyncio
 import uuid
 import logging
-import time
 
 logger = logging.getLogger(__name__)
 
+# Full output size per embedding model
+EMBEDDING_MODEL_DIMENSIONS = {
+    'text-embedding-ada-002': 1536,
+    'text-embedding-3-small': 1536,
+    'text-embedding-3-large': 3072
+}
+# Models that take a dimensions argument and return shortened (still normalised) vectors
+SHORTENABLE_MODELS = {'text-embedding-3-small', 'text-embedding-3-large'}
+
+def embedding_dimension(model: str, dimensions: Optional[int] = None) -> int:
+    """Length of the vectors model returns when asked for dimensions (None: its full size)."""
+    full = EMBEDDING_MODEL_DIMENSIONS.get(model)
+    if dimensions:
+        if model not in SHORTENABLE_MODELS:
+            raise ValueError(f"{model} can't return shortened embeddings; unset EMBEDDING_DIMENSIONS")
+        if dimensions > full:
+            raise ValueError(f"{model} returns at most {full} dimensions, not {dimensions}")
+        return dimensions
+    if full is None:
+        raise ValueError(f"Unknown size of {model} embeddings; set EMBEDDING_DIMENSIONS")
+    return full
+
 class VectorStore:
-    def __init__(self):
+    """Embeddings and vector search against one index, in one embedding space (model and dimensions).
+
+    The model, dimensions, backend and index default to the settings; an
+    index migration builds a second store with other values (see spec()).
+    """
+
+    def __init__(self, openai_client: OpenAI = None, async_openai_client: AsyncOpenAI = None, index=None,
+                 chunk_store: ChunkStore = None, model: str = None, dimensions: Optional[int] = None,
+                 backend: str = None, index_name: str = None, embedding_cache: EmbeddingCache = None):
+        self.model = model or settings.EMBEDDING_MODEL
+        self.dimensions = dimensions if model else settings.EMBEDDING_DIMENSIONS
+        self.dimension = embedding_dimension(self.model, self.dimensions)
+        # Embeddings of one model at two sizes are different vectors; cache them apart
+        self.cache_model = f"{self.model}@{self.dimensions}" if self.dimensions else self.model
+        self.backend = backend or settings.VECTOR_BACKEND
+        self.index_name = index_name or (settings.LOCAL_INDEX_PATH if self.backend == 'local' else settings.PINECONE_INDEX_NAME)
         try:
-            self.pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-            
-            # Create index if needed
-            existing_indexes = self.pc.list_indexes().names()
-            if settings.PINECONE_INDEX_NAME not in existing_indexes:
-                logger.info(f"Creating index: {settings.PINECONE_INDEX_NAME}")
-                self.pc.create_index(
-                    name=settings.PINECONE_INDEX_NAME,
-                    dimension=1536,  # OpenAI ada-002 embedding dimension
-                    metric='cosine',
-                    spec=ServerlessSpec(
-                        cloud='aws',
-                        region='us-east-1'
-                    )
+            if index is not None:
+                # An already-open index (or a stand-in for one); skip the control-plane calls
+                self.pc = None
+                self.index = index
+            elif self.backend == 'local':
+                # In-process index exposing the same calls as a Pinecone Index
+                self.pc = None
+                self.index = LocalVectorIndex(
+                    self.index_name,
+                    dimension=self.dimension,
+                    exact_max=settings.LOCAL_INDEX_EXACT_MAX,
+                    nprobe=settings.LOCAL_INDEX_NPROBE,
+                    quantization=settings.LOCAL_INDEX_QUANTIZATION,
+                    rescore=settings.LOCAL_INDEX_RESCORE
                 )
-                # Wait for index
-                time.sleep(10)
-            
-            self.index = self.pc.Index(settings.PINECONE_INDEX_NAME)
+            else:
+                self.pc = Pinecone(api_key=settings.PINECONE_API_KEY)
+                
+                # Create index if needed
+                existing_indexes = self.pc.list_indexes().names()
+                if self.index_name not in existing_indexes:
+                    logger.info(f"Creating index: {self.index_name} ({self.dimension} dimensions)")
+                    self.pc.create_index(
+                        name=self.index_name,
+                        dimension=self.dimension,
+                        metric='cosine',
+                        spec=ServerlessSpec(
+                            cloud='aws',
+                            region='us-east-1'
+                        ),
+                        # Polls until the index is ready instead of sleeping a fixed time
+                        timeout=60
+                    )
+                
+                else:
+                    existing_dimension = self.pc.describe_index(self.index_name).dimension
+                    if existing_dimension != self.dimension:
+                        raise ValueError(f"Index {self.index_name} holds {existing_dimension}-dimensional vectors, but "
+                                         f"{self.cache_model} embeddings have {self.dimension}; migrate to a new index instead")
+                
+                self.index = self.pc.Index(self.index_name)
         except Exception as e:
-            logger.error(f"Failed to initialize Pinecone: {e}")
+            logger.error(f"Failed to initialize vector index ({self.backend}): {e}")
             raise
-        self.openai_client = OpenAI(
+        self.openai_client = openai_client or OpenAI(
             api_key=settings.OPENAI_API_KEY,
             timeout=60.0,
             max_retries=3
         )
+        self.async_openai_client = async_openai_client or AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            timeout=60.0,
+            max_retries=3
+        )
+        self.cache = embedding_cache or EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MEMORY_ITEMS)
+        # Concurrent requests for the same texts (e.g. one popular question) share one provider call
+        self._inflight_embeddings = SingleFlight('embedding')
+        self.chunk_store = chunk_store or ChunkStore(settings.CHUNK_STORE_PATH, mmap_bytes=settings.CHUNK_STORE_MMAP_BYTES)
+        # Only for batching and truncation; OpenAI's embedding models all use ada-002's cl100k_base,
+        # and older tiktoken releases don't know the text-embedding-3 names
+        self.tokenizer = get_encoding('text-embedding-ada-002')
+        # Sent with every embeddings request; the ada-002 API rejects the argument
+        self._dimensions_arg = {'dimensions': self.dimensions} if self.dimensions else {}
 
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = self.openai_client.embeddings.create(
-                    input=texts,
-                    model="text-embedding-ada-002"
+    def spec(self) -> Dict[str, Any]:
+        """The constructor arguments that select this store's index and embedding space."""
+        return {'backend': self.backend, 'index_name': self.index_name, 'model': self.model, 'dimensions': self.dimensions}
+
+    async def agenerate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        with span('embedding'):
+            embeddings = await asyncio.to_thread(self.cache.get_many, self.cache_model, texts)
+            missing = list(dict.fromkeys(text for text, emb in zip(texts, embeddings) if emb is None))
+            if missing:
+                fetched, _ = await self._inflight_embeddings.do(
+                    (self.cache_model, tuple(missing)), lambda: self._arequest_embeddings(missing)
                 )
-                return [item.embedding for item in response.data]
-            except Exception as e:
-                error_str = str(e).lower()
-                if "quota" in error_str or "insufficient_quota" in error_str:
-                    logger.error(f"OpenAI quota exceeded: {e}")
-                    # Return dummy embeddings for fallback
-                    return [[0.0] * 1536 for _ in texts]
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt
-                    logger.warning(f"Embedding attempt {attempt + 1} failed, retrying in {wait_time}s: {e}")
-                    time.sleep(wait_time)
-                else:
-                    logger.error(f"Error generating embeddings after {max_retries} attempts: {e}")
-                    # Return dummy embeddings as fallback
-                    return [[0.0] * 1536 for _ in texts]
+                await asyncio.to_thread(self._fill_misses, texts, embeddings, missing, fetched)
+            return embeddings
+
+    def _fill_misses(self, texts: List[str], embeddings: List, missing: List[str], fetched: List[List[float]]):
+        by_text = dict(zip(missing, fetched))
+        for i, text in enumerate(texts):
+            if embeddings[i] is None:
+                embeddings[i] = by_text[text]
+        # Never cache the zero-vector fallback
+        real = [(text, emb) for text, emb in by_text.items() if any(emb)]
+        if real:
+            self.cache.set_many(self.cache_model, [t for t, _ in real], [e for _, e in real])
+
+    async def _arequest_embeddings(self, texts: List[str]) -> List[List[float]]:
+        async def request():
+            response = await self.async_openai_client.embeddings.create(input=texts, model=self.model, **self._dimensions_arg)
+            return [item.embedding for item in response.data]
+
+        try:
+            # Retrying can't help once the quota is used up
+            return await awith_retries(request, f"Embedding request for {len(texts)} texts", retry_if=lambda e: not is_quota_error(e))
+        except Exception as e:
+            if is_quota_error(e):
+                logger.error(f"OpenAI quota exceeded: {e}")
+            # Dummy embeddings: search falls back to the lexical index
+            return self._zero_embeddings(texts)
 
-    def store_chunks(self, chunks: List[str], metadata: Dict[str, Any]) -> List[str]:
+    def _zero_embeddings(self, texts: List[str]) -> List[List[float]]:
+        FALLBACKS.inc(len(texts), kind='zero_embedding')
+        return [[0.0] * self.dimension for _ in texts]
+
+    def embed_chunks(self, chunks: List[str], on_progress: Callable[[int, int], None] = None) -> List[List[float]]:
+        """Embed document chunks in token-bounded batches, raising if any batch can't be embedded.
+
+        on_progress(embedded, total) is called after each batch, counting cache hits as embedded.
+        """
+        embeddings = self.cache.get_many(self.cache_model, chunks)
+        missing = list(dict.fromkeys(chunk for chunk, emb in zip(chunks, embeddings) if emb is None))
+        if not missing:
+            if on_progress:
+                on_progress(len(chunks), len(chunks))
+            return embeddings
+
+        batches = self._token_batches(missing)
+        logger.info(f"Embedding {len(missing)} chunks in {len(batches)} batches")
+        embedded = len(chunks) - len(missing)
+        with ThreadPoolExecutor(max_workers=settings.EMBEDDING_CONCURRENCY) as pool:
+            fetched = []
+            for batch_embeddings in pool.map(self._embed_batch, batches):
+                fetched.extend(batch_embeddings)
+                embedded += len(batch_embeddings)
+                if on_progress:
+                    on_progress(embedded, len(chunks))
+
+        self._fill_misses(chunks, embeddings, missing, fetched)
+        return embeddings
+
+    def _token_batches(self, texts: List[str]) -> List[List[str]]:
+        batches, batch, batch_tokens = [], [], 0
+        for text in texts:
+            n_tokens = min(len(self.tokenizer.encode(text, disallowed_special=())), settings.EMBEDDING_MAX_INPUT_TOKENS)
+            if batch and (batch_tokens + n_tokens > settings.EMBEDDING_BATCH_MAX_TOKENS
+                          or len(batch) >= settings.EMBEDDING_BATCH_MAX_INPUTS):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += n_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        inputs = [self._truncate(text) for text in texts]
+
+        def request():
+            response = self.openai_client.embeddings.create(input=inputs, model=self.model, **self._dimensions_arg)
+            return [item.embedding for item in response.data]
+
+        return with_retries(request, f"embedding batch of {len(texts)}")
+
+    def _truncate(self, text: str) -> str:
+        tokens = self.tokenizer.encode(text, disallowed_special=())
+        if len(tokens) <= settings.EMBEDDING_MAX_INPUT_TOKENS:
+            return text
+        return self.tokenizer.decode(tokens[:settings.EMBEDDING_MAX_INPUT_TOKENS])
+
+    def store_chunks(self, chunks: List[str], metadata: Dict[str, Any], on_progress: Callable[[int, int], None] = None,
+                     chunk_metadata: List[Dict[str, Any]] = None, chunk_ids: List[str] = None, namespace: str = '') -> List[str]:
+        """Embed and upsert chunks under chunk_ids (random ids if not given) into namespace; returns the ids.
+
+        Text goes to the chunk store; vectors only carry the (small) metadata.
+        """
         try:
-            embeddings = self.generate_embeddings(chunks)
-            chunk_ids = []
+            with span('embedding'):
+                embeddings = self.embed_chunks(chunks, on_progress)
+            if chunk_ids is None:
+                chunk_ids = [str(uuid.uuid4()) for _ in chunks]
             
             vectors = []
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                chunk_id = str(uuid.uuid4())
-                chunk_ids.append(chunk_id)
-                
+            for i, (chunk_id, chunk, embedding) in enumerate(zip(chunk_ids, chunks, embeddings)):
                 vectors.append({
                     'id': chunk_id,
                     'values': embedding,
                     'metadata': {
+                        'chunk_index': i,
                         **metadata,
-                        'text': chunk,
-                        'chunk_index': i
+                        **(chunk_metadata[i] if chunk_metadata else {})
                     }
                 })
             
-            self.index.upsert(vectors)
+            # Before the upsert, so a chunk is never searchable without its text
+            self.chunk_store.put_many(chunk_ids, chunks)
+            with span('upsert'):
+                self.upsert_vectors(vectors, namespace)
             return chunk_ids
         except Exception as e:
             logger.error(f"Error storing chunks: {e}")
             raise
 
-    def similarity_search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+    def upsert_vectors(self, vectors: List[Dict[str, Any]], namespace: str = ''):
+        batch_size = settings.PINECONE_UPSERT_BATCH_SIZE
+        batches = [vectors[i:i + batch_size] for i in range(0, len(vectors), batch_size)]
+
+        def upsert(batch):
+            return with_retries(lambda: self.index.upsert(vectors=batch, namespace=namespace), f"upsert of {len(batch)} vectors")
+
+        try:
+            with ThreadPoolExecutor(max_workers=settings.PINECONE_UPSERT_CONCURRENCY) as pool:
+                list(pool.map(upsert, batches))
+        except Exception:
+            # Don't leave half a document searchable; the caller falls back to text storage
+            self.delete_vectors([vector['id'] for vector in vectors], namespace)
+            raise
+
+    def update_metadata(self, updates: Dict[str, Dict[str, Any]], namespace: str = ''):
+        """Change the metadata of stored vectors in place, without re-embedding or re-upserting them."""
+        def update(item):
+            chunk_id, metadata = item
+            return with_retries(lambda: self.index.update(id=chunk_id, set_metadata=metadata, namespace=namespace),
+                                      f"metadata update of {chunk_id}")
+
+        with ThreadPoolExecutor(max_workers=settings.PINECONE_UPSERT_CONCURRENCY) as pool:
+            list(pool.map(update, updates.items()))
+
+    def delete_vectors(self, ids: List[str], namespace: str = '', keep_texts: bool = False):
+        """Delete vectors from namespace, and their chunk texts unless keep_texts (the chunks moved elsewhere)."""
+        for start in range(0, len(ids), 1000):
+            try:
+                self.index.delete(ids=ids[start:start + 1000], namespace=namespace)
+            except Exception as e:
+                logger.warning(f"Could not delete {len(ids[start:start + 1000])} vectors: {e}")
+        if not keep_texts:
+            self.chunk_store.delete_many(ids)
+
+    async def asimilarity_search(self, query: str, top_k: int = 10, query_embedding: List[float] = None,
+                                 namespace: str = '', filter: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Nearest chunks within namespace, restricted by a Pinecone metadata filter in the index itself."""
         try:
-            query_embedding = self.generate_embeddings([query])[0]
+            if query_embedding is None:
+                query_embedding = (await self.agenerate_embeddings([query]))[0]
             
-            # Check for dummy embeddings
             if all(x == 0.0 for x in query_embedding):
                 logger.warning("Using fallback search")
-                # No results available
                 return []
             
-            results = self.index.query(
-                vector=query_embedding,
-                top_k=top_k,
-                include_metadata=True
-            )
+            # The Pinecone client is synchronous; keep it off the event loop
+            with span('vector_search'):
+                results = await asyncio.to_thread(
+                    self.index.query,
+                    vector=query_embedding,
+                    top_k=top_k,
+                    include_metadata=True,
+                    namespace=namespace,
+                    filter=filter
+                )
             
-            return [
-                {
-                    'id': match['id'],
-                    'score': match['score'],
-                    'text': match['metadata']['text'],
-                    'metadata': match['metadata']
-                }
-                for match in results['matches']
-            ]
+            return self._format_matches(results)
         except Exception as e:
             logger.error(f"Error in similarity search: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    def _format_matches(self, results) -> List[Dict[str, Any]]:
+        # Vectors upserted before the chunk store existed still carry their text; newer ones
+        # come back with text None, to be filled from the chunk store once the candidates are known
+        return [
+            {
+                'id': match['id'],
+                'score': match['score'],
+                'text': match['metadata'].get('text'),
+                'metadata': {key: value for key, value in match['metadata'].items() if key != 'text'}
+            }
+            for match in results['matches']
+        ]
+
+    def fill_texts(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return self.chunk_store.fill_texts(docs)
\ No newline at end of file
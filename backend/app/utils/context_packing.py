@@ -0,0 +1,159 @@
+from collections import defaultdict
+from typing import List, Dict, Any, Optional
+from app.utils.text_processing import get_encoding
+
+# Tokens for the "[n] " label and the blank line between passages
+PASSAGE_OVERHEAD_TOKENS = 4
+# Shortest overlap between two offset-less chunks that counts as the same span
+MIN_TEXT_OVERLAP = 50
+
+def pack_context(docs: List[Dict[str, Any]], max_tokens: int, min_passage_tokens: int = 100,
+                 model: str = "gpt-3.5-turbo") -> List[Dict[str, Any]]:
+    """Merge overlapping chunks and fit them into max_tokens.
+
+    docs are in rank order. Chunks of the same document that overlap (or are
+    consecutive) become one passage covering their combined span, ranked as
+    its best member, so no text is sent twice. Passages are then kept in rank
+    order until the budget runs out; the passage that crosses it is truncated
+    if at least min_passage_tokens fit, and everything ranked below is
+    dropped. Each returned doc is one numbered context passage and one
+    citation; merged passages list their chunk ids in metadata['chunk_ids'].
+    """
+    encoding = get_encoding(model)
+    packed = []
+    remaining = max_tokens
+    for passage in merge_passages(docs):
+        tokens = encoding.encode_ordinary(passage['text'])
+        available = remaining - PASSAGE_OVERHEAD_TOKENS
+        if len(tokens) <= available:
+            packed.append(passage)
+            remaining = available - len(tokens)
+            continue
+        if available >= min_passage_tokens or not packed:
+            packed.append({**passage, 'text': encoding.decode(tokens[:max(available, 0)]), 'truncated': True})
+        break
+    return packed
+
+def merge_passages(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    groups = defaultdict(list)
+    for rank, doc in enumerate(docs):
+        groups[_source_key(doc)].append({'rank': rank, 'docs': [(rank, doc)], 'text': doc['text'], **_span(doc)})
+
+    passages = []
+    for key, members in groups.items():
+        passages.extend(_merge_group(members) if key is not None else _dedupe(members))
+    passages.sort(key=lambda passage: passage['rank'])
+    return [_to_doc(passage) for passage in passages]
+
+def _source_key(doc: Dict[str, Any]) -> Optional[tuple]:
+    metadata = doc.get('metadata') or {}
+    if 'document_key' in metadata:
+        return (metadata['document_key'],)
+    if 'filename' not in metadata:
+        return None
+    # Chunks stored before documents had keys
+    return metadata['filename'], metadata.get('total_chunks')
+
+def _span(doc: Dict[str, Any]) -> Dict[str, Any]:
+    metadata = doc.get('metadata') or {}
+    index = metadata.get('chunk_index')
+    return {
+        'start': metadata.get('char_start'),
+        'end': metadata.get('char_end'),
+        'first_index': index,
+        'last_index': index
+    }
+
+def _merge_group(members: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Repeat until stable: a merge can bridge two passages that didn't touch before
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(members)):
+            for j in range(i + 1, len(members)):
+                combined = _merge_pair(members[i], members[j]) or _merge_pair(members[j], members[i])
+                if combined:
+                    members[i] = combined
+                    del members[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return members
+
+def _merge_pair(first: Dict[str, Any], second: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Combine second into first if second continues first in the document."""
+    if first['text'] == second['text'] or second['text'] in first['text']:
+        text, start, end = first['text'], first['start'], first['end']
+    elif first['start'] is not None and second['start'] is not None:
+        if not (first['start'] <= second['start'] <= first['end']):
+            if not _consecutive(first, second):
+                return None
+            text = first['text'] + "\n" + second['text']
+        else:
+            offset = second['start'] - first['start']
+            shared = len(first['text']) - offset
+            checked = min(shared, len(second['text']))
+            # Same filename isn't proof of the same document; the shared span must match too
+            if first['text'][offset:offset + checked] != second['text'][:checked]:
+                return None
+            text = first['text'] + second['text'][shared:]
+        start, end = first['start'], max(first['end'], second['end'])
+    else:
+        shared = _text_overlap(first['text'], second['text'])
+        if not shared:
+            return None
+        text, start, end = first['text'] + second['text'][shared:], None, None
+
+    indexes = [index for index in (first['first_index'], first['last_index'], second['first_index'], second['last_index']) if index is not None]
+    return {
+        'rank': min(first['rank'], second['rank']),
+        'docs': first['docs'] + second['docs'],
+        'text': text,
+        'start': start,
+        'end': end,
+        'first_index': min(indexes) if indexes else None,
+        'last_index': max(indexes) if indexes else None
+    }
+
+def _consecutive(first: Dict[str, Any], second: Dict[str, Any]) -> bool:
+    return (first['last_index'] is not None and second['first_index'] is not None
+            and second['first_index'] == first['last_index'] + 1 and second['start'] > first['end'])
+
+def _text_overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of first that is a prefix of second (0 if under MIN_TEXT_OVERLAP)."""
+    probe = second[:MIN_TEXT_OVERLAP]
+    if len(probe) < MIN_TEXT_OVERLAP:
+        return 0
+    position = first.find(probe)
+    while position != -1:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(probe, position + 1)
+    return 0
+
+def _dedupe(members: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    by_text = {}
+    for member in members:
+        existing = by_text.get(member['text'])
+        if existing:
+            existing['docs'].extend(member['docs'])
+        else:
+            by_text[member['text']] = member
+    return list(by_text.values())
+
+def _to_doc(passage: Dict[str, Any]) -> Dict[str, Any]:
+    members = [doc for _, doc in sorted(passage['docs'], key=lambda item: item[0])]
+    best = members[0]
+    if len(members) == 1:
+        return best
+    metadata = dict(best.get('metadata') or {})
+    if passage['start'] is not None:
+        metadata['char_start'] = passage['start']
+        metadata['char_end'] = passage['end']
+    pages = [doc['metadata'][key] for doc in members for key in ('page_start', 'page_end') if key in (doc.get('metadata') or {})]
+    if pages:
+        metadata['page_start'] = min(pages)
+        metadata['page_end'] = max(pages)
+    metadata['chunk_ids'] = [doc['id'] for doc in members]
+    return {**best, 'text': passage['text'], 'metadata': metadata}
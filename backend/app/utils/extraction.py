@@ -0,0 +1,110 @@
+from concurrent.futures import Executor
+from typing import Iterator, List, Tuple, Optional
+from app.config import settings
+import io
+import os
+import tempfile
+
+class ExtractionError(Exception):
+    pass
+
+class UnsupportedFileTypeError(ExtractionError):
+    pass
+
+class ExtractorUnavailableError(ExtractionError):
+    pass
+
+def iter_pages(file_content: bytes, filename: str, pool: Optional[Executor] = None) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) pairs as each page is extracted.
+
+    PDFs are split into page ranges and extracted on pool when one is given;
+    DOCX pages follow the page breaks Word rendered; plain text is one page.
+    """
+    name = filename.lower()
+    if name.endswith('.pdf'):
+        return iter_pdf_pages(file_content, pool)
+    if name.endswith('.docx'):
+        return iter_docx_pages(file_content)
+    if name.endswith(('.txt', '.md')):
+        return iter([(1, _decode(file_content))])
+    raise UnsupportedFileTypeError(f"Unsupported file type: {filename}")
+
+def extract_text_from_file(file_content: bytes, filename: str) -> str:
+    return "\n".join(text for _, text in iter_pages(file_content, filename))
+
+def _decode(file_content: bytes) -> str:
+    try:
+        return file_content.decode('utf-8')
+    except UnicodeDecodeError:
+        return file_content.decode('utf-8', errors='ignore')
+
+def _pdf_reader_class():
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        try:
+            from PyPDF2 import PdfReader
+        except ImportError:
+            raise ExtractorUnavailableError("PDF processing unavailable: install pypdf")
+    return PdfReader
+
+def iter_pdf_pages(file_content: bytes, pool: Optional[Executor] = None) -> Iterator[Tuple[int, str]]:
+    PdfReader = _pdf_reader_class()
+    try:
+        page_count = len(PdfReader(io.BytesIO(file_content)).pages)
+    except Exception as e:
+        raise ExtractionError(f"Could not read PDF: {e}") from e
+
+    if pool is None:
+        reader = PdfReader(io.BytesIO(file_content))
+        for number, page in enumerate(reader.pages, 1):
+            yield number, _page_text(page, number)
+        return
+
+    # Workers read the PDF from a temp file rather than having the bytes pickled into every task
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(file_content)
+        step = settings.PDF_PAGES_PER_TASK
+        futures = [pool.submit(_extract_pdf_range, path, start, min(start + step, page_count))
+                   for start in range(0, page_count, step)]
+        try:
+            for start, future in zip(range(0, page_count, step), futures):
+                for offset, text in enumerate(future.result()):
+                    yield start + offset + 1, text
+        finally:
+            for future in futures:
+                future.cancel()
+    finally:
+        os.unlink(path)
+
+def _extract_pdf_range(path: str, start: int, end: int) -> List[str]:
+    reader = _pdf_reader_class()(path)
+    return [_page_text(reader.pages[i], i + 1) for i in range(start, end)]
+
+def _page_text(page, number: int) -> str:
+    try:
+        return page.extract_text() or ""
+    except Exception as e:
+        raise ExtractionError(f"Could not extract page {number}: {e}") from e
+
+def iter_docx_pages(file_content: bytes) -> Iterator[Tuple[int, str]]:
+    try:
+        from docx import Document
+    except ImportError:
+        raise ExtractorUnavailableError("DOCX processing unavailable: install python-docx")
+    try:
+        doc = Document(io.BytesIO(file_content))
+    except Exception as e:
+        raise ExtractionError(f"Could not read DOCX: {e}") from e
+
+    page, lines = 1, []
+    for paragraph in doc.paragraphs:
+        # Word records where it last rendered page breaks; documents never opened in Word have none
+        if paragraph.contains_page_break and lines:
+            yield page, "\n".join(lines)
+            page, lines = page + 1, []
+        lines.append(paragraph.text)
+    if lines:
+        yield page, "\n".join(lines)
@@ -0,0 +1,21 @@
+from typing import List, Dict, Any, Tuple
+
+def reciprocal_rank_fusion(ranked_lists: List[Tuple[str, List[Dict[str, Any]], float]], k: int = 60) -> List[Dict[str, Any]]:
+    """Merge ranked result lists with weighted RRF: score(d) = sum(w / (k + rank)).
+
+    ranked_lists holds (source, docs, weight) triples. Each fused doc keeps the
+    first copy seen, its fused score in 'score' and each source's original
+    score under '<source>_score'.
+    """
+    fused = {}
+    for source, docs, weight in ranked_lists:
+        for rank, doc in enumerate(docs, 1):
+            entry = fused.get(doc['id'])
+            if entry is None:
+                entry = fused[doc['id']] = {**doc, 'score': 0.0}
+            elif entry.get('text') is None:
+                # Vector hits may come without text; a lexical hit for the same chunk has it
+                entry['text'] = doc.get('text')
+            entry['score'] += weight / (k + rank)
+            entry[f'{source}_score'] = doc['score']
+    return sorted(fused.values(), key=lambda doc: doc['score'], reverse=True)
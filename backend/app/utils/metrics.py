@@ -0,0 +1,173 @@
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import List, Dict, Any, Tuple, Optional
+from app.config import settings
+import bisect
+import threading
+import time
+
+# Seconds; covers cache hits (sub-millisecond) through slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Per label set: [per-bucket counts (+Inf last), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:g}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_counter(name: str, help_text: str, labelnames: Tuple[str, ...], samples: List[Tuple[Tuple[str, ...], float]]) -> List[str]:
+    """Render counter samples kept elsewhere (e.g. a cache's own hit counts)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    for key, value in samples:
+        lines.append(f"{name}{_labels(labelnames, key)} {value:g}")
+    return lines
+
+
+STAGE_LATENCY = Histogram('minirag_stage_seconds', 'Time spent in each pipeline stage', ('operation', 'stage'))
+OPERATION_LATENCY = Histogram('minirag_operation_seconds', 'End-to-end time of traced operations', ('operation',))
+TOKENS = Counter('minirag_llm_tokens_total', 'LLM tokens used', ('type',))
+FALLBACKS = Counter('minirag_fallbacks_total', 'Times a degraded path was taken', ('kind',))
+RERANK_DECISIONS = Counter('minirag_rerank_decisions_total', 'Adaptive rerank outcomes', ('decision',))
+COALESCED = Counter('minirag_coalesced_total', 'Calls that joined an identical call already in flight instead of running their own', ('kind',))
+
+METRICS = [STAGE_LATENCY, OPERATION_LATENCY, TOKENS, FALLBACKS, RERANK_DECISIONS, COALESCED]
+
+def render_metrics() -> List[str]:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return lines
+
+def record_token_usage(token_usage: Dict[str, Any]):
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        if token_usage.get(kind):
+            TOKENS.inc(token_usage[kind], type=kind.split('_')[0])
+
+
+class Trace:
+    """Stage timings for one operation, e.g. a query or an ingested document."""
+
+    __slots__ = ('operation', 'timings', 'started')
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.timings = {}
+        self.started = time.perf_counter()
+
+    def finish(self) -> Dict[str, float]:
+        total = time.perf_counter() - self.started
+        OPERATION_LATENCY.observe(total, operation=self.operation)
+        return {**self.timings, 'total': total}
+
+class _Span:
+    __slots__ = ('trace', 'stage', 'start')
+
+    def __init__(self, trace: Trace, stage: str):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        timings = self.trace.timings
+        # Stages can repeat or run concurrently (hybrid search); report their summed time
+        timings[self.stage] = timings.get(self.stage, 0.0) + elapsed
+        STAGE_LATENCY.observe(elapsed, operation=self.trace.operation, stage=self.stage)
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+_current_trace = ContextVar('current_trace', default=None)
+
+def start_trace(operation: str) -> Optional[Trace]:
+    """Begin tracing for the rest of the current task or thread; None when tracing is off.
+
+    asyncio tasks and asyncio.to_thread calls started afterwards inherit the trace.
+    """
+    trace = Trace(operation) if settings.TRACING_ENABLED else None
+    _current_trace.set(trace)
+    return trace
+
+def span(stage: str):
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, stage)
+
+def record_stage(stage: str, seconds: float):
+    """Record a stage measured elsewhere (e.g. reported by a streaming API)."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    trace.timings[stage] = trace.timings.get(stage, 0.0) + seconds
+    STAGE_LATENCY.observe(seconds, operation=trace.operation, stage=stage)
+
+def finish_trace(trace: Optional[Trace]) -> Dict[str, float]:
+    return trace.finish() if trace else {}
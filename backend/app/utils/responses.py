@@ -0,0 +1,38 @@
+from typing import Any, Iterable
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+import orjson
+
+def dumps(content: Any) -> bytes:
+    # Scores and vectors can be NumPy values; anything else orjson doesn't know (ObjectId, ...) becomes a string
+    return orjson.dumps(content, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson.
+
+    Routes return it with plain dicts, which also skips FastAPI validating
+    and re-encoding the result through the response_model (still used for
+    the OpenAPI schema).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class GZipPathsMiddleware:
+    """Starlette's GZipMiddleware, for the given paths only.
+
+    Answers with citations compress several-fold, while streamed answers
+    must not be held back in a compressor and the other routes are small.
+    """
+
+    def __init__(self, app: ASGIApp, paths: Iterable[str], minimum_size: int = 1000, compresslevel: int = 6):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] == 'http' and scope['path'] in self.paths:
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,41 @@
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+RETRY_ATTEMPTS = 3
+
+def is_quota_error(error: Exception) -> bool:
+    # OpenAI reports an exhausted quota as a 429 like a rate limit, but waiting doesn't help
+    return "quota" in str(error).lower()
+
+def with_retries(fn: Callable[[], Any], description: str, attempts: int = RETRY_ATTEMPTS,
+                 retry_if: Optional[Callable[[Exception], bool]] = None) -> Any:
+    """Call fn, retrying failures with exponential backoff (1s, 2s, ...); the last error is raised."""
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            time.sleep(_backoff(description, attempt, attempts, e, retry_if))
+
+async def awith_retries(fn: Callable[[], Awaitable[Any]], description: str, attempts: int = RETRY_ATTEMPTS,
+                        retry_if: Optional[Callable[[Exception], bool]] = None) -> Any:
+    """with_retries for a coroutine function; waits without blocking the event loop."""
+    for attempt in range(attempts):
+        try:
+            return await fn()
+        except Exception as e:
+            await asyncio.sleep(_backoff(description, attempt, attempts, e, retry_if))
+
+def _backoff(description: str, attempt: int, attempts: int, error: Exception,
+             retry_if: Optional[Callable[[Exception], bool]]) -> float:
+    if retry_if and not retry_if(error):
+        raise error
+    if attempt == attempts - 1:
+        logger.error(f"{description} failed after {attempts} attempts: {error}")
+        raise error
+    wait_time = 2 ** attempt
+    logger.warning(f"{description} attempt {attempt + 1} failed, retrying in {wait_time}s: {error}")
+    return wait_time
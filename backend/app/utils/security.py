@@ -2,6 +2,8 @@ import re
 from datetime import datetime, timezone
 
 ALLOWED_EXTENSIONS = {'.txt', '.md', '.pdf', '.docx'}
+# Collection names double as vector index namespaces
+COLLECTION_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
 
 def clean_for_log(text):
     if not text:
@@ -15,5 +17,14 @@ def is_valid_file(filename):
     ext = '.' + filename.lower().split('.')[-1]
     return ext in ALLOWED_EXTENSIONS
 
+def is_valid_collection(name):
+    return bool(name) and COLLECTION_PATTERN.match(name) is not None
+
 def utc_now():
-    return datetime.now(timezone.utc)
\ No newline at end of file
+    return datetime.now(timezone.utc)
+
+def epoch_seconds(value):
+    # pymongo returns naive datetimes, in UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
\ No newline at end of file
@@ -0,0 +1,65 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+from app.utils.metrics import COALESCED
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+class SingleFlight:
+    """Coalesces concurrent identical async calls into one execution.
+
+    The first caller for a key starts fn() as its own task; callers arriving
+    with the same key before it finishes await that task instead of starting
+    another, and all of them get its result or its exception. The key is
+    forgotten as soon as the task finishes, so later calls run afresh
+    (caching results is up to the caller).
+
+    A cancelled caller only stops waiting; the shared call is cancelled once
+    every caller waiting on it has been.
+    """
+
+    def __init__(self, kind: str):
+        # Label on the coalesced-calls counter, e.g. 'query' or 'embedding'
+        self.kind = kind
+        # (event loop, key) -> [task, callers waiting on it]
+        self._calls: Dict[Tuple[Any, Hashable], list] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Return fn()'s result and whether this caller joined a call already in flight."""
+        call_key = (asyncio.get_running_loop(), key)
+        call = self._calls.get(call_key)
+        joined = call is not None
+        if joined:
+            COALESCED.inc(kind=self.kind)
+        else:
+            task = asyncio.ensure_future(fn())
+            call = self._calls[call_key] = [task, 0]
+            task.add_done_callback(lambda done: self._finished(call_key, done))
+
+        task = call[0]
+        call[1] += 1
+        try:
+            return await asyncio.shield(task), joined
+        except asyncio.CancelledError:
+            if task.cancelled():
+                raise
+            call[1] -= 1
+            if call[1] == 0 and not task.done():
+                logger.debug(f"Every caller of in-flight {self.kind} call went away; cancelling it")
+                # Forget it first, so a caller arriving before the task finishes starts afresh instead of joining it
+                if self._calls.get(call_key) is call:
+                    del self._calls[call_key]
+                task.cancel()
+            raise
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def _finished(self, call_key, task: asyncio.Task):
+        if self._calls.get(call_key, [None])[0] is task:
+            del self._calls[call_key]
+        # Mark the exception retrieved even if every caller was cancelled before it arrived
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,19 @@
+from typing import List, Sequence
+import sqlite3
+
+# SQLite caps the number of bound parameters per statement
+SQLITE_MAX_PARAMS = 500
+
+def fetch_in(conn: sqlite3.Connection, query: str, values: Sequence) -> List[tuple]:
+    """Rows of query for any number of values; '{placeholders}' in it marks the IN (...) list."""
+    rows = []
+    for start in range(0, len(values), SQLITE_MAX_PARAMS):
+        batch = list(values[start:start + SQLITE_MAX_PARAMS])
+        rows.extend(conn.execute(query.format(placeholders=",".join("?" * len(batch))), batch).fetchall())
+    return rows
+
+def execute_in(conn: sqlite3.Connection, statement: str, values: Sequence):
+    """Run statement once per batch of values, like fetch_in; the caller commits."""
+    for start in range(0, len(values), SQLITE_MAX_PARAMS):
+        batch = list(values[start:start + SQLITE_MAX_PARAMS])
+        conn.execute(statement.format(placeholders=",".join("?" * len(batch))), batch)
@@ -1,70 +1,208 @@
 import tiktoken
-from typing import List
-import io
+from functools import lru_cache
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+import re
+
+# Blank lines, sentence ends and line breaks; each match is the whitespace after a boundary
+# (CJK sentence ends need none, so their match may be empty)
+BOUNDARY_PATTERN = re.compile(r'\n\s*\n\s*|(?<=[.!?])\s+|(?<=[。！？])\s*|\n\s*')
+WORD_PATTERN = re.compile(r'\S+\s*')
+ENCODE_BATCH_SIZE = 1024
+# Only back up to a paragraph break if the chunk would still be at least this full
+MIN_PARAGRAPH_FILL = 0.5
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-3.5-turbo"):
+    return tiktoken.encoding_for_model(model)
 
 def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(text))
+    return len(get_encoding(model).encode_ordinary(text))
 
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 150) -> List[str]:
-    words = text.split()
-    chunks = []
-    
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i + chunk_size])
-        if chunk.strip():
-            chunks.append(chunk)
-        
-        if i + chunk_size >= len(words):
+    return [chunk['text'] for chunk in chunk_text_with_offsets(text, chunk_size, overlap)]
+
+def chunk_text_with_offsets(text: str, chunk_size: int = 1000, overlap: int = 150) -> List[Dict[str, Any]]:
+    """Split text into chunks of at most chunk_size tokens, cut at sentence or paragraph ends.
+
+    Each chunk is {'text', 'start', 'end', 'token_count'} with text == source[start:end].
+    Consecutive chunks share whole trailing sentences totalling at most overlap tokens.
+    """
+    return list(pack_segments(iter_segments(text, chunk_size), chunk_size, overlap))
+
+def chunk_pages(pages: Iterable[Tuple[int, str]], chunk_size: int = 1000, overlap: int = 150) -> Iterator[Dict[str, Any]]:
+    """Chunk (page_number, text) pairs lazily, as pages arrive.
+
+    Offsets refer to the pages joined with newlines, and each chunk also
+    records 'page_start' and 'page_end'.
+    """
+    def segments():
+        offset, last = 0, None
+        for page, text in pages:
+            for segment in iter_segments(text, chunk_size, offset):
+                segment['page'] = page
+                if last:
+                    yield last
+                last = segment
+            if last:
+                # The newline joining this page to the next belongs to the text too, or the pages' words fuse
+                last = _with_page_break(last)
+            offset += len(text) + 1
+        if last:
+            yield last
+    return pack_segments(segments(), chunk_size, overlap)
+
+def _with_page_break(segment: Dict[str, Any]) -> Dict[str, Any]:
+    text = segment['text'] + "\n"
+    return {**segment, 'text': text, 'end': segment['end'] + 1, 'paragraph_end': True,
+            'tokens': len(get_encoding().encode_ordinary(text))}
+
+def iter_segments(text: str, max_tokens: int, base_offset: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield sentence/line segments of text with absolute offsets and token counts.
+
+    Segments longer than max_tokens are split further at word boundaries,
+    and words longer than that (text without spaces) by characters.
+    """
+    encoding = get_encoding()
+    pending = []
+
+    def flush():
+        counts = encoding.encode_ordinary_batch([segment['text'] for segment in pending])
+        for segment, tokens in zip(pending, counts):
+            segment['tokens'] = len(tokens)
+            if segment['tokens'] > max_tokens:
+                yield from _split_segment(segment, max_tokens)
+            else:
+                yield segment
+        pending.clear()
+
+    position = 0
+    for match in BOUNDARY_PATTERN.finditer(text):
+        pending.append(_segment(text, position, match.end(), base_offset, match.group().count('\n') >= 2))
+        position = match.end()
+        if len(pending) >= ENCODE_BATCH_SIZE:
+            yield from flush()
+    if position < len(text):
+        pending.append(_segment(text, position, len(text), base_offset, True))
+    if pending:
+        yield from flush()
+
+def _segment(text: str, start: int, end: int, base_offset: int, paragraph_end: bool) -> Dict[str, Any]:
+    return {
+        'text': text[start:end],
+        'start': base_offset + start,
+        'end': base_offset + end,
+        'paragraph_end': paragraph_end
+    }
+
+def _split_segment(segment: Dict[str, Any], max_tokens: int) -> Iterator[Dict[str, Any]]:
+    words = [(match.start(), match.end()) for match in WORD_PATTERN.finditer(segment['text'])]
+    counts = get_encoding().encode_ordinary_batch([segment['text'][start:end] for start, end in words])
+    piece_start, piece_tokens = 0, 0
+    for (start, end), tokens in zip(words, counts):
+        if len(tokens) > max_tokens:
+            if piece_tokens:
+                yield _piece(segment, piece_start, start, piece_tokens, False)
+            pieces = _split_unbroken(segment['text'][start:end], max_tokens)
+            for sub_start, sub_end, sub_tokens in pieces[:-1]:
+                yield _piece(segment, start + sub_start, start + sub_end, sub_tokens, False)
+            # The last piece can still take the words that follow
+            piece_start, piece_tokens = start + pieces[-1][0], pieces[-1][2]
+            continue
+        if piece_tokens and piece_tokens + len(tokens) > max_tokens:
+            yield _piece(segment, piece_start, start, piece_tokens, False)
+            piece_start, piece_tokens = start, 0
+        piece_tokens += len(tokens)
+    yield _piece(segment, piece_start, len(segment['text']), piece_tokens, segment['paragraph_end'])
+
+def _split_unbroken(text: str, max_tokens: int) -> List[Tuple[int, int, int]]:
+    """Cut text with nowhere to break it (CJK, base64, long URLs) into (start, end, tokens) pieces of at most max_tokens."""
+    encoding = get_encoding()
+    pieces = []
+    start, chars_per_token = 0, 4.0
+    while start < len(text):
+        size = min(len(text) - start, max(1, int(max_tokens * chars_per_token)))
+        tokens = len(encoding.encode_ordinary(text[start:start + size]))
+        while tokens > max_tokens and size > 1:
+            size = max(1, min(size - 1, int(size * max_tokens / tokens)))
+            tokens = len(encoding.encode_ordinary(text[start:start + size]))
+        pieces.append((start, start + size, tokens))
+        # Size the next piece by this text's own density
+        chars_per_token = size / max(tokens, 1)
+        start += size
+    return pieces
+
+def _piece(segment: Dict[str, Any], start: int, end: int, tokens: int, paragraph_end: bool) -> Dict[str, Any]:
+    return {
+        **segment,
+        'text': segment['text'][start:end],
+        'start': segment['start'] + start,
+        'end': segment['start'] + end,
+        'tokens': tokens,
+        'paragraph_end': paragraph_end
+    }
+
+def pack_segments(segments: Iterable[Dict[str, Any]], chunk_size: int, overlap: int) -> Iterator[Dict[str, Any]]:
+    """Greedily pack contiguous segments into chunks; runs in time linear in the input."""
+    current = []
+    current_tokens = 0
+    for segment in segments:
+        if current and current_tokens + segment['tokens'] > chunk_size:
+            cut = _cut_index(current, current_tokens, segment['tokens'], chunk_size)
+            emitted, rest = current[:cut], current[cut:]
+            chunk = _make_chunk(emitted)
+            if chunk:
+                yield chunk
+
+            rest_tokens = sum(s['tokens'] for s in rest)
+            carry = _overlap_tail(emitted, overlap)
+            if sum(s['tokens'] for s in carry) + rest_tokens + segment['tokens'] > chunk_size:
+                carry = []
+            current = carry + rest
+            current_tokens = sum(s['tokens'] for s in current)
+
+        current.append(segment)
+        current_tokens += segment['tokens']
+
+    if current:
+        chunk = _make_chunk(current)
+        if chunk:
+            yield chunk
+
+def _cut_index(current: List[Dict[str, Any]], current_tokens: int, next_tokens: int, chunk_size: int) -> int:
+    # Prefer ending on the last paragraph break, as long as the chunk stays reasonably
+    # full and the leftover segments still fit alongside the next one
+    kept = current_tokens
+    for i in range(len(current) - 1, 0, -1):
+        kept -= current[i]['tokens']
+        if kept < chunk_size * MIN_PARAGRAPH_FILL:
             break
-    
-    return chunks
-
-def extract_text_from_pdf(file_content: bytes) -> str:
-    try:
-        from pypdf import PdfReader
-        reader = PdfReader(io.BytesIO(file_content))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text.strip()
-    except ImportError:
-        try:
-            import PyPDF2
-            reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text.strip()
-        except ImportError:
-            return "PDF processing unavailable"
-    except Exception as e:
-        return f"PDF error: {str(e)}"
-
-def extract_text_from_docx(file_content: bytes) -> str:
-    try:
-        from docx import Document
-        doc = Document(io.BytesIO(file_content))
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
-    except ImportError:
-        return "DOCX processing unavailable"
-    except Exception as e:
-        return f"DOCX error: {str(e)}"
-
-def extract_text_from_file(file_content: bytes, filename: str) -> str:
-    ext = filename.lower()
-    
-    if ext.endswith('.pdf'):
-        return extract_text_from_pdf(file_content)
-    elif ext.endswith('.docx'):
-        return extract_text_from_docx(file_content)
-    elif ext.endswith(('.txt', '.md')):
-        return file_content.decode('utf-8')
-    else:
-        try:
-            return file_content.decode('utf-8')
-        except UnicodeDecodeError:
-            return file_content.decode('utf-8', errors='ignore')
\ No newline at end of file
+        if current[i - 1]['paragraph_end'] and current_tokens - kept + next_tokens <= chunk_size:
+            return i
+    return len(current)
+
+def _overlap_tail(segments: List[Dict[str, Any]], overlap: int) -> List[Dict[str, Any]]:
+    tail_tokens = 0
+    i = len(segments)
+    # Never carry a whole chunk forward
+    while i > 1 and tail_tokens + segments[i - 1]['tokens'] <= overlap:
+        i -= 1
+        tail_tokens += segments[i]['tokens']
+    return segments[i:]
+
+def _make_chunk(segments: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    raw = "".join(segment['text'] for segment in segments)
+    text = raw.strip()
+    if not text:
+        return None
+    leading = len(raw) - len(raw.lstrip())
+    trailing = len(raw) - len(raw.rstrip())
+    chunk = {
+        'text': text,
+        'start': segments[0]['start'] + leading,
+        'end': segments[-1]['end'] - trailing,
+        'token_count': sum(segment['tokens'] for segment in segments)
+    }
+    if 'page' in segments[0]:
+        chunk['page_start'] = segments[0]['page']
+        chunk['page_end'] = segments[-1]['page']
+    return chunk
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Batch query benchmark.
+
+Sends the same questions through RAGPipeline.aquery one at a time (how the
+evaluation jobs call /api/query) and through RAGPipeline.abatch_query in
+batches, and reports throughput, CPU time per query and the number of
+embedding round trips. Backends are the sleeping stand-ins from
+bench_concurrency, so no API keys are needed.
+
+    python -m benchmarks.bench_batch --queries 200 --batch-size 50
+"""
+import argparse
+import asyncio
+import time
+
+from app.config import settings
+from benchmarks.bench_concurrency import SleepyVectorStore, build_pipeline
+
+
+class CountingVectorStore(SleepyVectorStore):
+    def __init__(self):
+        self.embedding_calls = 0
+
+    async def agenerate_embeddings(self, texts):
+        self.embedding_calls += 1
+        return await super().agenerate_embeddings(texts)
+
+
+async def run(pipeline, mode, questions, batch_size):
+    pipeline.answer_cache.clear()
+    if mode == 'single':
+        for question in questions:
+            await pipeline.aquery(question)
+    else:
+        for start in range(0, len(questions), batch_size):
+            await pipeline.abatch_query(questions[start:start + batch_size])
+
+
+def measure(mode, questions, batch_size):
+    pipeline = build_pipeline()
+    pipeline.vector_store = CountingVectorStore()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    asyncio.run(run(pipeline, mode, questions, batch_size))
+    return {
+        'wall': time.perf_counter() - wall_start,
+        'cpu': time.process_time() - cpu_start,
+        'embedding_calls': pipeline.vector_store.embedding_calls
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[10, 50, 100])
+    args = parser.parse_args()
+
+    questions = [f"question {i}" for i in range(args.queries)]
+    print(f"LLM concurrency per batch: {settings.BATCH_LLM_CONCURRENCY}")
+    print(f"{'mode':>12} {'queries/s':>10} {'cpu ms/query':>13} {'embed calls':>12}")
+
+    single = measure('single', questions, 1)
+    rows = [('single', single)] + [(f"batch {size}", measure('batch', questions, size)) for size in args.batch_size]
+    for label, result in rows:
+        print(f"{label:>12} {args.queries / result['wall']:>10.2f} "
+              f"{result['cpu'] * 1000 / args.queries:>13.3f} {result['embedding_calls']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark the token-based chunker against the old word-window chunker.
+
+Reports throughput, chunk size spread in real tokens and token waste (tokens
+repeated through overlap, as a share of the document's own tokens).
+
+    python -m benchmarks.bench_chunking --megabytes 5
+    python -m benchmarks.bench_chunking --file manual.txt
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.config import settings
+from app.utils.text_processing import chunk_text, get_encoding
+
+
+def legacy_chunk_text(text, chunk_size=1000, overlap=150):
+    # The word-window chunker this replaced
+    words = text.split()
+    chunks = []
+    for i in range(0, len(words), chunk_size - overlap):
+        chunk = " ".join(words[i:i + chunk_size])
+        if chunk.strip():
+            chunks.append(chunk)
+        if i + chunk_size >= len(words):
+            break
+    return chunks
+
+
+def synthetic_text(megabytes):
+    rng = random.Random(0)
+    vocabulary = [
+        "the", "index", "vector", "query", "document", "pipeline", "retrieval", "model", "token", "latency",
+        "configuration", "Pinecone", "embedding", "rerank", "answer", "citation", "throughput", "cache", "API", "chunk"
+    ]
+    paragraphs, size = [], 0
+    while size < megabytes * 1024 * 1024:
+        sentences = [
+            " ".join(rng.choices(vocabulary, k=rng.randint(6, 30))).capitalize() + rng.choice([".", ".", "?", "!"])
+            for _ in range(rng.randint(2, 10))
+        ]
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def measure(name, chunker, text, encoding, document_tokens):
+    start = time.perf_counter()
+    chunks = chunker(text)
+    elapsed = time.perf_counter() - start
+    sizes = [len(tokens) for tokens in encoding.encode_ordinary_batch(chunks)]
+    waste = (sum(sizes) - document_tokens) / document_tokens
+    print(f"{name:<8} {len(text) / 1024 / 1024 / elapsed:>8.2f} {len(chunks):>7} {statistics.mean(sizes):>8.0f} "
+          f"{statistics.pstdev(sizes):>7.0f} {max(sizes):>6} {waste:>7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--file')
+    parser.add_argument('--megabytes', type=float, default=5)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding='utf-8', errors='ignore') as f:
+            text = f.read()
+    else:
+        text = synthetic_text(args.megabytes)
+
+    encoding = get_encoding()
+    # Warm the cached encoder so neither run pays for loading it
+    document_tokens = len(encoding.encode_ordinary(text))
+
+    print(f"{len(text) / 1024 / 1024:.1f} MB, {document_tokens} tokens")
+    print(f"{'chunker':<8} {'MB/s':>8} {'chunks':>7} {'mean tok':>8} {'stdev':>7} {'max':>6} {'waste':>7}")
+    measure("words", lambda t: legacy_chunk_text(t, 1000, 150), text, encoding, document_tokens)
+    measure("tokens", lambda t: chunk_text(t, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP), text, encoding, document_tokens)
+
+
+if __name__ == "__main__":
+    main()
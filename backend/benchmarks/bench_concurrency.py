@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the query path.
+
+Compares the old behaviour (the blocking query path, called from an async
+route) with RAGPipeline.aquery, the path that is served, as the number of
+in-flight requests grows. The blocking path only lives on here, as
+blocking_query. Backends are replaced by stand-ins that sleep for a fixed
+latency, so no API keys are needed.
+
+    python -m benchmarks.bench_concurrency --requests 64
+"""
+import argparse
+import asyncio
+import time
+
+from app.config import settings
+from app.services.rag_pipeline import RAGPipeline
+
+EMBED_LATENCY = 0.05
+SEARCH_LATENCY = 0.03
+RERANK_LATENCY = 0.2
+LLM_LATENCY = 0.8
+
+DOCS = [
+    {'id': f'chunk-{i}', 'score': 0.9 - i * 0.01, 'text': f'Sample chunk {i}', 'metadata': {'filename': 'sample.txt'}}
+    for i in range(10)
+]
+
+
+class SleepyVectorStore:
+    def similarity_search(self, query, top_k=10):
+        time.sleep(EMBED_LATENCY + SEARCH_LATENCY)
+        return DOCS[:top_k]
+
+    async def agenerate_embeddings(self, texts):
+        await asyncio.sleep(EMBED_LATENCY)
+        return [[0.0] * 8 for _ in texts]
+
+    async def asimilarity_search(self, query, top_k=10, query_embedding=None, namespace='', filter=None):
+        if query_embedding is None:
+            await self.agenerate_embeddings([query])
+        await asyncio.sleep(SEARCH_LATENCY)
+        return DOCS[:top_k]
+
+    def fill_texts(self, docs):
+        return docs
+
+
+class SleepyReranker:
+    def rerank(self, query, documents, top_k=5):
+        time.sleep(RERANK_LATENCY)
+        return [{**doc, 'rerank_score': 1.0} for doc in documents[:top_k]]
+
+    async def arerank(self, query, documents, top_k=5):
+        await asyncio.sleep(RERANK_LATENCY)
+        return [{**doc, 'rerank_score': 1.0} for doc in documents[:top_k]]
+
+    async def arerank_adaptive(self, query, documents, top_k=5, adaptive=True):
+        return await self.arerank(query, documents, top_k), {'decision': 'full'}
+
+
+class SleepyLLM:
+    def pack_context(self, docs):
+        return docs
+
+    def generate_answer(self, query, context_docs):
+        time.sleep(LLM_LATENCY)
+        return "answer [1]", {'total_tokens': 100}, LLM_LATENCY
+
+    async def agenerate_answer(self, query, context_docs):
+        await asyncio.sleep(LLM_LATENCY)
+        return "answer [1]", {'total_tokens': 100}, LLM_LATENCY
+
+
+class SleepyDatabase:
+    def search_text_chunks(self, query, limit=5, filter=None):
+        return []
+
+    def log_query(self, *args):
+        # Query logs are buffered and written behind the request
+        pass
+
+
+def build_pipeline():
+    return RAGPipeline(
+        vector_store=SleepyVectorStore(),
+        reranker=SleepyReranker(),
+        llm=SleepyLLM(),
+        db=SleepyDatabase()
+    )
+
+
+def blocking_query(pipeline, query):
+    # The synchronous query path the route used to call: every stage blocks the event loop
+    retrieved_docs = pipeline.vector_store.similarity_search(query, settings.TOP_K)
+    reranked_docs = pipeline.reranker.rerank(query, retrieved_docs, settings.RERANK_TOP_K)
+    context_docs = pipeline.llm.pack_context(reranked_docs)
+    answer, token_usage, latency = pipeline.llm.generate_answer(query, context_docs)
+    pipeline.db.log_query(query, answer, context_docs, token_usage, latency)
+    return answer
+
+
+async def run(pipeline, mode, total, concurrency):
+    # Every question is distinct, but runs reuse them; start each run cold
+    pipeline.answer_cache.clear()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            if mode == 'blocking':
+                # What the route did before: a sync call inside an async def
+                blocking_query(pipeline, f"question {i}")
+            else:
+                await pipeline.aquery(f"question {i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    pipeline = build_pipeline()
+    print(f"{'in-flight':>10} {'blocking req/s':>15} {'async req/s':>12} {'speedup':>8}")
+    for concurrency in args.concurrency:
+        blocking = asyncio.run(run(pipeline, 'blocking', args.requests, concurrency))
+        non_blocking = asyncio.run(run(pipeline, 'async', args.requests, concurrency))
+        print(f"{concurrency:>10} {args.requests / blocking:>15.2f} {args.requests / non_blocking:>12.2f} {blocking / non_blocking:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Recall cost of shortened embeddings (EMBEDDING_DIMENSIONS).
+
+Chunks a corpus with the ingest chunker, embeds every chunk once at each
+model's full size, then searches it with questions at every --dimensions.
+A text-embedding-3 vector shortened by the API is its full vector cut to
+the first n values and rescaled to unit length, so the shorter sizes are
+computed from the full embeddings rather than paid for again
+(--api-dimensions also requests them, to check that).
+
+recall@k is the overlap with the same model's full-size top k; hit@k is how
+often the chunk a question was taken from is in the top k. Without
+--queries, questions are the first sentence of sampled chunks. Latency is
+an exact float32 scan of all chunks, about what the local index and
+Pinecone's payload scale with; bytes are per stored vector.
+
+    python -m benchmarks.bench_embedding_dimensions --corpus ./docs
+    python -m benchmarks.bench_embedding_dimensions --corpus ./docs --models text-embedding-3-small text-embedding-3-large --dimensions 256 512 1024
+    python -m benchmarks.bench_embedding_dimensions --fake --dimensions 64 128 256   # offline dry run, numbers mean nothing
+
+Embeddings are cached in --cache (a directory of .npy files per model and
+corpus), so rerunning with other dimensions or queries costs no API calls.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.services.vector_store import EMBEDDING_MODEL_DIMENSIONS
+from app.utils.extraction import ExtractionError, iter_pages
+from app.utils.text_processing import chunk_text
+
+PERCENTILES = (50, 95)
+# Inputs per embeddings request
+BATCH = 500
+SENTENCE_RE = re.compile(r'(.{40,}?[.?!])(?:\s|$)', re.S)
+
+
+def load_chunks(corpus):
+    chunks = []
+    for root, _, names in os.walk(corpus):
+        for name in sorted(names):
+            with open(os.path.join(root, name), 'rb') as f:
+                content = f.read()
+            try:
+                text = "\n\n".join(page for _, page in iter_pages(content, name))
+            except ExtractionError as e:
+                print(f"  skipping {name}: {e}", file=sys.stderr)
+                continue
+            chunks.extend(chunk_text(text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP))
+    return chunks
+
+
+def sample_queries(chunks, count, seed):
+    # First sentence of a chunk, labelled with the chunk it came from
+    rng = random.Random(seed)
+    queries = []
+    for i in rng.sample(range(len(chunks)), len(chunks)):
+        match = SENTENCE_RE.match(chunks[i].strip())
+        if match:
+            queries.append((" ".join(match.group(1).split()), i))
+        if len(queries) == count:
+            break
+    return queries
+
+
+def embed(client, model, texts, dimensions=None):
+    vectors = []
+    for start in range(0, len(texts), BATCH):
+        kwargs = {'dimensions': dimensions} if dimensions else {}
+        response = client.embeddings.create(input=texts[start:start + BATCH], model=model, **kwargs)
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        print(f"\r  {model}{f'@{dimensions}' if dimensions else ''}: embedded {len(vectors)}/{len(texts)}", end='', file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def cached_embed(client, model, texts, cache, dimensions=None):
+    if not cache:
+        return embed(client, model, texts, dimensions)
+    digest = hashlib.sha256("\x00".join(texts).encode()).hexdigest()[:16]
+    path = os.path.join(cache, f"{model}{f'@{dimensions}' if dimensions else ''}-{digest}.npy")
+    if os.path.exists(path):
+        return np.load(path)
+    vectors = embed(client, model, texts, dimensions)
+    os.makedirs(cache, exist_ok=True)
+    np.save(path, vectors)
+    return vectors
+
+
+def shorten(vectors, dimensions):
+    short = vectors[:, :dimensions]
+    return short / np.maximum(np.linalg.norm(short, axis=1, keepdims=True), 1e-12)
+
+
+def search(matrix, queries, top_k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        scores = matrix @ query
+        top = np.argpartition(-scores, min(top_k, len(scores) - 1))[:top_k]
+        results.append(top[np.argsort(-scores[top])].tolist())
+        latencies.append(time.perf_counter() - start)
+    latencies = np.asarray(latencies)
+    return results, {'mean': float(latencies.mean()), **{f"p{p}": float(np.percentile(latencies, p)) for p in PERCENTILES}}
+
+
+def overlap(results, truth, top_k):
+    return float(np.mean([len(set(found[:top_k]) & set(expected[:top_k])) / top_k for found, expected in zip(results, truth)]))
+
+
+def hits(results, sources, top_k):
+    return float(np.mean([source in found[:top_k] for found, source in zip(results, sources)]))
+
+
+def fake_client():
+    from benchmarks.fakes import FakeOpenAI, LatencyModel
+    return FakeOpenAI(LatencyModel(), LatencyModel())
+
+
+def openai_client():
+    from openai import OpenAI
+    return OpenAI(api_key=settings.OPENAI_API_KEY)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help="directory of documents to chunk and embed (.pdf, .docx, .txt, ...)")
+    parser.add_argument('--queries', help="file with one question per line (default: sentences sampled from the corpus)")
+    parser.add_argument('--sample', type=int, default=200, help="questions to sample without --queries")
+    parser.add_argument('--models', nargs='+', default=['text-embedding-3-small'])
+    parser.add_argument('--dimensions', type=int, nargs='+', default=[256, 512, 1024])
+    parser.add_argument('--top-k', type=int, nargs='+', default=[5, 10])
+    parser.add_argument('--api-dimensions', action='store_true', help="also embed at each size through the API's dimensions parameter")
+    parser.add_argument('--cache', default='.embedding-bench-cache', help="directory for embeddings ('' to disable)")
+    parser.add_argument('--fake', action='store_true', help="hashed bag-of-words embeddings on a synthetic corpus, no API key needed")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.fake:
+        from benchmarks.bench_chunking import synthetic_text
+        client, cache = fake_client(), ''
+        chunks = chunk_text(synthetic_text(1), settings.CHUNK_SIZE, settings.CHUNK_OVERLAP) if not args.corpus else load_chunks(args.corpus)
+    elif args.corpus:
+        client, cache = openai_client(), args.cache
+        chunks = load_chunks(args.corpus)
+    else:
+        parser.error("--corpus is required (or --fake for a dry run)")
+    if not chunks:
+        parser.error("no text found in the corpus")
+
+    if args.queries:
+        with open(args.queries, encoding='utf-8') as f:
+            queries = [(line.strip(), None) for line in f if line.strip()]
+    else:
+        queries = sample_queries(chunks, args.sample, args.seed)
+    questions, sources = [q for q, _ in queries], [s for _, s in queries]
+    print(f"{len(chunks)} chunks, {len(questions)} questions", file=sys.stderr)
+
+    results = {'args': vars(args), 'chunks': len(chunks), 'questions': len(questions), 'runs': []}
+    depth = max(args.top_k)
+    for model in args.models:
+        full = EMBEDDING_MODEL_DIMENSIONS.get(model) if not args.fake else None
+        chunk_vectors = cached_embed(client, model, chunks, cache)
+        query_vectors = cached_embed(client, model, questions, cache)
+        full = full or chunk_vectors.shape[1]
+        truth, _ = search(chunk_vectors, query_vectors, depth)
+
+        sizes = sorted({d for d in args.dimensions if d < full} | {full}, reverse=True)
+        for dimensions in sizes:
+            variants = [('truncated', shorten(chunk_vectors, dimensions), shorten(query_vectors, dimensions))]
+            if args.api_dimensions and dimensions < full:
+                variants.append(('api', cached_embed(client, model, chunks, cache, dimensions),
+                                 cached_embed(client, model, questions, cache, dimensions)))
+            for source, matrix, query_matrix in variants:
+                found, latency = search(np.ascontiguousarray(matrix), query_matrix, depth)
+                results['runs'].append({
+                    'model': model, 'dimensions': dimensions, 'vectors': source if dimensions < full else 'full',
+                    'bytes': dimensions * 4, 'latency': latency,
+                    **{f"recall@{k}": overlap(found, truth, k) for k in args.top_k},
+                    **({f"hit@{k}": hits(found, sources, k) for k in args.top_k} if None not in sources else {})
+                })
+
+    columns = [f"recall@{k}" for k in args.top_k] + ([f"hit@{k}" for k in args.top_k] if None not in sources else [])
+    print(f"\n{len(chunks)} chunks, {len(questions)} questions"
+          + (" (sampled first sentences; hit@k = source chunk found)" if None not in sources else ""))
+    print(f"\n  {'model':<24} {'dims':>5} {'vectors':<9} {'bytes':>6} " + " ".join(f"{c:>9}" for c in columns)
+          + f" {'mean ms':>8} " + " ".join(f"{f'p{p} ms':>8}" for p in PERCENTILES))
+    for run in results['runs']:
+        print(f"  {run['model']:<24} {run['dimensions']:>5} {run['vectors']:<9} {run['bytes']:>6} "
+              + " ".join(f"{run[c]:>9.3f}" for c in columns)
+              + f" {run['latency']['mean'] * 1000:>8.3f} " + " ".join(f"{run['latency'][f'p{p}'] * 1000:>8.3f}" for p in PERCENTILES))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
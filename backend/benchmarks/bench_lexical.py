@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark the BM25 inverted index against the old text-fallback scan.
+
+Builds a synthetic corpus with a Zipf-distributed vocabulary in a scratch
+MongoDB database, then times both search strategies on the same queries.
+The scratch database is dropped afterwards.
+
+    python -m benchmarks.bench_lexical --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from pymongo import MongoClient
+
+from app.config import settings
+from app.services.lexical_index import LexicalIndex
+
+DOCS_PER_BATCH = 1000
+
+
+def legacy_scan(documents, query, limit=5):
+    # The pre-index implementation of DatabaseService.search_text_chunks
+    query_words = query.lower().split()
+    results = []
+    for doc in list(documents.find({'storage_type': 'text_fallback'})):
+        for i, chunk in enumerate(doc.get('chunks', [])):
+            chunk_lower = chunk.lower()
+            score = sum(1 for word in query_words if word in chunk_lower)
+            if score > 0:
+                results.append({'id': f"{doc['_id']}_{i}", 'score': score / len(query_words)})
+    results.sort(key=lambda x: x['score'], reverse=True)
+    return results[:limit]
+
+
+def build_corpus(db, index, n_chunks, vocabulary, weights, words_per_chunk, chunks_per_doc):
+    rng = random.Random(42)
+    written = 0
+    while written < n_chunks:
+        doc_chunks = []
+        for _ in range(min(chunks_per_doc, n_chunks - written)):
+            doc_chunks.append(" ".join(rng.choices(vocabulary, weights, k=words_per_chunk)))
+        result = db.documents.insert_one({'filename': f'doc{written}.txt', 'chunks': doc_chunks, 'storage_type': 'text_fallback'})
+        index.add_chunks(
+            [f"{result.inserted_id}_{i}" for i in range(len(doc_chunks))],
+            doc_chunks,
+            [{'filename': f'doc{written}.txt', 'chunk_index': i} for i in range(len(doc_chunks))]
+        )
+        written += len(doc_chunks)
+
+
+def time_queries(fn, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies), max(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongodb-uri', default=settings.MONGODB_URI or 'mongodb://localhost:27017')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--words-per-chunk', type=int, default=200)
+    parser.add_argument('--chunks-per-doc', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--skip-scan-above', type=int, default=100000,
+                        help="Skip the legacy scan above this corpus size (it loads everything into memory)")
+    args = parser.parse_args()
+
+    vocabulary = [f"term{i}" for i in range(50000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    rng = random.Random(7)
+    queries = [" ".join(rng.choices(vocabulary[:5000], k=4)) for _ in range(args.queries)]
+
+    client = MongoClient(args.mongodb_uri)
+    print(f"{'chunks':>10} {'scan p50':>10} {'scan max':>10} {'bm25 p50':>10} {'bm25 max':>10}")
+    for size in args.sizes:
+        client.drop_database('bench_lexical')
+        db = client['bench_lexical']
+        index = LexicalIndex(db)
+        build_corpus(db, index, size, vocabulary, weights, args.words_per_chunk, args.chunks_per_doc)
+
+        bm25_p50, bm25_max = time_queries(lambda q: index.search(q, 5), queries)
+        if size <= args.skip_scan_above:
+            scan_p50, scan_max = time_queries(lambda q: legacy_scan(db.documents, q), queries[:5])
+            scan = f"{scan_p50 * 1000:>8.1f}ms {scan_max * 1000:>8.1f}ms"
+        else:
+            scan = f"{'skipped':>10} {'':>10}"
+        print(f"{size:>10} {scan} {bm25_p50 * 1000:>8.1f}ms {bm25_max * 1000:>8.1f}ms")
+    client.drop_database('bench_lexical')
+
+
+if __name__ == "__main__":
+    main()
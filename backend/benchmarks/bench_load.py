@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Load test for the HTTP API with every backend replaced by a local stand-in.
+
+Uploads documents through /api/upload (waiting for each ingestion job to
+finish), then sends questions to /api/query, both at a fixed concurrency.
+Requests go through the real FastAPI app, services and ingestion workers;
+only OpenAI, Pinecone, Cohere and MongoDB are swapped for benchmarks.fakes,
+whose latency and error distributions are set per backend. Reports
+throughput, errors and p50/p95/p99 for every stage and writes the run to
+JSON, so runs can be compared offline or in CI without API keys or quota.
+
+    python -m benchmarks.bench_load --uploads 20 --queries 200 --concurrency 16
+    python -m benchmarks.bench_load --set cohere_rerank.error_rate=0.05 --set openai_chat.median=2
+    python -m benchmarks.bench_load --latency-scale 0 --compare benchmarks/results/baseline.json
+
+Stage latencies come from the timings the API reports (per query, and per
+ingestion job); "http" is the latency the client saw. tiktoken must be able
+to load its encodings; set TIKTOKEN_CACHE_DIR for offline runs.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.fakes import LatencyModel, FakeOpenAI, FakeIndex, FakeCohere, fake_mongo_client
+
+# Per-backend latency (median seconds, log-normal sigma) and error rate
+DEFAULT_PROFILE = {
+    'openai_embed': {'median': 0.08, 'sigma': 0.3, 'error_rate': 0.0},
+    'openai_chat': {'median': 1.0, 'sigma': 0.4, 'error_rate': 0.0},
+    'pinecone_query': {'median': 0.04, 'sigma': 0.3, 'error_rate': 0.0},
+    'pinecone_upsert': {'median': 0.08, 'sigma': 0.3, 'error_rate': 0.0},
+    'cohere_rerank': {'median': 0.2, 'sigma': 0.35, 'error_rate': 0.0},
+    'mongo': {'median': 0.002, 'sigma': 0.5, 'error_rate': 0.0},
+}
+
+PERCENTILES = (50, 95, 99)
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'tor', 'vex', 'sul', 'pra', 'din', 'quo', 'zel', 'fim', 'ba', 'nu', 'ost', 'gri']
+COMMON_WORDS = ('the system uses a process for each stage of the report and the data it describes in detail '
+                'with results that depend on several factors across the whole project').split()
+
+
+def load_profile(args):
+    profile = json.loads(json.dumps(DEFAULT_PROFILE))
+    if args.profile:
+        with open(args.profile) as f:
+            for backend, values in json.load(f).items():
+                profile.setdefault(backend, {}).update(values)
+    for assignment in args.set:
+        key, _, value = assignment.partition('=')
+        backend, _, field = key.partition('.')
+        if backend not in profile or not field:
+            raise SystemExit(f"--set expects <backend>.<field>=<value> with backend in {sorted(profile)}")
+        profile[backend][field] = value if field == 'error' else float(value)
+    for values in profile.values():
+        values['median'] = values.get('median', 0.0) * args.latency_scale
+    return profile
+
+
+def configure_environment(workdir, args):
+    # Must run before anything under app/ is imported: settings are read at import time
+    for key in ('OPENAI_API_KEY', 'PINECONE_API_KEY', 'COHERE_API_KEY'):
+        os.environ[key] = 'bench'
+    os.environ['MONGODB_URI'] = 'mongodb://bench'
+    os.environ['EMBEDDING_CACHE_PATH'] = os.path.join(workdir, 'embeddings.sqlite3')
+    os.environ['CHUNK_STORE_PATH'] = os.path.join(workdir, 'chunks.sqlite3')
+    os.environ['QUERY_LOG_SPILL_PATH'] = os.path.join(workdir, 'query_log_spill.jsonl')
+    os.environ['INGESTION_WORKERS'] = str(args.ingestion_workers)
+    os.environ['INGESTION_MAX_PENDING'] = str(max(args.uploads, 100))
+    os.environ['TRACING_ENABLED'] = 'true'
+
+
+def install_fakes(container, profile, seed):
+    from app.services.vector_store import VectorStore
+    from app.services.reranker import Reranker
+    from app.services.database import DatabaseService
+    from app.services.chunk_store import ChunkStore
+    from app.config import settings
+
+    models = {name: LatencyModel(seed=seed + i, **spec) for i, (name, spec) in enumerate(sorted(profile.items()))}
+    openai_client = FakeOpenAI(models['openai_embed'], models['openai_chat'])
+    async_openai_client = FakeOpenAI(models['openai_embed'], models['openai_chat'], asynchronous=True)
+    db = DatabaseService(fake_mongo_client(models['mongo']))
+    chunk_store = ChunkStore(settings.CHUNK_STORE_PATH, loader=db.get_chunk_texts, mmap_bytes=settings.CHUNK_STORE_MMAP_BYTES)
+    container.provide(
+        openai_client=openai_client,
+        async_openai_client=async_openai_client,
+        chunk_store=chunk_store,
+        vector_store=VectorStore(openai_client, async_openai_client, chunk_store=chunk_store, embedding_cache=container.embedding_cache,
+                                 index=FakeIndex(models['pinecone_query'], models['pinecone_upsert'])),
+        reranker=Reranker(FakeCohere(models['cohere_rerank'], asynchronous=True), chunk_store),
+        db=db
+    )
+    return models
+
+
+def make_corpus(n_docs, doc_words, rng):
+    """Documents that each have their own topic words, so questions can target one."""
+    corpus = []
+    for i in range(n_docs):
+        topic = [''.join(rng.choice(SYLLABLES) for _ in range(3)) + str(i) for _ in range(12)]
+        words = [rng.choice(topic) if rng.random() < 0.2 else rng.choice(COMMON_WORDS) for _ in range(doc_words)]
+        sentences = [" ".join(words[start:start + 15]).capitalize() + "." for start in range(0, len(words), 15)]
+        paragraphs = [" ".join(sentences[start:start + 8]) for start in range(0, len(sentences), 8)]
+        corpus.append({'filename': f"bench-{i}.txt", 'text': "\n\n".join(paragraphs), 'topic': topic})
+    return corpus
+
+
+def make_questions(corpus, n_queries, repeat, rng):
+    questions = []
+    for _ in range(n_queries):
+        if questions and rng.random() < repeat:
+            questions.append(rng.choice(questions))
+            continue
+        topic = rng.choice(corpus)['topic']
+        questions.append(f"What does the report say about {' and '.join(rng.sample(topic, 3))}?")
+    return questions
+
+
+async def drive(n, concurrency, one):
+    """Run one(i) for i in range(n) with at most concurrency in flight; returns (records, wall seconds)."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i):
+        async with semaphore:
+            return await one(i)
+
+    start = time.perf_counter()
+    records = await asyncio.gather(*(limited(i) for i in range(n)))
+    return records, time.perf_counter() - start
+
+
+async def upload_one(client, document, job_timeout):
+    start = time.perf_counter()
+    response = await client.post('/api/upload', files={'file': (document['filename'], document['text'].encode(), 'text/plain')})
+    record = {'status': response.status_code, 'stages': {'http': time.perf_counter() - start}}
+    if response.status_code != 202:
+        return record
+
+    job_id = response.json()['job_id']
+    deadline = start + job_timeout
+    while time.perf_counter() < deadline:
+        job = (await client.get(f'/api/jobs/{job_id}')).json()
+        if job['status'] in ('completed', 'failed'):
+            record['job_status'] = job['status']
+            record['stages'].update({f"ingest_{stage}": seconds for stage, seconds in job.get('timings', {}).items()})
+            record['stages']['job'] = time.perf_counter() - start
+            return record
+        await asyncio.sleep(0.05)
+    record['job_status'] = 'timeout'
+    return record
+
+
+async def query_one(client, question):
+    start = time.perf_counter()
+    response = await client.post('/api/query', json={'query': question})
+    record = {'status': response.status_code, 'stages': {'http': time.perf_counter() - start}}
+    if response.status_code == 200:
+        body = response.json()
+        record['stages'].update(body.get('timings', {}))
+        record['cached'] = body['cached']
+        record['coalesced'] = body.get('coalesced', False)
+        record['rerank'] = (body.get('rerank') or {}).get('decision')
+    return record
+
+
+def summarize(records, seconds):
+    succeeded, failed = [], []
+    for record in records:
+        ok = record['status'] < 300 and record.get('job_status', 'completed') == 'completed'
+        (succeeded if ok else failed).append(record)
+    samples = defaultdict(list)
+    for record in succeeded:
+        for stage, value in record['stages'].items():
+            samples[stage].append(value)
+    summary = {
+        'requests': len(records),
+        'succeeded': len(succeeded),
+        # HTTP status for rejected requests, job status for uploads whose ingestion failed
+        'errors': dict(Counter(str(record['status'] if record['status'] >= 300 else record['job_status']) for record in failed)),
+        'seconds': seconds,
+        'throughput': len(succeeded) / seconds if seconds else 0.0,
+        'stages': {stage: stage_stats(values) for stage, values in sorted(samples.items())}
+    }
+    if any('cached' in record for record in records):
+        summary['cached'] = sum(1 for record in succeeded if record.get('cached'))
+        summary['coalesced'] = sum(1 for record in succeeded if record.get('coalesced'))
+        summary['rerank_decisions'] = dict(Counter(record['rerank'] for record in succeeded if record.get('rerank')))
+    return summary
+
+
+def stage_stats(values):
+    values = np.asarray(values)
+    return {
+        'count': int(values.size),
+        'mean': float(values.mean()),
+        **{f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES},
+        'max': float(values.max())
+    }
+
+
+def print_summary(name, summary, baseline=None):
+    print(f"\n{name}: {summary['succeeded']}/{summary['requests']} ok in {summary['seconds']:.2f}s "
+          f"({summary['throughput']:.2f}/s)" + (f", errors {summary['errors']}" if summary['errors'] else ""))
+    if 'cached' in summary:
+        print(f"  cached answers {summary['cached']}, coalesced {summary.get('coalesced', 0)}, rerank {summary['rerank_decisions']}")
+    print(f"  {'stage':<28} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}" + (f" {'p95 vs base':>12}" if baseline else ""))
+    for stage, stats in summary['stages'].items():
+        line = f"  {stage:<28} {stats['count']:>6} " + " ".join(f"{stats[f'p{p}'] * 1000:>9.1f}" for p in PERCENTILES)
+        before = (baseline or {}).get('stages', {}).get(stage)
+        if before and before['p95']:
+            line += f" {(stats['p95'] / before['p95'] - 1) * 100:>+11.1f}%"
+        print(line)
+
+
+async def run(args, corpus, questions):
+    from app.main import app, warm_up
+    from app.services.container import container
+    import httpx
+
+    try:
+        # warm_up retries until it succeeds; the stand-ins should get there at once
+        await asyncio.wait_for(warm_up(), 60)
+    except asyncio.TimeoutError:
+        raise SystemExit(f"Warm-up failed: {container.warmup_error}")
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+            uploads = await drive(len(corpus), args.concurrency, lambda i: upload_one(client, corpus[i], args.job_timeout))
+            queries = await drive(len(questions), args.concurrency, lambda i: query_one(client, questions[i]))
+    finally:
+        await asyncio.to_thread(container.close)
+    return summarize(*uploads), summarize(*queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uploads', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--doc-words', type=int, default=3000, help="words per uploaded document")
+    parser.add_argument('--repeat', type=float, default=0.0, help="fraction of questions that repeat an earlier one")
+    parser.add_argument('--ingestion-workers', type=int, default=2)
+    parser.add_argument('--job-timeout', type=float, default=300.0)
+    parser.add_argument('--profile', help="JSON file overriding DEFAULT_PROFILE, e.g. {\"openai_chat\": {\"median\": 2.0}}")
+    parser.add_argument('--set', action='append', default=[], metavar='BACKEND.FIELD=VALUE',
+                        help="override one latency setting: median, sigma, error_rate or error")
+    parser.add_argument('--latency-scale', type=float, default=1.0, help="multiply every median latency (0 for CPU-only runs)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="results file (default benchmarks/results/load-<timestamp>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare p95s against")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    profile = load_profile(args)
+    rng = random.Random(args.seed)
+    corpus = make_corpus(args.uploads, args.doc_words, rng)
+    questions = make_questions(corpus, args.queries, args.repeat, rng)
+
+    with tempfile.TemporaryDirectory(prefix='minirag-bench-') as workdir:
+        configure_environment(workdir, args)
+        from app.services.container import container
+        import app.main  # noqa: F401  (configures logging; silence it below)
+        logging.getLogger().setLevel(args.log_level)
+
+        models = install_fakes(container, profile, args.seed)
+        upload_summary, query_summary = asyncio.run(run(args, corpus, questions))
+
+    started = datetime.now(timezone.utc)
+    results = {
+        'created_at': started.isoformat(),
+        'args': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'profile': profile,
+        'uploads': upload_summary,
+        'queries': query_summary,
+        'backends': {name: model.stats() for name, model in models.items()}
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_summary('Uploads', upload_summary, baseline and baseline.get('uploads'))
+    print_summary('Queries', query_summary, baseline and baseline.get('queries'))
+    print("\nBackend calls: " + ", ".join(f"{name} {stats['calls']} ({stats['errors']} failed)" for name, stats in results['backends'].items()))
+
+    output = args.output or os.path.join(os.path.dirname(__file__), 'results', f"load-{started:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Size and encoding time of /api/query responses per citation mode.
+
+Builds an answer citing --citations passages of real chunk size (the
+ingest chunker over --file, or synthetic text, CHUNK_SIZE tokens each) with
+the metadata ingest stores, then encodes it:
+
+  pydantic   the previous route: QueryResponse/Citation models, dumped and
+             rendered by FastAPI's JSONResponse (json.dumps)
+  orjson     the current route: citations shaped per mode as plain dicts,
+             rendered by FastJSONResponse
+
+for each citation mode, with all metadata and with a filename/pages
+projection. Sizes are raw and gzipped at GZIP_LEVEL (what clients sending
+Accept-Encoding: gzip receive); times are per response. The synthetic
+text has a 20-word vocabulary and compresses far better than real prose,
+so use --file for gzip numbers.
+
+    python -m benchmarks.bench_responses --file manual.txt
+    python -m benchmarks.bench_responses --citations 10 --preview-chars 200
+"""
+import argparse
+import gzip
+import json
+import time
+
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+from app.models.schemas import Citation, CitationOptions, QueryResponse
+from app.routers.query import to_citations
+from app.utils.responses import FastJSONResponse
+from app.utils.text_processing import chunk_text_with_offsets
+from benchmarks.bench_chunking import synthetic_text
+
+# Keys a client rendering a source list needs
+PROJECTION = ['filename', 'page_start', 'page_end']
+
+
+def make_result(text, citations):
+    chunks = chunk_text_with_offsets(text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)[:citations]
+    return {
+        'answer': " ".join(f"Finding {i} is supported by the documents [{i + 1}]." for i in range(len(chunks))),
+        'citations': [
+            {
+                'id': f"3f9c2a1b7d4e8f60{i:04d}",
+                'text': chunk['text'],
+                'metadata': {
+                    'filename': 'quarterly-operations-report.pdf', 'document_key': 'quarterly-operations-report.pdf',
+                    'uploaded_at': 1760000000.123, 'chunk_index': i, 'char_start': chunk['start'], 'char_end': chunk['end'],
+                    'page_start': i + 1, 'page_end': i + 2
+                }
+            }
+            for i, chunk in enumerate(chunks)
+        ],
+        'token_usage': {'prompt_tokens': 5210, 'completion_tokens': 180, 'total_tokens': 5390},
+        'latency': 1.234, 'cached': False, 'coalesced': False,
+        'rerank': {'reranked': True, 'candidates': 10},
+        'timings': {'embedding': 0.12, 'vector_search': 0.05, 'lexical_search': 0.01, 'rerank': 0.2, 'llm': 0.9}
+    }
+
+
+def pydantic_body(result):
+    response = QueryResponse(**{**result, 'citations': [Citation(**cite) for cite in result['citations']]})
+    return JSONResponse(response.model_dump(mode='json')).body
+
+
+def orjson_body(result, options):
+    return FastJSONResponse({**result, 'citations': to_citations(result['citations'], options)}).body
+
+
+def timed(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = fn()
+    return body, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--file', help="plain-text document to cite (default: synthetic text)")
+    parser.add_argument('--citations', type=int, default=settings.RERANK_TOP_K)
+    parser.add_argument('--preview-chars', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding='utf-8', errors='ignore') as f:
+            text = f.read()
+    else:
+        text = synthetic_text(0.1)
+    result = make_result(text, args.citations)
+    runs = [('pydantic', 'full', 'all', lambda: pydantic_body(result))]
+    for mode in ('full', 'preview', 'ids'):
+        for fields, projection in (('all', None), ('projected', PROJECTION)):
+            options = CitationOptions(citation_mode=mode, preview_chars=args.preview_chars, metadata_fields=projection)
+            runs.append(('orjson', mode, fields, lambda options=options: orjson_body(result, options)))
+
+    rows = []
+    for encoder, mode, fields, fn in runs:
+        body, encode_seconds = timed(fn, args.repeat)
+        compressed, gzip_seconds = timed(lambda: gzip.compress(body, compresslevel=settings.GZIP_LEVEL), max(args.repeat // 10, 1))
+        rows.append({'encoder': encoder, 'citations': mode, 'metadata': fields, 'bytes': len(body), 'gzip_bytes': len(compressed),
+                     'encode_us': encode_seconds * 1e6, 'gzip_us': gzip_seconds * 1e6})
+
+    print(f"{len(result['citations'])} citations of ~{settings.CHUNK_SIZE} tokens, preview {args.preview_chars} chars, gzip level {settings.GZIP_LEVEL}")
+    print(f"\n  {'encoder':<9} {'citations':<9} {'metadata':<10} {'bytes':>7} {'gzip':>7} {'encode us':>10} {'gzip us':>8}")
+    for row in rows:
+        print(f"  {row['encoder']:<9} {row['citations']:<9} {row['metadata']:<10} {row['bytes']:>7} {row['gzip_bytes']:>7} "
+              f"{row['encode_us']:>10.1f} {row['gzip_us']:>8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'runs': rows}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Recall, latency and memory of the local vector index (VECTOR_BACKEND=local).
+
+Builds a LocalVectorIndex of synthetic clustered embeddings on disk, trains
+its IVF lists, then reopens it (what an API restart costs: nothing is read
+into RAM) and runs the same questions through exact float32 search and,
+for each --quantization, through a full scan of the codes and through IVF
+at each nprobe (both rescoring a shortlist against float32). Recall@k is
+measured against the exact results. For float32 it is also measured with
+a selective filter (1% of vectors; searched exactly below --exact-max
+matches) and a broad one (half the vectors; searched in the probed lists).
+
+"scan MiB/M" is what a scan reads per million vectors, the part that has
+to stay in RAM for full-speed queries; the float32 file is only read for
+shortlists.
+
+    python -m benchmarks.bench_vector_index                      # 1M x 1536, about 8 GB on disk
+    python -m benchmarks.bench_vector_index --vectors 100000 --nprobe 4 8 16 --quantization none int8
+
+Vectors are unit-length noise around --clusters random topic centres, so
+neighbourhoods have the local structure real embeddings have; uniform noise
+would make any IVF index look bad and any exact scan look fine.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.local_index import LocalVectorIndex
+
+PERCENTILES = (50, 95, 99)
+# Documents the synthetic vectors are spread over
+DOCUMENTS = 100
+FILTERS = {
+    '': None,
+    ', 1% filter': {'document': 'doc-7'},
+    ', 50% filter': {'document': {'$in': [f"doc-{i}" for i in range(DOCUMENTS // 2)]}}
+}
+
+
+def make_batch(centres, start, size, spread, seed):
+    rng = np.random.default_rng(seed + start)
+    noise = rng.standard_normal((size, centres.shape[1]), dtype=np.float32) * (spread / np.sqrt(centres.shape[1]))
+    points = centres[rng.integers(0, len(centres), size)] + noise
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+def build(index, centres, args):
+    start_time = time.perf_counter()
+    for start in range(0, args.vectors, args.batch):
+        size = min(args.batch, args.vectors - start)
+        index.upsert_arrays(
+            [f"vec-{i}" for i in range(start, start + size)],
+            make_batch(centres, start, size, args.spread, args.seed),
+            [{'document': f"doc-{i % DOCUMENTS}", 'chunk_index': i // DOCUMENTS} for i in range(start, start + size)]
+        )
+        print(f"\r  loaded {start + size}/{args.vectors}", end='', file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    loaded = time.perf_counter()
+    index.train(seed=args.seed)
+    return loaded - start_time, time.perf_counter() - loaded
+
+
+def run_queries(index, queries, top_k, query_filter=None):
+    latencies, results = [], []
+    if query_filter:
+        # The first filter on a field loads that metadata column; time the steady state
+        index.query(queries[0].tolist(), top_k=top_k, filter=query_filter)
+    for query in queries:
+        start = time.perf_counter()
+        matches = index.query(query.tolist(), top_k=top_k, filter=query_filter)['matches']
+        latencies.append(time.perf_counter() - start)
+        results.append([match['id'] for match in matches])
+    latencies = np.asarray(latencies)
+    return results, {
+        'mean': float(latencies.mean()),
+        **{f"p{p}": float(np.percentile(latencies, p)) for p in PERCENTILES}
+    }
+
+
+def recall(results, truth, top_k):
+    return float(np.mean([len(set(found) & set(expected)) / min(top_k, len(expected) or 1) for found, expected in zip(results, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vectors', type=int, default=1_000_000)
+    parser.add_argument('--dimension', type=int, default=1536)
+    parser.add_argument('--clusters', type=int, default=2000, help="topic centres the vectors are drawn around")
+    parser.add_argument('--spread', type=float, default=0.8, help="length of the noise around a (unit) centre")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32, 64])
+    parser.add_argument('--exact-max', type=int, default=20000, help="LOCAL_INDEX_EXACT_MAX for the IVF runs")
+    parser.add_argument('--quantization', nargs='+', default=['none', 'float16', 'int8', 'binary'])
+    parser.add_argument('--rescore', type=int, help="shortlist size as a multiple of top-k (default: per codec)")
+    parser.add_argument('--batch', type=int, default=20000, help="vectors per upsert while building")
+    parser.add_argument('--path', help="build (or reuse, with --reuse) the index here instead of a temporary directory")
+    parser.add_argument('--reuse', action='store_true', help="query an index already built at --path")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centres = rng.standard_normal((args.clusters, args.dimension), dtype=np.float32) / np.sqrt(args.dimension)
+    # Questions come from the same distribution but are not in the index
+    queries = make_batch(centres, args.vectors, args.queries, args.spread, args.seed + 1)
+
+    path = args.path or tempfile.mkdtemp(prefix='minirag-index-')
+    try:
+        results = {'args': vars(args)}
+        if not args.reuse:
+            print(f"Building {args.vectors} x {args.dimension} index in {path}", file=sys.stderr)
+            index = LocalVectorIndex(path, dimension=args.dimension, auto_train=False)
+            results['load_seconds'], results['train_seconds'] = build(index, centres, args)
+            del index
+
+        start = time.perf_counter()
+        exact = LocalVectorIndex(path, dimension=args.dimension, exact_max=sys.maxsize)
+        results['open_seconds'] = time.perf_counter() - start
+        results['disk_bytes'] = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        stats = exact.describe_index_stats()
+
+        rows, truth = [], {}
+        for name, query_filter in FILTERS.items():
+            truth[name], latency = run_queries(exact, queries, args.top_k, query_filter)
+            rows.append(('float32', f"exact{name}", None, 1.0, latency))
+        del exact
+        for quantization in args.quantization:
+            options = {'dimension': args.dimension, 'quantization': quantization, 'rescore': args.rescore}
+            start = time.perf_counter()
+            flat = LocalVectorIndex(path, exact_max=sys.maxsize, **options)
+            results.setdefault('encode_seconds', {})[quantization] = time.perf_counter() - start
+            results.setdefault('scan_bytes_per_vector', {})[quantization] = flat.describe_index_stats()['scan_bytes_per_vector']
+            filters = FILTERS if quantization == 'none' else {'': None}
+            if quantization != 'none':
+                found, latency = run_queries(flat, queries, args.top_k)
+                rows.append((quantization, 'scan + rescore', None, recall(found, truth[''], args.top_k), latency))
+            ivf = LocalVectorIndex(path, exact_max=min(args.exact_max, stats['total_vector_count'] - 1), **options)
+            for nprobe in args.nprobe:
+                ivf.nprobe = nprobe
+                for name, query_filter in filters.items():
+                    found, latency = run_queries(ivf, queries, args.top_k, query_filter)
+                    rows.append((quantization if quantization != 'none' else 'float32', f"ivf{name}", nprobe, recall(found, truth[name], args.top_k), latency))
+            del flat, ivf
+        results['runs'] = [{'vectors': stored, 'search': search, 'nprobe': nprobe, f'recall@{args.top_k}': r, 'latency': latency}
+                           for stored, search, nprobe, r, latency in rows]
+    finally:
+        if not args.path:
+            shutil.rmtree(path, ignore_errors=True)
+
+    print(f"\n{stats['total_vector_count']} vectors x {args.dimension}, {stats['ivf_lists']} IVF lists, "
+          f"{results['disk_bytes'] / 2**30:.2f} GiB on disk")
+    if 'load_seconds' in results:
+        print(f"  load {results['load_seconds']:.1f}s, train {results['train_seconds']:.1f}s")
+    print(f"  reopen {results['open_seconds'] * 1000:.0f} ms")
+    print(f"\n  {'vectors':<8} {'scan MiB/M':>10} {'encode s':>9}")
+    for quantization, size in results['scan_bytes_per_vector'].items():
+        print(f"  {quantization if quantization != 'none' else 'float32':<8} {size * 1e6 / 2**20:>10.0f} {results['encode_seconds'][quantization]:>9.1f}")
+    print(f"\n  {'vectors':<8} {'search':<17} {'nprobe':>6} {f'recall@{args.top_k}':>10} {'QPS':>7} {'mean ms':>9} "
+          + " ".join(f"{f'p{p} ms':>9}" for p in PERCENTILES))
+    for stored, search, nprobe, r, latency in rows:
+        print(f"  {stored:<8} {search:<17} {nprobe or '':>6} {r:>10.3f} {1 / latency['mean']:>7.0f} {latency['mean'] * 1000:>9.2f} "
+              + " ".join(f"{latency[f'p{p}'] * 1000:>9.2f}" for p in PERCENTILES))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+In-process stand-ins for OpenAI, Pinecone, Cohere and MongoDB.
+
+Each backend call sleeps for a latency drawn from a LatencyModel and fails
+with its error rate, so benchmarks can exercise the real services (caching,
+batching, retries, fallbacks) offline. Embeddings are hashed bags of words,
+so a question that shares words with a chunk retrieves it.
+
+MongoDB is emulated with mongomock (pip install -r benchmarks/requirements.txt).
+"""
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from app.services.local_index import matches_filter
+
+EMBEDDING_DIMENSION = 1536
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class FakeBackendError(Exception):
+    pass
+
+
+class LatencyModel:
+    """Log-normal latency around a median, plus an independent failure rate.
+
+    sigma controls the tail: 0 is a fixed latency, 0.5 puts p99 at about 3.2x
+    the median. error is the message of the raised exception; services react
+    to its text (e.g. "insufficient_quota" takes the quota fallbacks).
+    """
+
+    def __init__(self, median: float = 0.0, sigma: float = 0.0, error_rate: float = 0.0,
+                 error: str = "503 Service Unavailable", seed: Optional[int] = None):
+        self.median = median
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.error = error
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.median * self._random.lognormvariate(0.0, self.sigma) if self.median > 0 else 0.0
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return delay, failed
+
+    def wait(self):
+        delay, failed = self._draw()
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise FakeBackendError(self.error)
+
+    async def await_(self):
+        delay, failed = self._draw()
+        if delay:
+            await asyncio.sleep(delay)
+        if failed:
+            raise FakeBackendError(self.error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'calls': self.calls, 'errors': self.errors}
+
+
+def embed_text(text: str, dimension: int = EMBEDDING_DIMENSION) -> List[float]:
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in WORD_RE.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        vector[int.from_bytes(digest[:4], 'little') % dimension] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    else:
+        vector[0] = 1.0
+    return vector.tolist()
+
+
+def _word_count(text: str) -> int:
+    return len(WORD_RE.findall(text.lower()))
+
+
+class _Embeddings:
+    def __init__(self, latency: LatencyModel, asynchronous: bool):
+        self.latency = latency
+        self.asynchronous = asynchronous
+
+    def create(self, input, model=None, dimensions=None, **kwargs):
+        if self.asynchronous:
+            return self._acreate(input, dimensions)
+        self.latency.wait()
+        return self._response(input, dimensions)
+
+    async def _acreate(self, input, dimensions):
+        await self.latency.await_()
+        return self._response(input, dimensions)
+
+    def _response(self, texts, dimensions=None):
+        texts = [texts] if isinstance(texts, str) else texts
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=embed_text(text, dimensions or EMBEDDING_DIMENSION)) for i, text in enumerate(texts)],
+            usage=SimpleNamespace(prompt_tokens=sum(_word_count(text) for text in texts))
+        )
+
+
+class _Completions:
+    def __init__(self, latency: LatencyModel, asynchronous: bool):
+        self.latency = latency
+        self.asynchronous = asynchronous
+
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        if self.asynchronous:
+            return self._acreate(messages, stream)
+        self.latency.wait()
+        return self._response(messages)
+
+    async def _acreate(self, messages, stream):
+        await self.latency.await_()
+        if stream:
+            return self._stream(messages)
+        return self._response(messages)
+
+    def _answer(self, messages):
+        prompt = " ".join(message['content'] for message in messages)
+        sources = sorted(set(re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE)), key=int)[:3]
+        answer = "According to the documents " + " ".join(f"[{n}]" for n in sources) + "."
+        usage = SimpleNamespace(prompt_tokens=_word_count(prompt), completion_tokens=_word_count(answer))
+        usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+        return answer, usage
+
+    def _response(self, messages):
+        answer, usage = self._answer(messages)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))], usage=usage)
+
+    async def _stream(self, messages):
+        answer, usage = self._answer(messages)
+        for word in answer.split(" "):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+
+class FakeOpenAI:
+    """Stands in for OpenAI (or AsyncOpenAI with asynchronous=True): embeddings and chat completions."""
+
+    def __init__(self, embed_latency: LatencyModel, chat_latency: LatencyModel, asynchronous: bool = False):
+        self.embeddings = _Embeddings(embed_latency, asynchronous)
+        self.chat = SimpleNamespace(completions=_Completions(chat_latency, asynchronous))
+
+
+class FakeIndex:
+    """Stands in for a Pinecone Index: exact cosine search over an in-memory matrix per namespace."""
+
+    def __init__(self, query_latency: LatencyModel, upsert_latency: LatencyModel, dimension: int = EMBEDDING_DIMENSION):
+        self.query_latency = query_latency
+        self.upsert_latency = upsert_latency
+        self.dimension = dimension
+        # namespace -> id -> (values, metadata); '' is the default namespace
+        self._vectors = defaultdict(dict)
+        # namespace -> (ids, matrix), rebuilt on the first query after a write
+        self._matrices = {}
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = '', **kwargs):
+        self.upsert_latency.wait()
+        with self._lock:
+            for vector in vectors:
+                self._vectors[namespace][vector['id']] = (np.asarray(vector['values'], dtype=np.float32), vector.get('metadata', {}))
+            self._matrices.pop(namespace, None)
+        return {'upserted_count': len(vectors)}
+
+    def delete(self, ids: List[str] = None, namespace: str = '', **kwargs):
+        self.upsert_latency.wait()
+        with self._lock:
+            for vector_id in ids or []:
+                self._vectors[namespace].pop(vector_id, None)
+            self._matrices.pop(namespace, None)
+
+    def update(self, id: str, set_metadata: Dict[str, Any] = None, namespace: str = '', **kwargs):
+        self.upsert_latency.wait()
+        with self._lock:
+            vectors = self._vectors[namespace]
+            if id in vectors and set_metadata:
+                values, metadata = vectors[id]
+                vectors[id] = (values, {**metadata, **set_metadata})
+
+    def fetch(self, ids: List[str], namespace: str = '', **kwargs):
+        self.query_latency.wait()
+        with self._lock:
+            vectors = self._vectors[namespace]
+            found = {vector_id: vectors[vector_id] for vector_id in ids if vector_id in vectors}
+        return {'vectors': {vector_id: {'id': vector_id, 'values': values.tolist(), 'metadata': metadata}
+                            for vector_id, (values, metadata) in found.items()}}
+
+    def query(self, vector: List[float], top_k: int = 10, include_metadata: bool = False, filter: Dict[str, Any] = None,
+              namespace: str = '', **kwargs):
+        self.query_latency.wait()
+        with self._lock:
+            vectors = self._vectors[namespace]
+            if namespace not in self._matrices:
+                ids = list(vectors)
+                matrix = np.stack([vectors[i][0] for i in ids]) if ids else np.zeros((0, self.dimension), dtype=np.float32)
+                self._matrices[namespace] = (ids, matrix)
+            ids, matrix = self._matrices[namespace]
+        query = np.asarray(vector, dtype=np.float32)
+        # Stored vectors are unit length (see embed_text); normalise the query only
+        scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+        if filter:
+            scores = np.where([matches_filter(vectors[i][1], filter) for i in ids], scores, -np.inf)
+        top = [i for i in np.argsort(-scores)[:top_k] if np.isfinite(scores[i])]
+        return {'matches': [
+            {'id': ids[i], 'score': float(scores[i]), 'metadata': vectors[ids[i]][1] if include_metadata else {}}
+            for i in top
+        ]}
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            namespaces = {namespace: {'vector_count': len(vectors)} for namespace, vectors in self._vectors.items() if vectors}
+        return {
+            'total_vector_count': sum(space['vector_count'] for space in namespaces.values()),
+            'dimension': self.dimension,
+            'namespaces': namespaces
+        }
+
+
+class FakeCohere:
+    """Stands in for cohere.Client (or AsyncClient with asynchronous=True); scores by word overlap."""
+
+    def __init__(self, latency: LatencyModel, asynchronous: bool = False):
+        self.latency = latency
+        self.asynchronous = asynchronous
+
+    def rerank(self, model=None, query: str = "", documents: List[str] = (), top_n: int = None, **kwargs):
+        if self.asynchronous:
+            return self._arerank(query, documents, top_n)
+        self.latency.wait()
+        return self._response(query, documents, top_n)
+
+    async def _arerank(self, query, documents, top_n):
+        await self.latency.await_()
+        return self._response(query, documents, top_n)
+
+    def _response(self, query, documents, top_n):
+        words = set(WORD_RE.findall(query.lower()))
+        scored = []
+        for i, document in enumerate(documents):
+            document_words = set(WORD_RE.findall(document.lower()))
+            scored.append((len(words & document_words) / (len(words) or 1), i))
+        scored.sort(reverse=True)
+        return SimpleNamespace(results=[
+            SimpleNamespace(index=i, relevance_score=score) for score, i in scored[:top_n or len(scored)]
+        ])
+
+
+MONGO_METHODS = ('find', 'find_one', 'insert_one', 'insert_many', 'update_one', 'update_many', 'delete_one',
+                 'delete_many', 'find_one_and_update', 'count_documents', 'bulk_write', 'aggregate')
+
+
+def fake_mongo_client(latency: LatencyModel):
+    """A mongomock client whose collection calls sleep (and fail) per latency."""
+    try:
+        import mongomock
+        import mongomock.gridfs
+        from mongomock.collection import Collection
+        from mongomock.database import Database
+    except ImportError:
+        raise SystemExit("The MongoDB stand-in needs mongomock: pip install -r benchmarks/requirements.txt")
+    # GridFS only accepts real pymongo types unless told otherwise
+    mongomock.gridfs.enable_gridfs_integration()
+
+    def slow(name):
+        original = getattr(Collection, name)
+
+        def call(self, *args, **kwargs):
+            latency.wait()
+            return original(self, *args, **kwargs)
+        return call
+
+    class OneByOne:
+        # Receives pymongo bulk operations and applies each with the plain (not slowed) single-document call
+        def __init__(self, collection):
+            self.collection = collection
+
+        def add_insert(self, document):
+            Collection.insert_one(self.collection, document)
+
+        def add_update(self, selector, update, multi, upsert, **kwargs):
+            (Collection.update_many if multi else Collection.update_one)(self.collection, selector, update, upsert=upsert)
+
+        def add_replace(self, selector, replacement, upsert, **kwargs):
+            Collection.replace_one(self.collection, selector, replacement, upsert=upsert)
+
+        def add_delete(self, selector, limit, **kwargs):
+            (Collection.delete_one if limit == 1 else Collection.delete_many)(self.collection, selector)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        # mongomock's bulk API rejects the arguments newer pymongo operations pass; one delay for the whole batch
+        latency.wait()
+        for request in requests:
+            request._add_to_bulk(OneByOne(self))
+
+    # Subclasses rather than proxies, so GridFS's isinstance checks still pass
+    methods = {name: slow(name) for name in MONGO_METHODS if name != 'bulk_write'}
+    slow_collection = type('SlowCollection', (Collection,), {**methods, 'bulk_write': bulk_write})
+
+    class SlowDatabase(Database):
+        def get_collection(self, *args, **kwargs):
+            collection = super().get_collection(*args, **kwargs)
+            collection.__class__ = slow_collection
+            return collection
+
+    class SlowClient(mongomock.MongoClient):
+        def get_database(self, *args, **kwargs):
+            database = super().get_database(*args, **kwargs)
+            database.__class__ = SlowDatabase
+            return database
+
+        def __getitem__(self, name):
+            return self.get_database(name)
+
+    return SlowClient()
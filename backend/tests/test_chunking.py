@@ -0,0 +1,96 @@
+import pytest
+
+from app.utils.text_processing import chunk_pages, chunk_text_with_offsets, count_tokens, iter_segments
+
+CHUNK_SIZE = 60
+OVERLAP = 15
+
+
+def paragraphs(count, sentences=6):
+    return "\n\n".join(
+        " ".join(f"Paragraph {p} sentence {s} talks about topic{p}x{s} in some detail." for s in range(sentences))
+        for p in range(count)
+    )
+
+
+def assert_valid_chunks(chunks, source, chunk_size=CHUNK_SIZE):
+    assert chunks
+    for chunk in chunks:
+        assert chunk['text'] == source[chunk['start']:chunk['end']]
+        assert chunk['text'] == chunk['text'].strip()
+        assert count_tokens(chunk['text']) <= chunk_size
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous['start'] < chunk['start']
+        assert previous['end'] < chunk['end']
+
+
+def test_chunks_are_exact_slices_within_the_token_budget():
+    text = paragraphs(8)
+    chunks = chunk_text_with_offsets(text, CHUNK_SIZE, OVERLAP)
+    assert_valid_chunks(chunks, text)
+    # Nothing is lost between chunks
+    covered = set()
+    for chunk in chunks:
+        covered.update(range(chunk['start'], chunk['end']))
+    assert all(i in covered for i, char in enumerate(text) if not char.isspace())
+
+
+def test_chunks_end_at_sentence_boundaries():
+    text = paragraphs(6)
+    for chunk in chunk_text_with_offsets(text, CHUNK_SIZE, OVERLAP):
+        assert chunk['text'].endswith('.')
+        assert chunk['text'].startswith('Paragraph')
+
+
+def test_overlap_is_whole_sentences_within_the_overlap_budget():
+    text = paragraphs(6)
+    chunks = chunk_text_with_offsets(text, CHUNK_SIZE, OVERLAP)
+    overlapping = 0
+    for previous, chunk in zip(chunks, chunks[1:]):
+        if chunk['start'] < previous['end']:
+            overlapping += 1
+            shared = text[chunk['start']:previous['end']]
+            assert count_tokens(shared) <= OVERLAP
+            assert shared.rstrip().endswith('.')
+    assert overlapping
+
+
+def test_text_without_whitespace_is_split_within_the_budget():
+    text = "x" * 5000 + " tail."
+    if count_tokens(text) <= CHUNK_SIZE:
+        pytest.skip("the tokenizer in use does not split runs of characters")
+    chunks = chunk_text_with_offsets(text, CHUNK_SIZE, 0)
+    assert len(chunks) > 1
+    assert_valid_chunks(chunks, text)
+    assert "".join(chunk['text'] for chunk in chunks).replace(" ", "") == text.replace(" ", "")
+
+
+def test_cjk_punctuation_ends_sentences():
+    text = "第一句话。第二句话！第三句话？最后一句"
+    segments = [segment['text'] for segment in iter_segments(text, CHUNK_SIZE)]
+    assert segments == ["第一句话。", "第二句话！", "第三句话？", "最后一句"]
+
+
+def test_page_chunks_keep_offsets_and_page_numbers():
+    pages = [(number, paragraphs(2, sentences=4).replace("Paragraph", f"Page{number}")) for number in range(1, 5)]
+    # Offsets refer to the pages joined with newlines
+    source = "".join(text + "\n" for _, text in pages)
+    starts = [sum(len(text) + 1 for _, text in pages[:i]) for i in range(len(pages))]
+
+    def page_at(offset):
+        return max(number for (number, _), start in zip(pages, starts) if start <= offset)
+
+    chunks = list(chunk_pages(iter(pages), CHUNK_SIZE, OVERLAP))
+    assert_valid_chunks(chunks, source)
+    for chunk in chunks:
+        assert chunk['page_start'] == page_at(chunk['start'])
+        assert chunk['page_end'] == page_at(chunk['end'] - 1)
+    assert {chunk['page_start'] for chunk in chunks} == {1, 2, 3, 4}
+
+
+def test_words_either_side_of_a_page_break_stay_apart():
+    pages = [(1, "The first page ends here"), (2, "the second page starts here.")]
+    chunks = list(chunk_pages(iter(pages), CHUNK_SIZE, OVERLAP))
+    assert len(chunks) == 1
+    assert chunks[0]['text'] == "The first page ends here\nthe second page starts here."
+    assert (chunks[0]['page_start'], chunks[0]['page_end']) == (1, 2)
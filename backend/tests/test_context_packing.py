@@ -0,0 +1,84 @@
+from app.utils.context_packing import PASSAGE_OVERHEAD_TOKENS, merge_passages, pack_context
+from app.utils.text_processing import chunk_text_with_offsets, count_tokens
+
+SOURCE = " ".join(f"Sentence {i} of the handbook covers rule {i} for the staff." for i in range(40))
+
+
+def chunk_docs(source=SOURCE, document_key='handbook.pdf', chunk_size=60, overlap=20):
+    return [
+        {
+            'id': f"{document_key}-{i}",
+            'text': chunk['text'],
+            'metadata': {'document_key': document_key, 'filename': document_key, 'chunk_index': i,
+                         'char_start': chunk['start'], 'char_end': chunk['end']}
+        }
+        for i, chunk in enumerate(chunk_text_with_offsets(source, chunk_size, overlap))
+    ]
+
+
+def test_overlapping_chunks_of_one_document_merge_into_their_combined_span():
+    docs = chunk_docs()
+    assert docs[1]['metadata']['char_start'] < docs[0]['metadata']['char_end']
+    passages = merge_passages([docs[1], docs[0]])
+    assert len(passages) == 1
+    merged = passages[0]
+    start, end = merged['metadata']['char_start'], merged['metadata']['char_end']
+    assert merged['text'] == SOURCE[start:end]
+    assert (start, end) == (docs[0]['metadata']['char_start'], docs[1]['metadata']['char_end'])
+    # Ranked as, and identified by, its best member
+    assert merged['id'] == docs[1]['id']
+    assert merged['metadata']['chunk_ids'] == [docs[1]['id'], docs[0]['id']]
+
+
+def test_consecutive_chunks_merge_and_distant_ones_do_not():
+    docs = chunk_docs(overlap=0)
+    passages = merge_passages([docs[0], docs[1], docs[4]])
+    assert [passage['metadata'].get('chunk_ids') for passage in passages] == [[docs[0]['id'], docs[1]['id']], None]
+    assert passages[1] is docs[4]
+
+
+def test_chunks_of_different_documents_are_not_merged():
+    first = chunk_docs(document_key='a.pdf')[:2]
+    second = chunk_docs(document_key='b.pdf')[:2]
+    passages = merge_passages([first[0], second[0], first[1], second[1]])
+    assert [passage['id'] for passage in passages] == [first[0]['id'], second[0]['id']]
+
+
+def test_a_shared_filename_with_different_text_is_not_merged():
+    docs = chunk_docs()[:1]
+    other = {**docs[0], 'id': 'other', 'text': "Completely different text " * 5}
+    passages = merge_passages([docs[0], other])
+    assert len(passages) == 2
+
+
+def test_identical_texts_without_a_source_are_sent_once():
+    docs = [{'id': 'a', 'text': "Same passage."}, {'id': 'b', 'text': "Same passage."}, {'id': 'c', 'text': "Other."}]
+    passages = merge_passages(docs)
+    assert [passage['text'] for passage in passages] == ["Same passage.", "Other."]
+    assert passages[0]['metadata']['chunk_ids'] == ['a', 'b']
+
+
+def test_packing_stops_at_the_budget_truncating_the_passage_that_crosses_it():
+    docs = [{'id': str(i), 'text': " ".join(f"passage{i}word{j}" for j in range(150))} for i in range(4)]
+    first_tokens = count_tokens(docs[0]['text'])
+    max_tokens = first_tokens + PASSAGE_OVERHEAD_TOKENS + PASSAGE_OVERHEAD_TOKENS + 120
+    packed = pack_context(docs, max_tokens, min_passage_tokens=100)
+    assert [doc['id'] for doc in packed] == ['0', '1']
+    assert 'truncated' not in packed[0]
+    assert packed[1]['truncated'] is True
+    assert count_tokens(packed[1]['text']) <= 120
+
+
+def test_a_passage_too_short_after_truncation_is_dropped():
+    docs = [{'id': str(i), 'text': " ".join(f"passage{i}word{j}" for j in range(150))} for i in range(2)]
+    max_tokens = count_tokens(docs[0]['text']) + 2 * PASSAGE_OVERHEAD_TOKENS + 50
+    packed = pack_context(docs, max_tokens, min_passage_tokens=100)
+    assert [doc['id'] for doc in packed] == ['0']
+
+
+def test_the_best_passage_is_always_sent_even_over_budget():
+    docs = [{'id': '0', 'text': " ".join(f"word{j}" for j in range(300))}]
+    packed = pack_context(docs, 50, min_passage_tokens=100)
+    assert len(packed) == 1
+    assert packed[0]['truncated'] is True
+    assert count_tokens(packed[0]['text']) <= 50 - PASSAGE_OVERHEAD_TOKENS
@@ -0,0 +1,78 @@
+import mongomock
+import pytest
+
+from app.services.lexical_index import LexicalIndex, tokenize
+
+
+@pytest.fixture
+def index():
+    return LexicalIndex(mongomock.MongoClient().minirag_test)
+
+
+def add(index, chunks, filename='doc.txt'):
+    index.add_chunks([chunk_id for chunk_id, _ in chunks], [text for _, text in chunks],
+                     [{'filename': filename, 'chunk_index': i} for i in range(len(chunks))])
+
+
+def stats(index):
+    return index.stats.find_one({'_id': LexicalIndex.STATS_ID}, {'_id': 0})
+
+
+def test_tokenize_lowercases_and_drops_stopwords():
+    assert tokenize("What is the Refund policy, and how does it work?") == ['refund', 'policy', 'work']
+
+
+def test_chunks_with_more_and_rarer_query_terms_rank_higher(index):
+    add(index, [
+        ('refunds', "Refunds are issued within 30 days. Refunds need a receipt."),
+        ('receipt', "Keep the receipt for your records."),
+        ('shipping', "Shipping takes five days."),
+        ('returns', "Returns and refunds are handled by support.")
+    ])
+    results = index.search("refunds receipt", limit=3)
+    assert results[0]['id'] == 'refunds'
+    assert {doc['id'] for doc in results} == {'refunds', 'receipt', 'returns'}
+    assert results[0]['score'] > results[1]['score'] >= results[2]['score'] > 0
+    assert results[0]['text'].startswith("Refunds are issued")
+    assert results[0]['metadata'] == {'filename': 'doc.txt', 'chunk_index': 0}
+
+
+def test_queries_without_indexed_terms_find_nothing(index):
+    add(index, [('a', "Refunds are issued within 30 days.")])
+    assert index.search("what is the", limit=5) == []
+    assert index.search("warranty", limit=5) == []
+
+
+def test_re_adding_a_chunk_replaces_it_instead_of_counting_it_twice(index):
+    add(index, [('a', "alpha beta gamma"), ('b', "beta delta")])
+    before = stats(index)
+    add(index, [('a', "alpha beta gamma")])
+    assert stats(index) == before == {'chunk_count': 2, 'total_length': 5}
+    assert index.postings.count_documents({'chunk_id': 'a'}) == 3
+
+
+def test_removed_chunks_leave_the_results_and_the_statistics(index):
+    add(index, [('a', "alpha beta gamma"), ('b', "beta delta")])
+    index.remove_chunks(['a', 'missing'])
+    assert [doc['id'] for doc in index.search("alpha beta", limit=5)] == ['b']
+    assert stats(index) == {'chunk_count': 1, 'total_length': 2}
+    assert index.postings.count_documents({'chunk_id': 'a'}) == 0
+
+
+def test_filters_keep_looking_past_better_scoring_chunks_they_exclude(index):
+    # Every a.txt chunk outscores every b.txt chunk, so b.txt's are past the first candidate batch
+    add(index, [(f"a{i}", "budget budget budget report") for i in range(20)], filename='a.txt')
+    add(index, [(f"b{i}", "budget report appendix notes and more words here") for i in range(3)], filename='b.txt')
+    results = index.search("budget", limit=2, filter={'filename': {'$eq': 'b.txt'}})
+    assert [doc['id'] for doc in results] == ['b0', 'b1']
+    assert {doc['metadata']['filename'] for doc in results} == {'b.txt'}
+
+
+def test_filters_support_in_and_boolean_operators(index):
+    add(index, [('a', "budget report")], filename='a.txt')
+    add(index, [('b', "budget report")], filename='b.txt')
+    add(index, [('c', "budget report")], filename='c.txt')
+    found = index.search("budget", limit=5, filter={'filename': {'$in': ['a.txt', 'c.txt']}})
+    assert sorted(doc['id'] for doc in found) == ['a', 'c']
+    found = index.search("budget", limit=5, filter={'$or': [{'filename': 'b.txt'}, {'filename': 'c.txt'}]})
+    assert sorted(doc['id'] for doc in found) == ['b', 'c']
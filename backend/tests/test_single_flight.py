@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from app.utils.single_flight import SingleFlight
+
+
+class Backend:
+    """Counts calls and holds each one until released."""
+
+    def __init__(self, result='value', error=None):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def fetch(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+
+async def settle():
+    # Let every started task reach its first await
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    async def scenario():
+        flight, backend = SingleFlight('test'), Backend()
+        callers = [asyncio.ensure_future(flight.do('key', backend.fetch)) for _ in range(5)]
+        await settle()
+        backend.release.set()
+        return await asyncio.gather(*callers), backend.calls, flight.in_flight()
+
+    results, calls, in_flight = asyncio.run(scenario())
+    assert calls == 1
+    assert [value for value, _ in results] == ['value'] * 5
+    assert sorted(joined for _, joined in results) == [False, True, True, True, True]
+    assert in_flight == 0
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flight, backend = SingleFlight('test'), Backend()
+        callers = [asyncio.ensure_future(flight.do(key, backend.fetch)) for key in ('a', 'b', 'a')]
+        await settle()
+        backend.release.set()
+        return await asyncio.gather(*callers), backend.calls
+
+    results, calls = asyncio.run(scenario())
+    assert calls == 2
+    assert [joined for _, joined in results] == [False, False, True]
+
+
+def test_an_error_reaches_every_caller_and_the_next_call_runs_afresh():
+    async def scenario():
+        flight, backend = SingleFlight('test'), Backend(error=RuntimeError("backend down"))
+        callers = [asyncio.ensure_future(flight.do('key', backend.fetch)) for _ in range(3)]
+        await settle()
+        backend.release.set()
+        outcomes = await asyncio.gather(*callers, return_exceptions=True)
+        backend.error = None
+        again = await flight.do('key', backend.fetch)
+        return outcomes, again, backend.calls
+
+    outcomes, again, calls = asyncio.run(scenario())
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert again == ('value', False)
+    assert calls == 2
+
+
+def test_cancelling_one_caller_leaves_the_shared_call_running():
+    async def scenario():
+        flight, backend = SingleFlight('test'), Backend()
+        leaving = asyncio.ensure_future(flight.do('key', backend.fetch))
+        staying = asyncio.ensure_future(flight.do('key', backend.fetch))
+        await settle()
+        leaving.cancel()
+        await settle()
+        backend.release.set()
+        return leaving, await staying, backend.calls
+
+    leaving, result, calls = asyncio.run(scenario())
+    assert leaving.cancelled()
+    assert result == ('value', True)
+    assert calls == 1
+
+
+def test_the_shared_call_is_cancelled_once_every_caller_has_gone():
+    async def scenario():
+        flight, backend = SingleFlight('test'), Backend()
+        callers = [asyncio.ensure_future(flight.do('key', backend.fetch)) for _ in range(2)]
+        await settle()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        return flight.in_flight()
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_a_caller_arriving_while_the_shared_call_is_being_cancelled_starts_afresh():
+    async def scenario():
+        flight = SingleFlight('test')
+        calls = []
+
+        async def slow_to_cancel():
+            calls.append(len(calls))
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                # Cleanup that takes a while, during which the key must not be joinable
+                await asyncio.shield(asyncio.sleep(0.01))
+                raise
+
+        async def quick():
+            calls.append(len(calls))
+            return 'fresh'
+
+        first = asyncio.ensure_future(flight.do('key', slow_to_cancel))
+        await settle()
+        first.cancel()
+        await settle()
+        result = await flight.do('key', quick)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return result, calls
+
+    result, calls = asyncio.run(scenario())
+    assert result == ('fresh', False)
+    assert calls == [0, 1]
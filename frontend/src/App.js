@@ -12,7 +12,7 @@ function App() {
   const [success, setSuccess] = useState('');
 
   const handleUploadSuccess = (result) => {
-    setSuccess(`Document "${result.filename}" uploaded successfully!`);
+    setSuccess(`Document "${result.filename}" processed successfully!`);
     setError('');
   };
 
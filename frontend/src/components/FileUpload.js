@@ -1,11 +1,20 @@
 import React, { useState } from 'react';
 import { Upload, FileText, Loader2 } from 'lucide-react';
-import { uploadDocument } from '../utils/api';
+import { uploadDocument, waitForJob } from '../utils/api';
+
+const describeJob = (job) => {
+  if (job.status === 'queued') {
+    return 'Queued...';
+  }
+  const { chunks_embedded: embedded, chunks_total: total } = job.progress || {};
+  return total ? `Processing... ${embedded}/${total} chunks` : 'Processing...';
+};
 
 const FileUpload = ({ onUploadSuccess, onError }) => {
   const [file, setFile] = useState(null);
   const [text, setText] = useState('');
   const [isUploading, setIsUploading] = useState(false);
+  const [jobStatus, setJobStatus] = useState('');
 
   const handleFileChange = (e) => {
     setFile(e.target.files[0]);
@@ -19,16 +28,23 @@ const FileUpload = ({ onUploadSuccess, onError }) => {
     }
 
     setIsUploading(true);
+    setJobStatus('Uploading...');
     try {
-      const result = await uploadDocument(file, text.trim() || null);
-      onUploadSuccess(result);
+      const accepted = await uploadDocument(file, text.trim() || null);
       setFile(null);
       setText('');
       e.target.reset();
+      const job = await waitForJob(accepted.job_id, (update) => setJobStatus(describeJob(update)));
+      if (job.status === 'completed') {
+        onUploadSuccess(job);
+      } else {
+        onError(job.error || 'Processing failed');
+      }
     } catch (error) {
       onError(error.response?.data?.detail || 'Upload failed');
     } finally {
       setIsUploading(false);
+      setJobStatus('');
     }
   };
 
@@ -95,7 +111,7 @@ const FileUpload = ({ onUploadSuccess, onError }) => {
           ) : (
             <FileText className="w-4 h-4 mr-2" />
           )}
-          {isUploading ? 'Uploading...' : 'Upload'}
+          {isUploading ? jobStatus : 'Upload'}
         </button>
       </form>
     </div>
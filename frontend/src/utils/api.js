@@ -26,6 +26,28 @@ export const uploadDocument = async (file, text) => {
   return response.data;
 };
 
+export const getJob = async (jobId) => {
+  const response = await api.get(`/jobs/${jobId}`);
+  return response.data;
+};
+
+const JOB_POLL_INTERVAL_MS = 1000;
+const FINISHED_JOB_STATUSES = ['completed', 'failed'];
+
+// Uploads are processed in the background; poll the job until it finishes
+export const waitForJob = async (jobId, onUpdate) => {
+  for (;;) {
+    const job = await getJob(jobId);
+    if (onUpdate) {
+      onUpdate(job);
+    }
+    if (FINISHED_JOB_STATUSES.includes(job.status)) {
+      return job;
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+};
+
 export const queryDocuments = async (query) => {
   const response = await api.post('/query', { query });
   return response.data;